@@ -0,0 +1,36 @@
+"""
+Async versions of the account endpoints that are pure MongoDB I/O.
+
+Registration, login and profile updates spend their time hashing passwords
+and validating input rather than waiting on the network, so they stay on
+the synchronous DRF views.
+"""
+from django.http import HttpResponse
+
+from notices import aio
+from notices.images import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, stream_image
+
+from .models import User
+
+
+async def profile_image_view(request, user_id):
+    """Serve profile image for a user"""
+    try:
+        users = await aio.find_documents(
+            User, {'user_id': user_id}, aio.projection(User, ('username', 'profile_image')), limit=1,
+        )
+        if not users:
+            return HttpResponse('User not found', status=404)
+        user = users[0]
+        grid_out = await aio.open_image(user.profile_image.grid_id) if user.profile_image else None
+        if grid_out is None:
+            return HttpResponse('Profile image not found', status=404)
+        # See views.profile_image_view for the ?v= versioning
+        if request.GET.get('v') == str(grid_out._id):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+        return stream_image(request, grid_out, filename=f'{user.username}_profile.jpg',
+                            cache_control=cache_control, chunks=aio.aiter_chunks)
+    except Exception as e:
+        return HttpResponse(f'Error serving image: {str(e)}', status=500)
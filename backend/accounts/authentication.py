@@ -1,27 +1,177 @@
+import threading
+import time
+
+import bson
+from collections import OrderedDict
+from datetime import timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+from mongoengine import NotUniqueError
+from pymongo.errors import DuplicateKeyError
 from rest_framework.authentication import BaseAuthentication
 from rest_framework.exceptions import AuthenticationFailed
-from .models import User
+from .models import AuthToken, User
+
+
+class TokenCache:
+    """
+    In-process token -> User cache with LRU eviction and a TTL.
+
+    Entries are dropped explicitly when a token is replaced or revoked; the
+    TTL bounds how long another process can keep serving a revoked token.
+    Users are kept as encoded BSON and every get() builds a fresh User, so
+    a request that edits its user in place never leaks into other requests.
+    """
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, token):
+        with self.lock:
+            entry = self.entries.get(token)
+            if entry is None:
+                return None
+            _, raw, expires_at = entry
+            if expires_at < time.monotonic():
+                del self.entries[token]
+                return None
+            self.entries.move_to_end(token)
+        return User._from_son(bson.decode(raw))
+
+    def set(self, token, user, ttl=None):
+        """Cache for the configured TTL, or ttl seconds if that is sooner"""
+        if self.maxsize <= 0:
+            return
+        ttl = self.ttl if ttl is None else min(self.ttl, ttl)
+        raw = bson.encode(user.to_mongo())
+        with self.lock:
+            self.entries[token] = (user.user_id, raw, time.monotonic() + ttl)
+            self.entries.move_to_end(token)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+    def invalidate(self, token):
+        with self.lock:
+            self.entries.pop(token, None)
+
+    def invalidate_user(self, user_id):
+        with self.lock:
+            for token in [t for t, (owner, _, _) in self.entries.items() if owner == user_id]:
+                del self.entries[token]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+
+token_cache = TokenCache(settings.AUTH_TOKEN_CACHE_SIZE, settings.AUTH_TOKEN_CACHE_TTL)
+
+
+def get_bearer_token(request):
+    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
+    if not auth_header.startswith('Bearer '):
+        return None
+    return auth_header[7:] or None  # Remove 'Bearer ' prefix
+
+
+def seconds_left(expires_at):
+    if timezone.is_naive(expires_at):
+        expires_at = timezone.make_aware(expires_at, dt_timezone.utc)
+    return (expires_at - timezone.now()).total_seconds()
+
+
+def adopt_legacy_token(user, token):
+    """
+    Move a token from User.auth_token (one per user, no expiry) into
+    auth_tokens, so a sign-in from before AuthToken keeps working once
+    """
+    try:
+        AuthToken.new(user, key=token).save(force_insert=True)
+    except NotUniqueError:
+        pass  # A concurrent request got there first
+    User.objects(id=user.id, auth_token=token).update_one(set__auth_token='')
+
+
+def resolve_token(token):
+    """Return the User owning token, hitting MongoDB only on a cache miss"""
+    if not token:
+        return None
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    # The TTL monitor runs about once a minute, so check expiry here too
+    session = AuthToken.objects(key=token, expires_at__gt=timezone.now()).only('user', 'expires_at').as_pymongo().first()
+    if session is not None:
+        user = User.objects(id=session['user']).first()
+        ttl = seconds_left(session['expires_at'])
+    else:
+        user = User.objects(auth_token=token).first()
+        if user:
+            adopt_legacy_token(user, token)
+        ttl = None
+    if user:
+        token_cache.set(token, user, ttl)
+    return user
+
+
+async def aresolve_token(token):
+    """Async counterpart of resolve_token for the ASGI views"""
+    if not token:
+        return None
+    user = token_cache.get(token)
+    if user is not None:
+        return user
+    from notices.aio import get_async_collection
+    users = get_async_collection(User)
+    session = await get_async_collection(AuthToken).find_one(
+        {'_id': token, 'expires_at': {'$gt': timezone.now()}}, {'user': 1, 'expires_at': 1},
+    )
+    if session is not None:
+        doc = await users.find_one({'_id': session['user']})
+        ttl = seconds_left(session['expires_at'])
+    else:
+        doc = await users.find_one({'auth_token': token})
+        ttl = None
+    if doc is None:
+        return None
+    user = User._from_son(doc)
+    if session is None:
+        try:
+            await get_async_collection(AuthToken).insert_one(AuthToken.new(user, key=token).to_mongo())
+        except DuplicateKeyError:
+            pass
+        await users.update_one({'_id': user.id, 'auth_token': token}, {'$set': {'auth_token': ''}})
+    token_cache.set(token, user, ttl)
+    return user
+
+
+def get_request_user(request):
+    """MongoDB User authenticated by BearerTokenAuthentication, or None"""
+    user = getattr(request, 'user', None)
+    return user if isinstance(user, User) else None
 
 
 class BearerTokenAuthentication(BaseAuthentication):
     keyword = 'Bearer'
-    
+
     def authenticate(self, request):
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        if not auth_header.startswith('Bearer '):
+        token = get_bearer_token(request)
+        if token is None:
             return None
-            
-        token = auth_header[7:]  # Remove 'Bearer ' prefix
-        
+
         # Find user by stored token
         try:
-            user = User.objects(auth_token=token).first()
+            user = resolve_token(token)
             if user:
                 return (user, token)
         except Exception:
             pass
-            
+
         return None
-    
+
     def authenticate_header(self, request):
         return 'Bearer'
@@ -0,0 +1,86 @@
+from django.core.management.base import BaseCommand
+from mongoengine.connection import get_db
+from pymongo import UpdateOne
+
+from accounts.models import Profile, User
+
+# Where Profile documents lived before they were embedded in User
+LEGACY_COLLECTION = 'profile'
+
+
+class Command(BaseCommand):
+    help = 'Fold the old profile collection into the profile embedded in each user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of profiles read and written per bulk operation')
+        parser.add_argument('--drop', action='store_true',
+                            help='Drop the old collection once every profile is embedded')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report what would be embedded without writing it')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        legacy = get_db()[LEGACY_COLLECTION]
+        users = User._get_collection()
+
+        # Streamed in batches, so memory stays flat however many users exist
+        scanned = embedded = orphaned = 0
+        batch = {}
+        for doc in legacy.find({}).batch_size(batch_size):
+            scanned += 1
+            if doc.get('user') is None:
+                orphaned += 1
+                continue
+            batch[doc['user']] = {name: doc[name] for name in Profile._fields if name in doc}
+            if len(batch) >= batch_size:
+                done = self.embed(users, batch, dry_run)
+                embedded += done
+                orphaned += len(batch) - done
+                batch = {}
+        if batch:
+            done = self.embed(users, batch, dry_run)
+            embedded += done
+            orphaned += len(batch) - done
+
+        # Running servers may keep serving cached users without the old
+        # profile for up to AUTH_TOKEN_CACHE_TTL seconds
+        if options['drop'] and not dry_run:
+            legacy.drop()
+
+        verb = 'Would embed' if dry_run else 'Embedded'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {embedded} of {scanned} profile(s); {orphaned} had no matching user.'
+        ))
+
+    def embed(self, users, profiles, dry_run):
+        stored = users.find({'_id': {'$in': list(profiles)}}, {'profile': 1})
+        operations = [
+            UpdateOne({'_id': doc['_id']}, {'$set': {'profile': merge(profiles[doc['_id']], doc.get('profile'))}})
+            for doc in stored
+        ]
+        if operations and not dry_run:
+            users.bulk_write(operations, ordered=False)
+        return len(operations)
+
+
+def merge(legacy, embedded):
+    """
+    The old profile, overlaid with the fields the user has set on the
+    embedded one since the deploy (Profile.edited_fields), so a field they
+    cleared stays cleared. An embedded profile nobody edited only holds
+    defaults and is replaced outright. profile_complete is recomputed.
+    """
+    embedded = embedded or {}
+    edited = [name for name in embedded.get('edited_fields') or () if name in embedded]
+    merged = dict(legacy)
+    merged.update((name, embedded[name]) for name in edited)
+    if edited:
+        merged['edited_fields'] = edited
+        if embedded.get('updated_at'):
+            merged['updated_at'] = max(embedded['updated_at'], legacy.get('updated_at') or embedded['updated_at'])
+    profile = Profile._from_son(merged)
+    profile.calculate_completion_percentage()
+    merged['profile_complete'] = profile.profile_complete
+    return merged
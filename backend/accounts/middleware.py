@@ -1,37 +1,35 @@
 from django.utils.deprecation import MiddlewareMixin
-from rest_framework.authtoken.models import Token
-from .models import User
+from django.utils.functional import SimpleLazyObject
+from .authentication import get_bearer_token, resolve_token
+
+
+def get_current_user(request, token):
+    if not hasattr(request, '_cached_current_user'):
+        request._cached_current_user = resolve_token(token)
+    return request._cached_current_user
 
 
 class MongoDBAuthMiddleware(MiddlewareMixin):
     """
     Middleware to attach MongoDB user to request object
+
+    The user is resolved lazily, on first access to request.current_user,
+    through the same cached token lookup that
+    BearerTokenAuthentication uses, so requests that never look at it cost
+    nothing and the rest cost at most one point query.
     """
-    
+
     def process_request(self, request):
         # Get token from Authorization header
-        auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-        if auth_header.startswith('Bearer '):
-            token_key = auth_header[7:]  # Remove 'Bearer ' prefix
-            
-            try:
-                token = Token.objects.get(key=token_key)
-                # Get MongoDB user using the hashed user_id from token
-                import hashlib
-                # Reverse the hash lookup by finding user with matching hash
-                users = User.objects.all()
-                for user in users:
-                    user_hash = int(hashlib.md5(user.user_id.encode()).hexdigest()[:8], 16)
-                    if user_hash == token.user_id:
-                        request.current_user = user
-                        request.current_user_id = user.user_id
-                        break
-                else:
-                    request.current_user = None
-                    request.current_user_id = None
-            except Token.DoesNotExist:
-                request.current_user = None
-                request.current_user_id = None
-        else:
+        token = get_bearer_token(request)
+        if token is None:
             request.current_user = None
             request.current_user_id = None
+            return
+
+        def current_user_id():
+            user = get_current_user(request, token)
+            return user.user_id if user else None
+
+        request.current_user = SimpleLazyObject(lambda: get_current_user(request, token))
+        request.current_user_id = SimpleLazyObject(current_user_id)
@@ -1,9 +1,76 @@
-from mongoengine import Document, StringField, EmailField, DateTimeField, ImageField, IntField, ListField, ReferenceField
+from datetime import timedelta
+
+from mongoengine import (
+    Document, EmbeddedDocument, EmbeddedDocumentField, StringField, EmailField, DateTimeField, ImageField,
+    IntField, ListField, ReferenceField,
+)
+from django.conf import settings
 from django.contrib.auth.hashers import make_password, check_password
 from django.utils import timezone
+import secrets
 import uuid
 
 
+class Profile(EmbeddedDocument):
+    """Extended user profile information, embedded in User"""
+    bio = StringField(max_length=500, default='')
+    phone = StringField(max_length=20, default='')
+    location = StringField(max_length=100, default='')
+    website = StringField(max_length=200, default='')
+    github_username = StringField(max_length=100, default='')
+    linkedin_username = StringField(max_length=100, default='')
+    twitter_username = StringField(max_length=100, default='')
+    skills = ListField(StringField(max_length=50), default=[])
+    experience_years = IntField(default=0)
+    education = StringField(max_length=200, default='')
+    company = StringField(max_length=100, default='')
+    job_title = StringField(max_length=100, default='')
+    profile_complete = StringField(default='incomplete')  # incomplete, partial, complete
+    # Fields the user has set since profiles moved into User; embed_profiles
+    # keeps these over the old profile collection's values, cleared ones too
+    edited_fields = ListField(StringField(max_length=50), default=[])
+    created_at = DateTimeField(default=timezone.now)
+    updated_at = DateTimeField(default=timezone.now)
+
+    def __str__(self):
+        return f"{self._instance.username}'s Profile" if self._instance else 'Profile'
+
+    def mark_edited(self, names):
+        self.edited_fields = sorted(set(self.edited_fields) | set(names))
+
+    def calculate_completion_percentage(self):
+        """Calculate profile completion percentage"""
+        fields = [
+            self.bio, self.phone, self.location, self.website,
+            self.github_username, self.linkedin_username, self.twitter_username,
+            self.education, self.company, self.job_title
+        ]
+        
+        filled_fields = sum(1 for field in fields if field and field.strip())
+        total_fields = len(fields)
+        
+        # Add skills and experience to the calculation
+        if self.skills:
+            filled_fields += 1
+        total_fields += 1
+        
+        if self.experience_years > 0:
+            filled_fields += 1
+        total_fields += 1
+        
+        percentage = (filled_fields / total_fields) * 100
+        
+        # Update profile_complete status
+        if percentage >= 90:
+            self.profile_complete = 'complete'
+        elif percentage >= 50:
+            self.profile_complete = 'partial'
+        else:
+            self.profile_complete = 'incomplete'
+        
+        return percentage
+
+
 class User(Document):
     email = EmailField(required=True, unique=True)
     username = StringField(required=True, unique=True)
@@ -14,11 +81,27 @@ class User(Document):
     updated_at = DateTimeField(default=timezone.now)
     is_active = StringField(default='active')
     user_id = StringField(required=True, unique=True)  # Unique identifier
-    auth_token = StringField(default='')  # Store auth token
+    # Pre-AuthToken single token; moved to auth_tokens the first time it is
+    # used (see authentication.resolve_token)
+    auth_token = StringField(default='')
+    # Stored inside the user document so reading or updating it costs no
+    # extra round trip; older profiles live in the 'profile' collection
+    # until the embed_profiles command folds them in
+    profile = EmbeddedDocumentField(Profile, default=Profile)
+
+    # email, username and user_id are indexed through unique=True
+    meta = {
+        'indexes': ['auth_token'],
+    }
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username']
 
+    # Lets DRF permissions such as IsAuthenticated treat a resolved
+    # MongoDB user like a Django one
+    is_authenticated = True
+    is_anonymous = False
+
     def __str__(self):
         return self.email
 
@@ -46,71 +129,54 @@ class User(Document):
             **extra_fields
         )
         if password:
-            user.set_password(password)
+            # Hashed here rather than through set_password, which saves, so
+            # creating a user is a single insert
+            user.password = make_password(password)
         user.save()
-        
-        # Create a profile for the user
-        Profile.objects.create(user=user)
-        
         return user
 
     class Meta:
         collection = 'users'
 
 
-class Profile(Document):
-    """Extended user profile information"""
-    user = ReferenceField(User, required=True, unique=True)
-    bio = StringField(max_length=500, default='')
-    phone = StringField(max_length=20, default='')
-    location = StringField(max_length=100, default='')
-    website = StringField(max_length=200, default='')
-    github_username = StringField(max_length=100, default='')
-    linkedin_username = StringField(max_length=100, default='')
-    twitter_username = StringField(max_length=100, default='')
-    skills = ListField(StringField(max_length=50), default=[])
-    experience_years = IntField(default=0)
-    education = StringField(max_length=200, default='')
-    company = StringField(max_length=100, default='')
-    job_title = StringField(max_length=100, default='')
-    profile_complete = StringField(default='incomplete')  # incomplete, partial, complete
+class AuthToken(Document):
+    """
+    One signed-in device. The token itself is the _id, so validating it is
+    a primary key lookup, and MongoDB's TTL monitor deletes expired tokens.
+    """
+    key = StringField(primary_key=True)
+    user = ReferenceField(User, required=True)
+    user_agent = StringField(max_length=200, default='')
     created_at = DateTimeField(default=timezone.now)
-    updated_at = DateTimeField(default=timezone.now)
+    expires_at = DateTimeField(required=True)
+
+    meta = {
+        'collection': 'auth_tokens',
+        'indexes': [
+            {'fields': ['expires_at'], 'expireAfterSeconds': 0},
+            'user',
+        ],
+    }
 
     def __str__(self):
-        return f"{self.user.username}'s Profile"
+        return f'Token for {self.user.pk} (expires {self.expires_at})'
 
-    def calculate_completion_percentage(self):
-        """Calculate profile completion percentage"""
-        fields = [
-            self.bio, self.phone, self.location, self.website,
-            self.github_username, self.linkedin_username, self.twitter_username,
-            self.education, self.company, self.job_title
-        ]
-        
-        filled_fields = sum(1 for field in fields if field and field.strip())
-        total_fields = len(fields)
-        
-        # Add skills and experience to the calculation
-        if self.skills:
-            filled_fields += 1
-        total_fields += 1
-        
-        if self.experience_years > 0:
-            filled_fields += 1
-        total_fields += 1
-        
-        percentage = (filled_fields / total_fields) * 100
-        
-        # Update profile_complete status
-        if percentage >= 90:
-            self.profile_complete = 'complete'
-        elif percentage >= 50:
-            self.profile_complete = 'partial'
-        else:
-            self.profile_complete = 'incomplete'
-        
-        return percentage
+    @classmethod
+    def new(cls, user, request=None, key=None):
+        """Unsaved token for user, valid for AUTH_TOKEN_LIFETIME_DAYS"""
+        now = timezone.now()
+        return cls(
+            key=key or secrets.token_urlsafe(32),
+            user=user,
+            user_agent=(request.META.get('HTTP_USER_AGENT', '') if request else '')[:200],
+            created_at=now,
+            expires_at=now + timedelta(days=settings.AUTH_TOKEN_LIFETIME_DAYS),
+        )
 
-    class Meta:
-        collection = 'profiles'
+    @classmethod
+    def issue(cls, user, request=None):
+        """Insert a new token for user and return it"""
+        token = cls.new(user, request)
+        # A single insert: a key collision fails instead of taking over a session
+        token.save(force_insert=True)
+        return token
@@ -1,5 +1,7 @@
+from django.utils import timezone
 from rest_framework import serializers
-from .models import User, Profile
+from notices.images import delete_images
+from .models import User
 
 
 class ProfileSerializer(serializers.Serializer):
@@ -19,10 +21,12 @@ class ProfileSerializer(serializers.Serializer):
     def update(self, instance, validated_data):
         for field, value in validated_data.items():
             setattr(instance, field, value)
-        
-        # Calculate completion percentage and update status
+        instance.mark_edited(validated_data)
+
+        # Calculate completion percentage and update status; the profile is
+        # embedded, so saving the owning User stores it
         instance.calculate_completion_percentage()
-        instance.save()
+        instance.updated_at = timezone.now()
         return instance
 
 
@@ -36,12 +40,7 @@ class UserSerializer(serializers.Serializer):
     profile = ProfileSerializer(read_only=True)
 
     def to_representation(self, instance):
-        # Get or create profile for the user
-        try:
-            profile = Profile.objects(user=instance).first()
-        except:
-            profile = None
-
+        profile = instance.profile
         data = {
             'id': instance.user_id,  # Use user_id as the frontend id
             'user_id': instance.user_id,
@@ -56,8 +55,9 @@ class UserSerializer(serializers.Serializer):
     
     def get_image_url(self, instance):
         if instance.profile_image:
-            # Return relative URL to work with proxy
-            return f'/auth/profile/image/{instance.user_id}/'
+            # Return relative URL to work with proxy; the image id versions the
+            # URL so browsers can cache it until the picture changes
+            return f'/auth/profile/image/{instance.user_id}/?v={instance.profile_image.grid_id}'
         return None
 
 
@@ -115,6 +115,13 @@ class ProfileUpdateSerializer(serializers.Serializer):
     job_title = serializers.CharField(required=False, allow_blank=True, max_length=100)
 
     def update(self, instance, validated_data):
+        # The instance can be a cached copy holding an older profile_image, so
+        # look up the file that is really stored before replacing it
+        previous_image = None
+        if 'profile_image' in validated_data:
+            stored = User._get_collection().find_one({'_id': instance.pk}, {'profile_image': 1})
+            previous_image = stored.get('profile_image') if stored else None
+
         # Update user fields
         user_fields = ['nickname', 'profile_image']
         for field in user_fields:
@@ -128,20 +135,17 @@ class ProfileUpdateSerializer(serializers.Serializer):
             'experience_years', 'education', 'company', 'job_title'
         ]
         
-        try:
-            profile = Profile.objects(user=instance).first()
-            if not profile:
-                profile = Profile.objects.create(user=instance)
-            
+        profile = instance.profile
+        if any(field in validated_data for field in profile_fields):
             for field in profile_fields:
                 if field in validated_data:
                     setattr(profile, field, validated_data[field])
-            
+            profile.mark_edited(field for field in profile_fields if field in validated_data)
             profile.calculate_completion_percentage()
-            profile.save()
-        except Exception as e:
-            # If profile update fails, continue with user update
-            pass
-        
+            profile.updated_at = timezone.now()
+
+        # One update of the user document, profile included
         instance.save()
+        if previous_image and previous_image != instance.profile_image.grid_id:
+            delete_images([previous_image])
         return instance
@@ -0,0 +1,261 @@
+import asyncio
+import time
+from datetime import timedelta
+from io import StringIO
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.management import call_command
+from django.utils import timezone
+from mongoengine.connection import get_db
+from rest_framework.test import APIClient
+
+from lost_found.testing import MongoTestCase
+
+from .authentication import TokenCache, aresolve_token, resolve_token, token_cache
+from .management.commands.embed_profiles import LEGACY_COLLECTION, merge
+from .models import AuthToken, Profile, User
+
+try:
+    import mongomock_motor
+except ImportError:
+    mongomock_motor = None
+
+PASSWORD = 'correct-horse'
+
+
+def make_user(name='alice', **fields):
+    return User.create_user(email=f'{name}@example.com', username=name, password=PASSWORD, **fields)
+
+
+class TokenTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.client = APIClient()
+
+    def login(self, email='alice@example.com'):
+        response = self.client.post('/auth/login/', {'email': email, 'password': PASSWORD}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()['token']
+
+    def get_profile(self, token):
+        return self.client.get('/auth/profile/', HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    def test_register_issues_a_token(self):
+        response = self.client.post('/auth/register/', {
+            'username': 'alice', 'email': 'alice@example.com',
+            'password': PASSWORD, 'password_confirm': PASSWORD,
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        token = response.json()['token']
+
+        session = AuthToken.objects.get(key=token)
+        self.assertEqual(session.user.username, 'alice')
+        lifetime = session.expires_at - session.created_at
+        self.assertAlmostEqual(lifetime.total_seconds(), timedelta(days=settings.AUTH_TOKEN_LIFETIME_DAYS).total_seconds(), delta=1)
+        self.assertEqual(self.get_profile(token).json()['username'], 'alice')
+
+    def test_login_issues_one_token_per_device(self):
+        make_user()
+        first = self.login()
+        second = self.login()
+
+        self.assertNotEqual(first, second)
+        self.assertEqual(AuthToken.objects.count(), 2)
+        token_cache.clear()
+        self.assertEqual(self.get_profile(first).status_code, 200)
+        self.assertEqual(self.get_profile(second).status_code, 200)
+
+    def test_wrong_password_issues_no_token(self):
+        make_user()
+        response = self.client.post('/auth/login/', {'email': 'alice@example.com', 'password': 'nope'}, format='json')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(AuthToken.objects.count(), 0)
+
+    def test_unknown_token_is_rejected(self):
+        self.assertEqual(self.get_profile('no-such-token').status_code, 401)
+        self.assertIsNone(resolve_token('no-such-token'))
+
+    def test_expired_token_is_rejected(self):
+        user = make_user()
+        session = AuthToken.new(user)
+        session.expires_at = timezone.now() - timedelta(seconds=1)
+        session.save(force_insert=True)
+
+        # Still in the collection until the TTL monitor gets to it
+        self.assertIsNone(resolve_token(session.key))
+        self.assertEqual(self.get_profile(session.key).status_code, 401)
+
+    def test_logout_revokes_only_that_token(self):
+        make_user()
+        token = self.login()
+        other = self.login()
+
+        response = self.client.post('/auth/logout/', HTTP_AUTHORIZATION=f'Bearer {token}')
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(AuthToken.objects(key=token).count())
+        # Dropped from the cache too, not just from MongoDB
+        self.assertIsNone(token_cache.get(token))
+        self.assertEqual(self.get_profile(token).status_code, 401)
+        self.assertEqual(self.get_profile(other).status_code, 200)
+
+    def test_legacy_token_is_adopted(self):
+        user = make_user(auth_token='legacy-token')
+
+        self.assertEqual(resolve_token('legacy-token').pk, user.pk)
+        session = AuthToken.objects.get(key='legacy-token')
+        self.assertEqual(session.user.pk, user.pk)
+        self.assertGreater(session.expires_at, timezone.now().replace(tzinfo=None))
+        user.reload()
+        self.assertEqual(user.auth_token, '')
+
+        # Found through auth_tokens from now on
+        token_cache.clear()
+        self.assertEqual(resolve_token('legacy-token').pk, user.pk)
+        self.assertEqual(AuthToken.objects.count(), 1)
+
+    def test_entry_expires_with_its_token(self):
+        user = make_user()
+        session = AuthToken.new(user)
+        session.expires_at = timezone.now() + timedelta(seconds=5)
+        session.save(force_insert=True)
+
+        resolve_token(session.key)
+        _, _, expires_at = token_cache.entries[session.key]
+        self.assertLessEqual(expires_at - time.monotonic(), 5)
+
+
+class TokenCacheTests(MongoTestCase):
+    def test_ttl_is_capped_not_extended(self):
+        cache = TokenCache(maxsize=10, ttl=60)
+        user = make_user()
+        cache.set('short', user, ttl=1)
+        cache.set('long', user, ttl=3600)
+        self.assertLessEqual(cache.entries['short'][2] - time.monotonic(), 1)
+        self.assertLessEqual(cache.entries['long'][2] - time.monotonic(), 60)
+
+        with mock.patch('accounts.authentication.time.monotonic', return_value=time.monotonic() + 2):
+            self.assertIsNone(cache.get('short'))
+            self.assertEqual(cache.get('long').pk, user.pk)
+
+    def test_every_get_returns_a_separate_user(self):
+        cache = TokenCache(maxsize=10, ttl=60)
+        cache.set('token', make_user(nickname='Al'))
+
+        first = cache.get('token')
+        first.nickname = 'changed'
+        self.assertEqual(cache.get('token').nickname, 'Al')
+
+    def test_least_recently_used_entry_is_evicted(self):
+        cache = TokenCache(maxsize=2, ttl=60)
+        user = make_user()
+        cache.set('a', user)
+        cache.set('b', user)
+        cache.get('a')
+        cache.set('c', user)
+        self.assertIsNone(cache.get('b'))
+        self.assertIsNotNone(cache.get('a'))
+
+    def test_invalidate_user_drops_all_of_their_tokens(self):
+        cache = TokenCache(maxsize=10, ttl=60)
+        alice, bob = make_user(), make_user('bob')
+        cache.set('a1', alice)
+        cache.set('a2', alice)
+        cache.set('b1', bob)
+        cache.invalidate_user(alice.user_id)
+        self.assertEqual(list(cache.entries), ['b1'])
+
+    def test_size_zero_disables_the_cache(self):
+        cache = TokenCache(maxsize=0, ttl=60)
+        cache.set('token', make_user())
+        self.assertIsNone(cache.get('token'))
+
+    def test_resolved_user_is_cached_until_the_profile_changes(self):
+        user = make_user(nickname='Al')
+        first, second = AuthToken.issue(user).key, AuthToken.issue(user).key
+        self.assertEqual(resolve_token(first).nickname, 'Al')
+        self.assertEqual(resolve_token(second).nickname, 'Al')
+        User.objects(pk=user.pk).update_one(set__nickname='Behind the cache')
+        self.assertEqual(resolve_token(first).nickname, 'Al')
+
+        client = APIClient()
+        response = client.patch('/auth/profile/', {'nickname': 'Alice'}, format='json',
+                                HTTP_AUTHORIZATION=f'Bearer {first}')
+        self.assertEqual(response.status_code, 200, response.content)
+        # Every token of the user is dropped, not just the one that edited
+        self.assertNotIn(second, token_cache.entries)
+        self.assertEqual(resolve_token(second).nickname, 'Alice')
+
+
+@skipUnless(mongomock_motor, 'needs mongomock-motor')
+class AsyncResolveTests(MongoTestCase):
+    def test_async_resolve_matches_sync(self):
+        user = make_user(auth_token='legacy-token')
+        expired = AuthToken.new(user)
+        expired.expires_at = timezone.now() - timedelta(seconds=1)
+        expired.save(force_insert=True)
+        session = AuthToken.issue(user)
+
+        self.assertEqual(asyncio.run(aresolve_token(session.key)).pk, user.pk)
+        self.assertIsNone(asyncio.run(aresolve_token(expired.key)))
+        self.assertIsNone(asyncio.run(aresolve_token('no-such-token')))
+        self.assertEqual(asyncio.run(aresolve_token('legacy-token')).pk, user.pk)
+        # Adopted the same way resolve_token does it
+        self.assertTrue(AuthToken.objects(key='legacy-token').count())
+        user.reload()
+        self.assertEqual(user.auth_token, '')
+
+
+class EmbedProfilesTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.old = timezone.now().replace(tzinfo=None, microsecond=0) - timedelta(days=10)
+        self.legacy = {
+            'bio': 'Old bio', 'phone': '555', 'location': 'Seoul', 'website': 'https://a.example',
+            'company': 'Acme', 'job_title': 'Dev', 'profile_complete': 'partial',
+            'created_at': self.old, 'updated_at': self.old,
+        }
+
+    def test_never_edited_profile_is_replaced(self):
+        embedded = Profile().to_mongo().to_dict()
+        merged = merge(self.legacy, embedded)
+        self.assertEqual(merged, dict(self.legacy, profile_complete='partial'))
+
+    def test_edited_fields_win_even_when_cleared(self):
+        new = self.old + timedelta(days=5)
+        embedded = dict(Profile().to_mongo().to_dict(), bio='New bio', phone='', updated_at=new,
+                        edited_fields=['bio', 'phone'])
+
+        merged = merge(self.legacy, embedded)
+        self.assertEqual((merged['bio'], merged['phone'], merged['location']), ('New bio', '', 'Seoul'))
+        self.assertEqual(merged['edited_fields'], ['bio', 'phone'])
+        self.assertEqual((merged['created_at'], merged['updated_at']), (self.old, new))
+        # 5 of 12 filled: recomputed, not the stale embedded or legacy value
+        self.assertEqual(merged['profile_complete'], 'incomplete')
+
+    def test_command_embeds_legacy_profiles(self):
+        alice, bob = make_user(), make_user('bob')
+        legacy = get_db()[LEGACY_COLLECTION]
+        legacy.insert_many([
+            {'user': alice.pk, 'bio': 'Hello', 'company': 'Acme'},
+            {'user': bob.pk, 'bio': 'Hi', 'company': 'Initech'},
+            {'user': None, 'bio': 'Orphan'},
+        ])
+        # Bob cleared his company after the deploy
+        client = APIClient()
+        response = client.patch('/auth/profile/', {'company': ''}, format='json',
+                                HTTP_AUTHORIZATION=f'Bearer {AuthToken.issue(bob).key}')
+        self.assertEqual(response.status_code, 200, response.content)
+
+        out = StringIO()
+        call_command('embed_profiles', '--batch-size', '1', '--dry-run', stdout=out)
+        self.assertIn('Would embed 2 of 3', out.getvalue())
+        alice.reload()
+        self.assertEqual(alice.profile.bio, '')
+
+        call_command('embed_profiles', '--drop', stdout=out)
+        alice.reload()
+        bob.reload()
+        self.assertEqual((alice.profile.bio, alice.profile.company), ('Hello', 'Acme'))
+        self.assertEqual((bob.profile.bio, bob.profile.company), ('Hi', ''))
+        self.assertNotIn(LEGACY_COLLECTION, get_db().list_collection_names())
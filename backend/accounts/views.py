@@ -10,8 +10,11 @@ from django.core.files.base import ContentFile
 import base64
 
 from .serializers import RegisterSerializer, LoginSerializer, UserSerializer, ProfileUpdateSerializer, ProfileSerializer
-from .models import User, Profile
+from .models import AuthToken, User
 from .auth_backends import MongoDBAuthBackend
+from .authentication import get_request_user, token_cache
+from notices.cache import bump_version
+from notices.images import IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL, open_image, stream_image
 
 
 @api_view(['POST'])
@@ -21,14 +24,11 @@ def register_view(request):
     serializer = RegisterSerializer(data=request.data)
     if serializer.is_valid():
         user = serializer.save()
-        # Generate a simple token and store it in the user document
-        import secrets
-        token_key = secrets.token_urlsafe(32)
-        user.auth_token = token_key
-        user.save()
-        
+        token = AuthToken.issue(user, request)
+        token_cache.set(token.key, user)
+
         return Response({
-            'token': token_key,
+            'token': token.key,
             'user': UserSerializer(user, context={'request': request}).data,
         }, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -49,14 +49,12 @@ def login_view(request):
                 {'non_field_errors': ['Invalid email or password.']},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        # Generate a simple token and store it in the user document
-        import secrets
-        token_key = secrets.token_urlsafe(32)
-        user.auth_token = token_key
-        user.save()
-        
+        # One token per device: signing in here leaves other sessions alone
+        token = AuthToken.issue(user, request)
+        token_cache.set(token.key, user)
+
         return Response({
-            'token': token_key,
+            'token': token.key,
             'user': UserSerializer(user, context={'request': request}).data,
         })
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -66,20 +64,20 @@ def login_view(request):
 @permission_classes([AllowAny])  # Temporarily allow any for testing
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def profile_view(request):
-    # For testing, get the user with the token from Authorization header
-    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-    if auth_header.startswith('Bearer '):
-        token = auth_header[7:]
-        user = User.objects(auth_token=token).first()
-        if user:
-            if request.method == 'GET':
-                return Response(UserSerializer(user, context={'request': request}).data)
-            
-            serializer = ProfileUpdateSerializer(user, data=request.data, partial=True)
-            if serializer.is_valid():
-                updated_user = serializer.save()
-                return Response(UserSerializer(updated_user, context={'request': request}).data)
-            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    user = get_request_user(request)
+    if user:
+        if request.method == 'GET':
+            return Response(UserSerializer(user, context={'request': request}).data)
+        
+        serializer = ProfileUpdateSerializer(user, data=request.data, partial=True)
+        if serializer.is_valid():
+            updated_user = serializer.save()
+            # Other cached copies of this user now hold stale profile data
+            token_cache.invalidate_user(updated_user.user_id)
+            # Cached notice pages embed the owner's nickname and email
+            bump_version()
+            return Response(UserSerializer(updated_user, context={'request': request}).data)
+        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
     
     return Response({'error': 'Invalid or missing token'}, status=status.HTTP_401_UNAUTHORIZED)
 
@@ -88,30 +86,23 @@ def profile_view(request):
 @permission_classes([IsAuthenticated])
 def profile_detail_view(request):
     """Get detailed profile information including completion percentage"""
-    try:
-        profile = Profile.objects(user=request.user).first()
-        if not profile:
-            # Create profile if it doesn't exist
-            profile = Profile.objects.create(user=request.user)
-        
-        completion_percentage = profile.calculate_completion_percentage()
-        
-        return Response({
-            'profile': ProfileSerializer(profile).data,
-            'completion_percentage': completion_percentage,
-            'profile_complete': profile.profile_complete
-        })
-    except Exception as e:
-        return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+    profile = request.user.profile
+    completion_percentage = profile.calculate_completion_percentage()
+
+    return Response({
+        'profile': ProfileSerializer(profile).data,
+        'completion_percentage': completion_percentage,
+        'profile_complete': profile.profile_complete
+    })
 
 
 @api_view(['POST'])
 @permission_classes([IsAuthenticated])
 def logout_view(request):
-    try:
-        request.user.auth_token.delete()
-    except Exception:
-        pass
+    user = get_request_user(request)
+    if user:
+        token_cache.invalidate(request.auth)
+        AuthToken.objects(key=request.auth).delete()
     return Response({'detail': 'Logged out.'})
 
 
@@ -120,15 +111,19 @@ def logout_view(request):
 def profile_image_view(request, user_id):
     """Serve profile image for a user"""
     try:
-        user = User.objects.get(user_id=user_id)
-        if user.profile_image:
-            # Serve the image from MongoDB GridFS
-            response = HttpResponse(user.profile_image.read(), content_type='image/jpeg')
-            response['Content-Disposition'] = f'inline; filename="{user.username}_profile.jpg"'
-            return response
-        else:
+        user = User.objects.only('username', 'profile_image').get(user_id=user_id)
+        grid_out = open_image(user.profile_image.grid_id) if user.profile_image else None
+        if grid_out is None:
             # Return a default profile image or 404
             return HttpResponse('Profile image not found', status=404)
+        # The URL only names the user, so it may be cached forever only when it
+        # carries the current image id as its version (see UserSerializer)
+        if request.GET.get('v') == str(grid_out._id):
+            cache_control = IMMUTABLE_CACHE_CONTROL
+        else:
+            cache_control = REVALIDATE_CACHE_CONTROL
+        return stream_image(request, grid_out, filename=f'{user.username}_profile.jpg',
+                            cache_control=cache_control)
     except User.DoesNotExist:
         return HttpResponse('User not found', status=404)
     except Exception as e:
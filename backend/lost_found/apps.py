@@ -0,0 +1,16 @@
+from django.apps import AppConfig
+
+
+class LostFoundConfig(AppConfig):
+    name = 'lost_found'
+    verbose_name = 'Lost & Found'
+
+    def ready(self):
+        from django.conf import settings
+
+        from . import mongo
+        if settings.METRICS_ENABLED:
+            # Before connecting: listeners only apply to clients created later
+            from .metrics import register_listener
+            register_listener()
+        mongo.connect()
@@ -3,3 +3,7 @@ from django.core.asgi import get_asgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lost_found.settings')
 application = get_asgi_application()
+
+# Resume queued image jobs in the serving process (see notices.jobs.autostart)
+from notices.jobs import autostart  # noqa: E402
+autostart(server=True)
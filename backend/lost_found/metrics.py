@@ -0,0 +1,243 @@
+"""
+In-process metrics exposed at /metrics in the Prometheus text format.
+
+MetricsMiddleware times every request per URL route, and a pymongo
+CommandListener counts and times the MongoDB commands each route issues.
+Recording one observation is a dict update under a lock, so the overhead
+is a few microseconds per request. Values are per process: with several
+server workers, let Prometheus scrape each of them (or sum by instance).
+"""
+import contextvars
+import secrets
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.http import HttpResponse
+from pymongo import monitoring
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+MONGO_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 1.0)
+
+# Request being served in this context, so MongoDB commands can be
+# attributed to its route
+current_request = contextvars.ContextVar('metrics_request', default=None)
+
+registry = []
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, extra=''):
+    pairs = [f'{name}="{escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+
+def format_value(value):
+    return repr(float(value)) if isinstance(value, float) and not value.is_integer() else str(int(value))
+
+
+class Counter:
+    def __init__(self, name, help, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.values = defaultdict(float)
+        if not labels:
+            # Export the unlabeled series as 0 before the first increment
+            self.values[()] = 0
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] += amount
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        with self.lock:
+            values = list(self.values.items())
+        for label_values, value in values:
+            yield f'{self.name}{format_labels(self.labels, label_values)} {format_value(value)}'
+
+
+class Histogram:
+    def __init__(self, name, help, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = labels
+        self.buckets = buckets
+        # label values -> [per-bucket counts (last one is +Inf), sum]
+        self.series = {}
+        self.lock = threading.Lock()
+        registry.append(self)
+
+    def observe(self, value, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} histogram'
+        with self.lock:
+            series = [(label_values, list(counts), total) for label_values, (counts, total) in self.series.items()]
+        for label_values, counts, total in series:
+            cumulative = 0
+            for bound, count in zip(self.buckets + ('+Inf',), counts):
+                cumulative += count
+                labels = format_labels(self.labels, label_values, f'le="{bound}"')
+                yield f'{self.name}_bucket{labels} {cumulative}'
+            labels = format_labels(self.labels, label_values)
+            yield f'{self.name}_sum{labels} {format_value(total)}'
+            yield f'{self.name}_count{labels} {cumulative}'
+
+
+class CallbackCounter:
+    """Counter whose values are read from elsewhere at scrape time"""
+
+    def __init__(self, name, help, read):
+        self.name = name
+        self.help = help
+        self.read = read
+        registry.append(self)
+
+    def collect(self):
+        yield f'# HELP {self.name} {self.help}'
+        yield f'# TYPE {self.name} counter'
+        yield f'{self.name} {format_value(self.read())}'
+
+
+http_requests = Counter(
+    'http_requests_total', 'Requests served, by URL route, method and status code.',
+    ('route', 'method', 'status'),
+)
+http_request_duration = Histogram(
+    'http_request_duration_seconds', 'Time until the response was returned, by URL route and method.',
+    ('route', 'method'),
+)
+mongodb_commands = Counter(
+    'mongodb_commands_total', 'MongoDB commands issued, by URL route being served and command.',
+    ('route', 'command'),
+)
+mongodb_command_failures = Counter(
+    'mongodb_command_failures_total', 'MongoDB commands that failed, by command.', ('command',),
+)
+mongodb_command_duration = Histogram(
+    'mongodb_command_duration_seconds', 'MongoDB command round trip time, by command.',
+    ('command',), buckets=MONGO_BUCKETS,
+)
+gridfs_bytes_served = Counter(
+    'gridfs_bytes_served_total', 'Image bytes streamed from GridFS to clients.',
+)
+
+
+def notice_cache_stat(name):
+    def read():
+        from notices.cache import stats
+        return stats.snapshot()[name]
+    return read
+
+
+CallbackCounter('notice_cache_hits_total', 'Notice list/detail responses served from the cache.',
+                notice_cache_stat('hits'))
+CallbackCounter('notice_cache_misses_total', 'Notice list/detail responses built and cached.',
+                notice_cache_stat('misses'))
+
+
+def route_of(request):
+    """URL pattern of the request ('notices/<str:pk>/'), not the raw path"""
+    if request is None:
+        # Startup, management commands, background image jobs
+        return 'background'
+    match = getattr(request, 'resolver_match', None)
+    return match.route if match is not None else 'unmatched'
+
+
+class CommandListener(monitoring.CommandListener):
+    def started(self, event):
+        pass
+
+    def succeeded(self, event):
+        route = route_of(current_request.get())
+        mongodb_commands.inc(route, event.command_name)
+        mongodb_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+    def failed(self, event):
+        route = route_of(current_request.get())
+        mongodb_commands.inc(route, event.command_name)
+        mongodb_command_failures.inc(event.command_name)
+        mongodb_command_duration.observe(event.duration_micros / 1e6, event.command_name)
+
+
+def register_listener():
+    """Listen to every MongoDB client created from now on"""
+    monitoring.register(CommandListener())
+
+
+class MetricsMiddleware:
+    """Record latency and status per route; put first in MIDDLEWARE to time everything"""
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        token = current_request.set(request)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    async def __acall__(self, request):
+        token = current_request.set(request)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            current_request.reset(token)
+        self.record(request, response, time.perf_counter() - start)
+        return response
+
+    def record(self, request, response, elapsed):
+        route = route_of(request)
+        http_requests.inc(route, request.method, str(response.status_code))
+        http_request_duration.observe(elapsed, route, request.method)
+
+
+def render():
+    lines = []
+    for metric in registry:
+        lines.extend(metric.collect())
+    return '\n'.join(lines) + '\n'
+
+
+def metrics_view(request):
+    # Anonymous scrapes only in DEBUG; in production the token is mandatory
+    if settings.METRICS_TOKEN or not settings.DEBUG:
+        expected = f'Bearer {settings.METRICS_TOKEN}'
+        given = request.META.get('HTTP_AUTHORIZATION', '')
+        if not settings.METRICS_TOKEN or not secrets.compare_digest(given.encode(), expected.encode()):
+            return HttpResponse('Forbidden', status=403, content_type='text/plain')
+    return HttpResponse(render(), content_type=CONTENT_TYPE)
@@ -0,0 +1,105 @@
+"""
+MongoDB connection setup.
+
+settings.py only describes the connection. LostFoundConfig.ready()
+registers it with mongoengine, and the client is built on the first query
+(with connect=False, so even that doesn't block on the network). manage.py
+commands that never touch MongoDB, and the server itself, start without
+waiting on the cluster or resolving its DNS.
+"""
+from urllib.parse import urlsplit
+
+import mongoengine
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from pymongo import AsyncMongoClient, MongoClient
+
+DEFAULT_DATABASE = 'lost_found_db'
+
+
+def database_name(uri):
+    """Database named in the URI path, without resolving the host"""
+    return urlsplit(uri).path.lstrip('/') or DEFAULT_DATABASE
+
+
+def client_options():
+    """Pool, timeout and read preference options shared by the sync and async clients"""
+    options = {
+        'maxPoolSize': settings.MONGODB_MAX_POOL_SIZE,
+        'minPoolSize': settings.MONGODB_MIN_POOL_SIZE,
+        'maxIdleTimeMS': settings.MONGODB_MAX_IDLE_TIME_MS,
+        'connectTimeoutMS': settings.MONGODB_CONNECT_TIMEOUT_MS,
+        'serverSelectionTimeoutMS': settings.MONGODB_SERVER_SELECTION_TIMEOUT_MS,
+        'readPreference': settings.MONGODB_READ_PREFERENCE,
+    }
+    if settings.MONGODB_SOCKET_TIMEOUT_MS:
+        options['socketTimeoutMS'] = settings.MONGODB_SOCKET_TIMEOUT_MS
+    return options
+
+
+def get_client_class():
+    if not settings.MONGODB_MOCK:
+        return MongoClient
+    # In-memory database for local runs and tests, no server needed
+    try:
+        import mongomock
+    except ImportError:
+        raise ImproperlyConfigured('MONGODB_MOCK needs the mongomock package installed.')
+    return mongomock.MongoClient
+
+
+def create_client(host=None, port=None, read_preference=None, **kwargs):
+    """
+    mongo_client_class for mongoengine.
+
+    mongoengine parses URIs itself, which for mongodb+srv:// means a DNS
+    lookup at registration time; handing pymongo the URI here instead defers
+    it to the first query. mongoengine's host/port/read_preference defaults
+    are dropped in favour of the URI and client_options().
+    """
+    client_class = get_client_class()
+    if client_class is not MongoClient:
+        # No host: mongomock would otherwise resolve a mongodb+srv:// address
+        return client_class(**kwargs)
+    return client_class(settings.MONGODB_URI, connect=False, **kwargs, **client_options())
+
+
+def create_async_client():
+    """
+    Client for the asyncio views (notices/aio.py). In mock mode it is a
+    mongomock-motor client over the sync mongomock client, so both sides
+    see the same in-memory data.
+    """
+    if not settings.MONGODB_MOCK:
+        return AsyncMongoClient(settings.MONGODB_URI, **client_options())
+    try:
+        import mongomock_motor
+    except ImportError:
+        raise ImproperlyConfigured('MONGODB_MOCK with ASYNC_VIEWS needs the mongomock-motor package installed.')
+    return mongomock_motor.AsyncMongoMockClient(mock_mongo_client=mongoengine.get_connection())
+
+
+def check_mock_settings():
+    """Fail at startup on settings that mock mode cannot serve"""
+    if not settings.MONGODB_MOCK:
+        return
+    get_client_class()
+    if settings.ASYNC_VIEWS:
+        try:
+            import mongomock_motor  # noqa: F401
+        except ImportError:
+            raise ImproperlyConfigured('MONGODB_MOCK with ASYNC_VIEWS needs the mongomock-motor package installed.')
+    if settings.NOTICE_EVENTS_SOURCE == 'change_stream':
+        raise ImproperlyConfigured(
+            "mongomock has no change streams; use NOTICE_EVENTS_SOURCE='memory' with MONGODB_MOCK."
+        )
+
+
+def connect():
+    """Register the default mongoengine connection without opening it"""
+    check_mock_settings()
+    mongoengine.register_connection(
+        alias=mongoengine.DEFAULT_CONNECTION_NAME,
+        name=database_name(settings.MONGODB_URI),
+        mongo_client_class=create_client,
+    )
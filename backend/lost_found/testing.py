@@ -0,0 +1,64 @@
+"""
+Test helpers: every MongoTestCase runs on a fresh in-memory mongomock
+database, whatever MONGODB_URI and MONGODB_MOCK say, so the suite can
+never touch a real server.
+
+    python manage.py test
+"""
+import inspect
+
+import mongoengine
+from django.core.cache import caches
+from django.test import SimpleTestCase, override_settings
+
+try:
+    import mongomock
+    import mongomock.collection
+    import mongomock.gridfs
+except ImportError:  # pragma: no cover
+    mongomock = None
+
+TEST_DATABASE = 'lost_found_test'
+
+
+def patch_mongomock():
+    """Let mongomock take the sort= that pymongo >= 4.11 passes to bulk updates"""
+    builder = mongomock.collection.BulkOperationBuilder
+    if 'sort' in inspect.signature(builder.add_update).parameters:
+        return
+    add_update = builder.add_update
+
+    def add_update_without_sort(self, *args, sort=None, **kwargs):
+        return add_update(self, *args, **kwargs)
+
+    builder.add_update = add_update_without_sort
+
+
+class MongoTestCase(SimpleTestCase):
+    """SimpleTestCase on a mongomock database that is emptied before every test"""
+
+    @classmethod
+    def setUpClass(cls):
+        if mongomock is None:
+            raise ImportError('The tests need the mongomock package installed.')
+        patch_mongomock()
+        mongomock.gridfs.enable_gridfs_integration()
+        # The async views pick their client by MONGODB_MOCK too
+        cls.enterClassContext(override_settings(MONGODB_MOCK=True))
+        mongoengine.disconnect()
+        mongoengine.register_connection(
+            alias=mongoengine.DEFAULT_CONNECTION_NAME,
+            name=TEST_DATABASE,
+            mongo_client_class=mongomock.MongoClient,
+        )
+        super().setUpClass()
+
+    def setUp(self):
+        from accounts.authentication import token_cache
+        from notices.cache import get_cache
+
+        connection = mongoengine.get_connection()
+        connection.drop_database(TEST_DATABASE)
+        token_cache.clear()
+        get_cache().clear()
+        caches['default'].clear()
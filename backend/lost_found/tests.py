@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.test import Client, RequestFactory, SimpleTestCase, override_settings
+from django.urls import resolve
+
+from . import metrics
+from .mongo import check_mock_settings
+from .testing import MongoTestCase
+
+
+@override_settings(MONGODB_MOCK=True, ASYNC_VIEWS=True, NOTICE_EVENTS_SOURCE='memory')
+class MockSettingsTests(SimpleTestCase):
+    def test_mock_mode_serves_the_async_views(self):
+        check_mock_settings()
+
+    @override_settings(NOTICE_EVENTS_SOURCE='change_stream')
+    def test_change_streams_are_refused(self):
+        with self.assertRaises(ImproperlyConfigured):
+            check_mock_settings()
+
+    @override_settings(MONGODB_MOCK=False, NOTICE_EVENTS_SOURCE='change_stream')
+    def test_real_server_is_not_checked(self):
+        check_mock_settings()
+
+
+class MetricsTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+
+    def scrape(self, **headers):
+        return metrics.metrics_view(self.factory.get('/metrics', **headers))
+
+    def test_request_is_counted_by_route(self):
+        series = ('notices/<str:pk>/', 'GET', '404')
+        before = metrics.http_requests.values[series]
+        with override_settings(MIDDLEWARE=['lost_found.metrics.MetricsMiddleware', *settings.MIDDLEWARE]):
+            response = Client().get(f'/notices/{"0" * 24}/')
+        self.assertEqual(response.status_code, 404)
+
+        text = metrics.render()
+        self.assertIn(
+            f'http_requests_total{{route="notices/<str:pk>/",method="GET",status="404"}} {int(before) + 1}\n', text,
+        )
+        self.assertIn('http_request_duration_seconds_count{route="notices/<str:pk>/",method="GET"}', text)
+        self.assertIn('# TYPE notice_cache_misses_total counter\nnotice_cache_misses_total ', text)
+
+    def test_command_listener_counts_by_route(self):
+        listener = metrics.CommandListener()
+        request = self.factory.get('/notices/')
+        request.resolver_match = resolve('/notices/')
+        before = metrics.mongodb_commands.values[('notices/', 'find')]
+        failures = metrics.mongodb_command_failures.values[('aggregate',)]
+
+        token = metrics.current_request.set(request)
+        try:
+            listener.succeeded(SimpleNamespace(command_name='find', duration_micros=1500))
+            listener.failed(SimpleNamespace(command_name='aggregate', duration_micros=800))
+        finally:
+            metrics.current_request.reset(token)
+        listener.succeeded(SimpleNamespace(command_name='insert', duration_micros=100))
+
+        self.assertEqual(metrics.mongodb_commands.values[('notices/', 'find')], before + 1)
+        self.assertEqual(metrics.mongodb_command_failures.values[('aggregate',)], failures + 1)
+        text = metrics.render()
+        self.assertIn(f'mongodb_commands_total{{route="notices/",command="find"}} {int(before) + 1}\n', text)
+        self.assertIn('mongodb_commands_total{route="background",command="insert"}', text)
+        self.assertIn('mongodb_command_duration_seconds_bucket{command="find",le="0.0025"}', text)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='')
+    def test_production_without_a_token_is_closed(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer ').status_code, 403)
+
+    @override_settings(DEBUG=False, METRICS_TOKEN='s3cret')
+    def test_token_is_required(self):
+        self.assertEqual(self.scrape().status_code, 403)
+        self.assertEqual(self.scrape(HTTP_AUTHORIZATION='Bearer wrong').status_code, 403)
+        response = self.scrape(HTTP_AUTHORIZATION='Bearer s3cret')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], metrics.CONTENT_TYPE)
+
+    @override_settings(DEBUG=True, METRICS_TOKEN='')
+    def test_debug_allows_anonymous_scrapes(self):
+        self.assertEqual(self.scrape().status_code, 200)
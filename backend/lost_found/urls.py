@@ -9,5 +9,9 @@ urlpatterns = [
     path('notices/', include('notices.urls')),
 ]
 
+if settings.METRICS_ENABLED:
+    from .metrics import metrics_view
+    urlpatterns.append(path('metrics', metrics_view, name='metrics'))
+
 if settings.DEBUG:
     urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
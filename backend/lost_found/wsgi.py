@@ -3,3 +3,7 @@ from django.core.wsgi import get_wsgi_application
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'lost_found.settings')
 application = get_wsgi_application()
+
+# Resume queued image jobs in the serving process (see notices.jobs.autostart)
+from notices.jobs import autostart  # noqa: E402
+autostart(server=True)
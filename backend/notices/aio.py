@@ -0,0 +1,147 @@
+"""
+asyncio MongoDB access for the ASGI views.
+
+mongoengine only speaks the blocking driver, so the async views pass plain
+MongoDB filters, projections and sorts to pymongo's AsyncMongoClient and
+turn the raw documents back into Documents with _from_son. Nothing here
+blocks the event loop on a database round trip.
+"""
+import asyncio
+import weakref
+
+import gridfs
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.conf import settings
+from mongoengine.connection import get_db
+from mongoengine.queryset.visitor import Q
+
+from lost_found.metrics import gridfs_bytes_served
+from lost_found.mongo import create_async_client
+
+from . import images
+from .images import IMAGE_COLLECTION
+
+# One client per event loop: an AsyncMongoClient is bound to the loop it
+# first ran on (uvicorn runs one loop per worker process)
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = _clients[loop] = create_async_client()
+    return client
+
+
+def get_async_db():
+    # Same database the mongoengine connection uses
+    return get_async_client()[get_db().name]
+
+
+def get_async_collection(document):
+    return get_async_db()[document._get_collection_name()]
+
+
+def get_async_image_fs():
+    return gridfs.AsyncGridFS(get_async_db(), collection=IMAGE_COLLECTION)
+
+
+def projection(document, names):
+    """MongoDB projection loading only the named fields of document"""
+    return {document._fields[name].db_field: 1 for name in names}
+
+
+def to_filter(document, **filters):
+    """MongoDB filter for Document.objects(**filters) keyword filters"""
+    return Q(**filters).to_query(document)
+
+
+async def find_documents(document, filter, projection=None, sort=None, limit=None, raw=False):
+    """
+    Documents matching filter, or their raw dicts with raw=True.
+
+    sort is a pymongo sort list and is required whenever the order matters:
+    the collection's meta ordering is not applied here.
+    """
+    cursor = get_async_collection(document).find(filter, projection)
+    if sort:
+        cursor = cursor.sort(sort)
+    if limit is not None:
+        cursor = cursor.limit(limit)
+    docs = await cursor.to_list(None)
+    if raw:
+        return docs
+    return [document._from_son(doc) for doc in docs]
+
+
+async def get_document(document, pk, only=None):
+    """Fetch one Document by primary key, or None (also for malformed ids)"""
+    try:
+        object_id = ObjectId(pk)
+    except (InvalidId, TypeError):
+        return None
+    fields = projection(document, only) if only else None
+    doc = await get_async_collection(document).find_one({'_id': object_id}, fields)
+    return document._from_son(doc) if doc is not None else None
+
+
+async def resolve_users(user_ids):
+    """Async counterpart of serializers.resolve_users: one $in query"""
+    from accounts.models import User
+    user_ids = list({uid for uid in user_ids if uid})
+    if not user_ids:
+        return {}
+    users = await find_documents(
+        User, {'user_id': {'$in': user_ids}}, projection(User, ('user_id', 'nickname', 'email')),
+    )
+    return {user.user_id: user for user in users}
+
+
+async def open_image(grid_id):
+    """Async counterpart of images.open_image; returns an AsyncGridOut or None"""
+    if settings.MONGODB_MOCK:
+        # mongomock only backs the blocking GridFS; aiter_chunks reads it in a thread
+        return await sync_to_async(images.open_image)(grid_id)
+    try:
+        object_id = ObjectId(grid_id)
+    except (InvalidId, TypeError):
+        return None
+    try:
+        return await get_async_image_fs().get(object_id)
+    except gridfs.NoFile:
+        return None
+
+
+async def delete_images(grid_ids):
+    """Async counterpart of images.delete_images"""
+    grid_ids = [ObjectId(grid_id) for grid_id in grid_ids]
+    if not grid_ids:
+        return
+    db = get_async_db()
+    await db[f'{IMAGE_COLLECTION}.files'].delete_many({'_id': {'$in': grid_ids}})
+    await db[f'{IMAGE_COLLECTION}.chunks'].delete_many({'files_id': {'$in': grid_ids}})
+
+
+async def aiter_chunks(grid_out, start=0, length=None):
+    """Async counterpart of images.iter_chunks"""
+    if isinstance(grid_out, gridfs.GridOut):
+        # Mock mode (see open_image)
+        chunks = images.iter_chunks(grid_out, start, length)
+        while (chunk := await sync_to_async(next)(chunks, None)) is not None:
+            yield chunk
+        return
+    if start:
+        await grid_out.seek(start)
+    remaining = grid_out.length - start if length is None else length
+    while remaining > 0:
+        chunk = await grid_out.readchunk()
+        if not chunk:
+            break
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        gridfs_bytes_served.inc(amount=len(chunk))
+        yield chunk
@@ -0,0 +1,284 @@
+"""
+Async versions of the notice endpoints for the ASGI server.
+
+They return the same payloads as the DRF views in views.py but await every
+MongoDB round trip on the asyncio driver (notices/aio.py), so one worker
+keeps many requests in flight. urls.py routes to them when
+ASYNC_VIEWS is on. Creating a notice (multipart upload, image job
+spooling) stays on the synchronous view, run in a thread.
+"""
+import json
+from datetime import datetime
+
+from asgiref.sync import sync_to_async
+from bson import ObjectId
+from django.conf import settings
+from django.http import HttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from pymongo import ReturnDocument
+from rest_framework import status
+
+from accounts.authentication import aresolve_token, get_bearer_token
+from lost_found.renderers import json_response
+
+from . import aio, events, views
+from .cache import abump_version, acached_response
+from .fields import OWNER_FIELDS, RESPONDER_FIELDS, FieldsError, only_fields, parse_fields, wants
+from .filters import FilterError, parse_filters
+from .images import stream_image
+from .models import Notice, Response, image_file_ids
+from .pagination import NEWEST_FIRST, CursorPaginator, InvalidCursor, cursor_link, parse_limit
+from .search import asearch_notices, highlights_for, query_terms
+from .serializers import NoticeDetailSerializer, NoticeListSerializer, NoticeRowListSerializer, ResponseSerializer
+
+
+def method_not_allowed(request, allowed):
+    response = json_response({'detail': f'Method "{request.method}" not allowed.'},
+                             status=status.HTTP_405_METHOD_NOT_ALLOWED)
+    response['Allow'] = ', '.join(allowed)
+    return response
+
+
+async def get_user(request):
+    return await aresolve_token(get_bearer_token(request))
+
+
+def parse_body(request):
+    """JSON or form request body as a dict, mirroring the DRF parsers"""
+    if request.content_type == 'application/json':
+        try:
+            return json.loads(request.body or b'{}')
+        except ValueError as e:
+            raise ValueError(f'JSON parse error - {e}')
+    return request.POST.dict()
+
+
+async def notice_list_page(request, filter, fields=None):
+    paginator = CursorPaginator(request)
+    projection = aio.projection(Notice, only_fields(fields)) if fields is not None else None
+    try:
+        rows = await paginator.apaginate(Notice, filter, projection, raw=True)
+    except InvalidCursor as e:
+        return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    users = {}
+    if wants(fields, *OWNER_FIELDS):
+        users = await aio.resolve_users(row.get('owner_id') for row in rows)
+    context = {'request': request, 'users': users, 'fields': fields}
+    serializer = NoticeRowListSerializer(rows, context=context)
+    return json_response(paginator.get_response_data(serializer.data))
+
+
+async def filtered_notice_list(request, owner_id=None):
+    try:
+        filters = parse_filters(request.GET, owner_id=owner_id)
+        fields = parse_fields(request.GET, NoticeListSerializer)
+    except (FilterError, FieldsError) as e:
+        return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return await notice_list_page(request, aio.to_filter(Notice, **filters), fields)
+
+
+async def detail_data(request, notice, fields=None):
+    responses = []
+    if wants(fields, 'responses'):
+        responses = await aio.find_documents(
+            Response, {'notice': notice.pk}, sort=NEWEST_FIRST, limit=settings.NOTICE_DETAIL_RESPONSES,
+        )
+    user_ids = [r.responder_id for r in responses]
+    if wants(fields, *OWNER_FIELDS):
+        user_ids.append(notice.owner_id)
+    users = await aio.resolve_users(user_ids)
+    context = {'request': request, 'users': users, 'responses': responses, 'fields': fields}
+    return NoticeDetailSerializer(notice, context=context).data
+
+
+@csrf_exempt
+async def notice_list_create(request):
+    if request.method == 'GET':
+        return await acached_response(request, lambda: filtered_notice_list(request))
+    if request.method == 'POST':
+        return await sync_to_async(views.notice_list_create)(request)
+    return method_not_allowed(request, ['GET', 'POST'])
+
+
+async def notice_search(request):
+    if request.method != 'GET':
+        return method_not_allowed(request, ['GET'])
+    query = request.GET.get('q', '').strip()
+    if not query:
+        return json_response({'detail': 'Query parameter "q" is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        rows, next_cursor, prev_cursor = await asearch_notices(
+            query, parse_limit(request), request.GET.get('cursor'),
+        )
+    except InvalidCursor as e:
+        return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    scores = [row.pop('score') for row in rows]
+    users = await aio.resolve_users(row.get('owner_id') for row in rows)
+    results = NoticeRowListSerializer(rows, context={'request': request, 'users': users}).data
+    terms = query_terms(query)
+    for item, row, score in zip(results, rows, scores):
+        item['score'] = score
+        item['highlights'] = highlights_for(row, terms)
+
+    return json_response({
+        'next': cursor_link(request, next_cursor),
+        'prev': cursor_link(request, prev_cursor),
+        'results': results,
+    })
+
+
+async def notice_detail(request, pk):
+    if request.method != 'GET':
+        return method_not_allowed(request, ['GET'])
+
+    async def build():
+        try:
+            fields = parse_fields(request.GET, NoticeDetailSerializer)
+        except FieldsError as e:
+            return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        notice = await aio.get_document(Notice, pk, only_fields(fields) if fields is not None else None)
+        if notice is None:
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        return json_response(await detail_data(request, notice, fields))
+
+    return await acached_response(request, build)
+
+
+async def notice_responses(request, pk):
+    if request.method != 'GET':
+        return method_not_allowed(request, ['GET'])
+
+    async def build():
+        if await aio.get_document(Notice, pk, ['id']) is None:
+            return json_response({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        paginator = CursorPaginator(request)
+        try:
+            fields = parse_fields(request.GET, ResponseSerializer)
+            projection = aio.projection(Response, only_fields(fields)) if fields is not None else None
+            responses = await paginator.apaginate(Response, {'notice': ObjectId(pk)}, projection)
+        except (InvalidCursor, FieldsError) as e:
+            return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        users = {}
+        if wants(fields, *RESPONDER_FIELDS):
+            users = await aio.resolve_users(response.responder_id for response in responses)
+        context = {'request': request, 'users': users, 'fields': fields}
+        serializer = ResponseSerializer(responses, many=True, context=context)
+        return json_response(paginator.get_response_data(serializer.data))
+
+    return await acached_response(request, build)
+
+
+async def my_notices(request):
+    if request.method != 'GET':
+        return method_not_allowed(request, ['GET'])
+    user = await get_user(request)
+    if user is None:
+        return json_response({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
+    return await filtered_notice_list(request, owner_id=user.user_id)
+
+
+@csrf_exempt
+async def respond_to_notice(request, pk):
+    if request.method != 'POST':
+        return method_not_allowed(request, ['POST'])
+    user = await get_user(request)
+    if user is None:
+        return json_response({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    notice = await aio.get_document(Notice, pk)
+    if notice is None:
+        return json_response({'error': 'Notice not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    if notice.status != 'active':
+        return json_response({'error': 'This notice is no longer active.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        data = parse_body(request)
+    except ValueError as e:
+        return json_response({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = ResponseSerializer(data=data)
+    if not serializer.is_valid():
+        return json_response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+    response = Response(notice=notice, responder_id=user.user_id,
+                        message=serializer.validated_data['message'], created_at=datetime.now())
+    result = await aio.get_async_collection(Response).insert_one(response.to_mongo())
+    response.id = result.inserted_id
+    # Same bookkeeping as Response.save()
+    updated = await aio.get_async_collection(Notice).find_one_and_update(
+        {'_id': notice.pk}, {'$inc': {'responses_count': 1}},
+        projection={'responses_count': 1}, return_document=ReturnDocument.AFTER,
+    )
+    await abump_version()
+
+    data = ResponseSerializer(response, context={'users': {user.user_id: user}}).data
+    events.response_created(response, updated['responses_count'] if updated else None, data)
+    return json_response(data, status=status.HTTP_201_CREATED)
+
+
+async def get_owned_notice(request, pk, action):
+    """(notice, None) or (None, error response) for the owner-only actions"""
+    user = await get_user(request)
+    if user is None:
+        return None, json_response({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    notice = await aio.get_document(Notice, pk)
+    if notice is None:
+        return None, json_response({'error': 'Notice not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+    if notice.owner_id != user.user_id:
+        return None, json_response({'error': f'Only the owner can {action} this notice.'},
+                                   status=status.HTTP_403_FORBIDDEN)
+    return notice, None
+
+
+@csrf_exempt
+async def complete_notice(request, pk):
+    if request.method != 'POST':
+        return method_not_allowed(request, ['POST'])
+    notice, error = await get_owned_notice(request, pk, 'complete')
+    if error is not None:
+        return error
+
+    if notice.status == 'completed':
+        return json_response({'error': 'Notice is already completed.'}, status=status.HTTP_400_BAD_REQUEST)
+
+    notice.status = 'completed'
+    notice.updated_at = datetime.now()
+    await aio.get_async_collection(Notice).update_one(
+        {'_id': notice.pk}, {'$set': {'status': notice.status, 'updated_at': notice.updated_at}},
+    )
+    await abump_version()
+    events.notice_completed(notice)
+    return json_response(await detail_data(request, notice))
+
+
+@csrf_exempt
+async def delete_notice(request, pk):
+    if request.method != 'DELETE':
+        return method_not_allowed(request, ['DELETE'])
+    notice, error = await get_owned_notice(request, pk, 'delete')
+    if error is not None:
+        return error
+
+    # What Notice.delete() does: the document, then its responses and files
+    await aio.get_async_collection(Notice).delete_one({'_id': notice.pk})
+    await aio.get_async_collection(Response).delete_many({'notice': notice.pk})
+    await aio.delete_images(image_file_ids(notice.to_mongo()))
+    await abump_version()
+    events.notice_deleted(notice.pk)
+    return json_response({'message': 'Notice deleted successfully.'})
+
+
+async def serve_image(request, grid_id):
+    """Serve images stored in GridFS"""
+    try:
+        grid_out = await aio.open_image(grid_id)
+        if grid_out is None:
+            return HttpResponse('Image not found', status=404)
+        return stream_image(request, grid_out, chunks=aio.aiter_chunks)
+    except Exception as e:
+        return HttpResponse(f'Error serving image: {str(e)}', status=500)
@@ -0,0 +1,158 @@
+"""
+POST /notices/bulk/: complete, delete or fetch many notices at once.
+
+Each action costs a fixed number of queries whatever the number of ids: one
+$in read to classify the ids, then a single update_many / delete_many whose
+filter repeats the ownership check, so a notice that changed hands or state
+in between is never touched.
+"""
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .models import Notice
+
+BULK_ACTIONS = ('complete', 'delete', 'fetch')
+MAX_BULK_IDS = 100
+
+# Per-id outcomes
+OK = 'ok'
+COMPLETED = 'completed'
+DELETED = 'deleted'
+ALREADY_COMPLETED = 'already_completed'
+NOT_FOUND = 'not_found'
+FORBIDDEN = 'forbidden'
+INVALID_ID = 'invalid_id'
+
+
+class BulkError(ValueError):
+    pass
+
+
+def parse_bulk_request(data):
+    """Validate the request body; returns (action, ids) with duplicates dropped"""
+    if not isinstance(data, dict):
+        raise BulkError('The body must be an object with action and ids.')
+    action = data.get('action')
+    if action not in BULK_ACTIONS:
+        raise BulkError(f'action must be one of: {", ".join(BULK_ACTIONS)}.')
+    ids = data.get('ids')
+    if not isinstance(ids, list) or not ids:
+        raise BulkError('ids must be a non-empty list of notice ids.')
+    if len(ids) > MAX_BULK_IDS:
+        raise BulkError(f'At most {MAX_BULK_IDS} ids can be sent at once.')
+    return action, list(dict.fromkeys(str(pk) for pk in ids))
+
+
+def split_ids(ids):
+    """Map valid ids to ObjectIds; invalid ones get their result right away"""
+    object_ids = {}
+    results = {}
+    for pk in ids:
+        try:
+            object_ids[pk] = ObjectId(pk)
+        except (InvalidId, TypeError):
+            results[pk] = {'id': pk, 'status': INVALID_ID}
+    return object_ids, results
+
+
+def complete_notices(user, ids):
+    """Returns (results in request order, notices that were completed)"""
+    object_ids, results = split_ids(ids)
+    queryset = Notice.objects(id__in=list(object_ids.values())).only('id', 'owner_id', 'status')
+    notices = {str(notice.pk): notice for notice in queryset}
+
+    to_complete = []
+    for pk in object_ids:
+        notice = notices.get(pk)
+        if notice is None:
+            results[pk] = {'id': pk, 'status': NOT_FOUND}
+        elif notice.owner_id != user.user_id:
+            results[pk] = {'id': pk, 'status': FORBIDDEN}
+        elif notice.status == 'completed':
+            results[pk] = {'id': pk, 'status': ALREADY_COMPLETED}
+        else:
+            to_complete.append(notice)
+
+    completed = []
+    if to_complete:
+        # Unique to this call, unlike a timestamp, so a lost race can be told
+        # apart even from a concurrent call in the same millisecond
+        stamp = ObjectId()
+        pks = [notice.pk for notice in to_complete]
+        matched = Notice.objects(id__in=pks, owner_id=user.user_id, status='active').update(
+            set__status='completed', set__updated_at=datetime.now(), set__completed_by=stamp,
+        )
+        if matched == len(pks):
+            changed = set(pks)
+        else:
+            # Another request completed some of them first; find which are ours
+            changed = set(Notice.objects(id__in=pks, completed_by=stamp).scalar('id'))
+        for notice in to_complete:
+            pk = str(notice.pk)
+            if notice.pk in changed:
+                notice.status = 'completed'
+                completed.append(notice)
+                results[pk] = {'id': pk, 'status': COMPLETED}
+            else:
+                results[pk] = {'id': pk, 'status': ALREADY_COMPLETED}
+    return [results[pk] for pk in ids], completed
+
+
+def delete_notices(user, ids):
+    """Returns (results in request order, ids of the notices that are now gone)"""
+    object_ids, results = split_ids(ids)
+    queryset = Notice.objects(id__in=list(object_ids.values())).only('id', 'owner_id')
+    notices = {str(notice.pk): notice for notice in queryset}
+
+    to_delete = []
+    for pk in object_ids:
+        notice = notices.get(pk)
+        if notice is None:
+            results[pk] = {'id': pk, 'status': NOT_FOUND}
+        elif notice.owner_id != user.user_id:
+            results[pk] = {'id': pk, 'status': FORBIDDEN}
+        else:
+            to_delete.append(pk)
+
+    deleted = []
+    if to_delete:
+        pks = [object_ids[pk] for pk in to_delete]
+        # Also drops their responses and image files (NoticeQuerySet.delete)
+        count = Notice.objects(id__in=pks, owner_id=user.user_id).delete()
+        ours = True
+        if count == len(pks):
+            gone = set(pks)
+        else:
+            # Something changed since the read. Notices still there changed
+            # hands; of the missing ones only the count says how many were
+            # ours, so they are reported deleted only if it accounts for all
+            survivors = set(Notice.objects(id__in=pks).scalar('id'))
+            gone = set(pks) - survivors
+            ours = len(gone) == count
+        for pk in to_delete:
+            object_id = object_ids[pk]
+            if object_id in gone:
+                # Returned either way, so caches and listeners drop it
+                deleted.append(object_id)
+                results[pk] = {'id': pk, 'status': DELETED if ours else NOT_FOUND}
+            else:
+                results[pk] = {'id': pk, 'status': FORBIDDEN}
+    return [results[pk] for pk in ids], deleted
+
+
+def fetch_notices(ids):
+    """Returns (results in request order, raw notice documents found in that order)"""
+    object_ids, results = split_ids(ids)
+    queryset = Notice.objects(id__in=list(object_ids.values())).as_pymongo()
+    notices = {str(row['_id']): row for row in queryset}
+    found = []
+    for pk in object_ids:
+        notice = notices.get(pk)
+        if notice is None:
+            results[pk] = {'id': pk, 'status': NOT_FOUND}
+        else:
+            found.append(notice)
+            results[pk] = {'id': pk, 'status': OK}
+    return [results[pk] for pk in ids], found
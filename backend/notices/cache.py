@@ -0,0 +1,151 @@
+"""
+Versioned cache for the public notice list and detail responses.
+
+Every cached body is stored under the current value of a collection-wide
+version counter. Writes that change what those endpoints return bump the
+counter, so the next read misses and old entries simply age out of the
+backend instead of having to be found and deleted.
+"""
+import hashlib
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.response import Response as DRFResponse
+
+from lost_found.renderers import json_response
+
+from .images import accepts_webp
+
+VERSION_KEY = 'notices:version'
+
+
+class CacheStats:
+    """Hit/miss counters for this process"""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def record(self, hit):
+        with self.lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def snapshot(self):
+        with self.lock:
+            total = self.hits + self.misses
+            return {
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_ratio': self.hits / total if total else 0.0,
+            }
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.NOTICE_CACHE_ALIAS]
+
+
+def initial_version():
+    # Time based so a counter lost to eviction or a restart never comes back
+    # as a value that older entries were stored under
+    return int(time.time() * 1000)
+
+
+def get_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, initial_version(), timeout=None)
+        version = cache.get(VERSION_KEY)
+    return version
+
+
+async def aget_version():
+    cache = get_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, initial_version(), timeout=None)
+        version = await cache.aget(VERSION_KEY)
+    return version
+
+
+def bump_version():
+    """Invalidate every cached notice response"""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.set(VERSION_KEY, initial_version(), timeout=None)
+
+
+async def abump_version():
+    cache = get_cache()
+    try:
+        await cache.aincr(VERSION_KEY)
+    except ValueError:
+        await cache.aset(VERSION_KEY, initial_version(), timeout=None)
+
+
+def cache_key(request, version):
+    # Image URLs in the body depend on whether the client accepts WebP
+    variant = 'webp' if accepts_webp(request) else 'jpeg'
+    digest = hashlib.sha1(f'{request.get_full_path()}|{variant}'.encode()).hexdigest()
+    return f'notices:{version}:{digest}'
+
+
+def cached_response(request, build):
+    """
+    Return the cached body for this request or build() and cache it.
+
+    build() must return a DRF Response; only 200s are stored. The X-Cache
+    header tells HIT from MISS.
+    """
+    if not settings.NOTICE_CACHE_ENABLED:
+        return build()
+
+    cache = get_cache()
+    key = cache_key(request, get_version())
+    data = cache.get(key)
+    if data is not None:
+        stats.record(hit=True)
+        response = DRFResponse(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    stats.record(hit=False)
+    response = build()
+    if response.status_code == status.HTTP_200_OK:
+        cache.set(key, response.data, timeout=settings.NOTICE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
+
+
+async def acached_response(request, build):
+    """Async counterpart of cached_response; build() returns a json_response"""
+    if not settings.NOTICE_CACHE_ENABLED:
+        return await build()
+
+    cache = get_cache()
+    key = cache_key(request, await aget_version())
+    data = await cache.aget(key)
+    if data is not None:
+        stats.record(hit=True)
+        response = json_response(data)
+        response['X-Cache'] = 'HIT'
+        return response
+
+    stats.record(hit=False)
+    response = await build()
+    if response.status_code == status.HTTP_200_OK:
+        await cache.aset(key, response.data, timeout=settings.NOTICE_CACHE_TIMEOUT)
+    response['X-Cache'] = 'MISS'
+    return response
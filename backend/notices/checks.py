@@ -0,0 +1,50 @@
+"""Configuration checks for the notices app"""
+from django.conf import settings
+from django.core.checks import Tags, Warning, register
+from django.core.exceptions import ImproperlyConfigured
+
+# Backends whose entries live in one process only
+PROCESS_LOCAL_CACHES = (
+    'django.core.cache.backends.locmem.LocMemCache',
+)
+
+SHARED_CACHE_HINT = (
+    'Set CACHE_BACKEND to a shared backend (e.g. django.core.cache.backends.redis.RedisCache '
+    'with CACHE_LOCATION) or NOTICE_CACHE_ENABLED=False.'
+)
+
+
+def process_local_notice_cache():
+    """The notice cache backend if it is enabled and not shared between processes"""
+    if not settings.NOTICE_CACHE_ENABLED:
+        return None
+    backend = settings.CACHES.get(settings.NOTICE_CACHE_ALIAS, {}).get('BACKEND')
+    return backend if backend in PROCESS_LOCAL_CACHES else None
+
+
+def check_shared_cache():
+    """
+    Refuse a per-process notice cache when WEB_CONCURRENCY starts several
+    workers: the version counter has to be shared, or a write bumps only its
+    own worker's counter and the others keep serving stale notices until
+    NOTICE_CACHE_TIMEOUT.
+    """
+    backend = process_local_notice_cache()
+    if backend is not None and settings.WEB_CONCURRENCY > 1:
+        raise ImproperlyConfigured(
+            f'WEB_CONCURRENCY={settings.WEB_CONCURRENCY} but the notice cache uses {backend}, '
+            f'which every worker keeps separately. {SHARED_CACHE_HINT}'
+        )
+
+
+@register(Tags.caches, deploy=True)
+def check_notice_cache_deploy(app_configs, **kwargs):
+    """Workers started with --workers instead of WEB_CONCURRENCY can't be counted; warn on --deploy"""
+    backend = process_local_notice_cache()
+    if backend is None or settings.WEB_CONCURRENCY > 1:
+        return []
+    return [Warning(
+        f'The notice cache uses {backend}, which is only correct with a single worker process.',
+        hint=SHARED_CACHE_HINT,
+        id='notices.W001',
+    )]
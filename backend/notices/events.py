@@ -0,0 +1,250 @@
+"""
+Live notice updates pushed to browsers over Server-Sent Events.
+
+Writes publish small events (notice created/updated/completed/deleted,
+response created) to an in-process broker, and every open
+GET /notices/events/ stream receives them. With
+NOTICE_EVENTS_SOURCE='change_stream' the views publish nothing themselves;
+a relay thread tails MongoDB change streams instead, so events from every
+server process reach every client.
+"""
+import asyncio
+import itertools
+import logging
+import threading
+import uuid
+from collections import deque
+
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+NOTICE_CREATED = 'notice.created'
+NOTICE_UPDATED = 'notice.updated'
+NOTICE_COMPLETED = 'notice.completed'
+NOTICE_DELETED = 'notice.deleted'
+RESPONSE_CREATED = 'response.created'
+
+
+class Event:
+    __slots__ = ('id', 'type', 'notice_id', 'data')
+
+    def __init__(self, id, type, notice_id, data):
+        self.id = id
+        self.type = type
+        self.notice_id = notice_id
+        self.data = data
+
+
+class Subscription:
+    """One open stream: an asyncio queue fed from any thread"""
+
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize=maxsize)
+        self.overflowed = False
+
+    def deliver(self, event):
+        # Runs on the subscriber's event loop
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            # The client fell too far behind; its stream is closed and the
+            # browser reconnects, replaying from the buffer or refetching
+            self.overflowed = True
+
+
+class EventBroker:
+    """
+    In-process pub/sub with a replay buffer.
+
+    Event ids carry a per-process prefix, so a Last-Event-ID issued by
+    another process (or before a restart) is recognised as unknown and the
+    client is told to refetch rather than silently missing events.
+    """
+
+    def __init__(self, buffer_size, queue_size):
+        self.prefix = uuid.uuid4().hex[:8]
+        self.counter = itertools.count(1)
+        self.buffer = deque(maxlen=buffer_size)
+        self.queue_size = queue_size
+        self.subscriptions = set()
+        self.lock = threading.Lock()
+
+    def publish(self, type, notice_id, data):
+        with self.lock:
+            event = Event(f'{self.prefix}-{next(self.counter)}', type, str(notice_id), data)
+            self.buffer.append(event)
+            subscriptions = list(self.subscriptions)
+        for subscription in subscriptions:
+            try:
+                subscription.loop.call_soon_threadsafe(subscription.deliver, event)
+            except RuntimeError:
+                # Loop already closed; the stream is going away
+                self.unsubscribe(subscription)
+        return event
+
+    def subscribe(self, last_event_id=None):
+        """
+        Register the calling event loop for new events.
+
+        Returns (subscription, backlog) where backlog is the buffered events
+        after last_event_id, or None when that id can't be resumed from.
+        """
+        subscription = Subscription(asyncio.get_running_loop(), self.queue_size)
+        with self.lock:
+            self.subscriptions.add(subscription)
+            backlog = []
+            if last_event_id:
+                ids = [event.id for event in self.buffer]
+                if last_event_id in ids:
+                    backlog = list(self.buffer)[ids.index(last_event_id) + 1:]
+                else:
+                    backlog = None
+        return subscription, backlog
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            self.subscriptions.discard(subscription)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_broker():
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = EventBroker(settings.NOTICE_EVENTS_BUFFER, settings.NOTICE_EVENTS_QUEUE_SIZE)
+        return _broker
+
+
+def publish(type, notice_id, data):
+    """Publish from a view; a no-op when change streams are the source"""
+    if settings.NOTICE_EVENTS_SOURCE != 'memory':
+        return
+    try:
+        get_broker().publish(type, notice_id, data)
+    except Exception:
+        # Live updates are best effort and must never fail a write
+        logger.exception('Failed to publish %s event', type)
+
+
+def notice_payload(notice):
+    from .serializers import NoticeListSerializer
+    return {'notice': NoticeListSerializer(notice).data}
+
+
+def response_payload(response, responses_count, data=None):
+    if data is None:
+        from .serializers import ResponseSerializer
+        data = ResponseSerializer(response).data
+    return {
+        'notice_id': str(response.to_mongo()['notice']),
+        'responses_count': responses_count,
+        'response': data,
+    }
+
+
+def notice_created(notice):
+    publish(NOTICE_CREATED, notice.pk, notice_payload(notice))
+
+
+def notice_updated(notice):
+    publish(NOTICE_UPDATED, notice.pk, notice_payload(notice))
+
+
+def notice_completed(notice):
+    publish(NOTICE_COMPLETED, notice.pk, {'id': str(notice.pk), 'status': notice.status})
+
+
+def notice_deleted(notice_id):
+    publish(NOTICE_DELETED, notice_id, {'id': str(notice_id)})
+
+
+def response_created(response, responses_count, data=None):
+    publish(RESPONSE_CREATED, response.to_mongo()['notice'], response_payload(response, responses_count, data))
+
+
+class ChangeStreamRelay:
+    """
+    Turn MongoDB change stream events on notices and responses into broker
+    events. Needs a replica set (any Atlas cluster is one).
+    """
+
+    def __init__(self, broker):
+        self.broker = broker
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        from .models import Notice, Response
+        for document, handler in ((Notice, self.on_notice_change), (Response, self.on_response_change)):
+            thread = threading.Thread(
+                target=self.watch, args=(document, handler),
+                name=f'change-stream-{document._get_collection_name()}', daemon=True,
+            )
+            thread.start()
+            self.threads.append(thread)
+
+    def watch(self, document, handler):
+        resume_token = None
+        while not self.stopping.is_set():
+            try:
+                with document._get_collection().watch(
+                    full_document='updateLookup', resume_after=resume_token,
+                ) as stream:
+                    for change in stream:
+                        resume_token = stream.resume_token
+                        handler(change)
+            except Exception:
+                logger.exception('Change stream on %s failed; retrying', document._get_collection_name())
+                self.stopping.wait(5)
+
+    def on_notice_change(self, change):
+        from .models import Notice
+        operation = change['operationType']
+        notice_id = change['documentKey']['_id']
+        if operation == 'delete':
+            self.broker.publish(NOTICE_DELETED, notice_id, {'id': str(notice_id)})
+            return
+        doc = change.get('fullDocument')
+        if doc is None:
+            return
+        notice = Notice._from_son(doc)
+        if operation == 'insert':
+            self.broker.publish(NOTICE_CREATED, notice_id, notice_payload(notice))
+        elif operation in ('update', 'replace'):
+            updated = (change.get('updateDescription') or {}).get('updatedFields', {})
+            if updated.get('status') == 'completed':
+                self.broker.publish(NOTICE_COMPLETED, notice_id, {'id': str(notice_id), 'status': 'completed'})
+            elif 'image_status' in updated or operation == 'replace':
+                self.broker.publish(NOTICE_UPDATED, notice_id, notice_payload(notice))
+
+    def on_response_change(self, change):
+        from .models import Notice, Response
+        if change['operationType'] != 'insert':
+            return
+        response = Response._from_son(change['fullDocument'])
+        notice_id = response.to_mongo()['notice']
+        notice = Notice.objects(pk=notice_id).only('responses_count').first()
+        count = notice.responses_count if notice else None
+        self.broker.publish(RESPONSE_CREATED, notice_id, response_payload(response, count))
+
+
+_relay = None
+_relay_lock = threading.Lock()
+
+
+def ensure_relay():
+    """Start the change stream relay once per process when it is the source"""
+    global _relay
+    if settings.NOTICE_EVENTS_SOURCE != 'change_stream':
+        return
+    with _relay_lock:
+        if _relay is None:
+            _relay = ChangeStreamRelay(get_broker())
+            _relay.start()
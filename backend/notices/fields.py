@@ -0,0 +1,76 @@
+"""
+?fields= sparse fieldsets for the notice list, detail and responses endpoints.
+
+The parameter trims the serializer output and, through FIELD_SOURCES, the
+MongoDB projection as well, so a page of cards that only shows a few fields
+never reads description or contact off the server.
+"""
+from functools import lru_cache
+
+# Serializer field -> Notice (or Response) fields it is computed from. Fields
+# not listed here read the model field of the same name.
+FIELD_SOURCES = {
+    'owner_nickname': ('owner_id',),
+    'owner_email': ('owner_id',),
+    'image': ('image', 'image_variants'),
+    'image_url': ('image',),
+    'thumbnail_url': ('image', 'image_variants'),
+    'image_status': ('image', 'image_status'),
+    'responses': (),
+    'responder_nickname': ('responder_id',),
+    'responder_email': ('responder_id',),
+}
+# Loaded whatever was asked for: list cursors are built from them
+ALWAYS_LOADED = ('id', 'created_at')
+OWNER_FIELDS = ('owner_nickname', 'owner_email')
+RESPONDER_FIELDS = ('responder_nickname', 'responder_email')
+
+
+class FieldsError(ValueError):
+    pass
+
+
+@lru_cache(maxsize=None)
+def readable_fields(serializer_class):
+    return tuple(name for name, field in serializer_class().fields.items() if not field.write_only)
+
+
+def parse_fields(params, serializer_class):
+    """
+    Output fields requested with ?fields=a,b,c, or None for all of them.
+
+    Unknown names raise FieldsError rather than being ignored, so a typo
+    does not silently return less than the client expects.
+    """
+    value = params.get('fields')
+    if not value:
+        return None
+    requested = {name.strip() for name in value.split(',') if name.strip()}
+    available = readable_fields(serializer_class)
+    unknown = requested - set(available)
+    if unknown:
+        raise FieldsError(
+            f'Unknown field(s): {", ".join(sorted(unknown))}. '
+            f'Available fields: {", ".join(available)}.'
+        )
+    return frozenset(requested)
+
+
+def wants(fields, *names):
+    """Whether any of names is part of the output"""
+    return fields is None or any(name in fields for name in names)
+
+
+def only_fields(fields):
+    """Model fields to load for the requested output fields"""
+    loaded = set(ALWAYS_LOADED)
+    for name in fields:
+        loaded.update(FIELD_SOURCES.get(name, (name,)))
+    return sorted(loaded)
+
+
+def project(queryset, fields):
+    """Apply the projection matching fields to a Notice or Response queryset"""
+    if fields is None:
+        return queryset
+    return queryset.only(*only_fields(fields))
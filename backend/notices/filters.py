@@ -0,0 +1,70 @@
+from datetime import date
+
+from .models import Notice, NOTICE_FILTER_INDEXES
+
+# Query parameter -> Notice field for the equality filters
+EQUALITY_PARAMS = {
+    'type': 'type',
+    'status': 'status',
+    'venue': 'venue',
+    'owner': 'owner_id',
+}
+
+SUPPORTED_COMBINATIONS = {frozenset(fields) for fields in NOTICE_FILTER_INDEXES}
+
+
+class FilterError(ValueError):
+    pass
+
+
+def parse_date(params, name):
+    value = params.get(name)
+    if not value:
+        return None
+    try:
+        return date.fromisoformat(value)
+    except ValueError:
+        raise FilterError(f'{name} must be a date in YYYY-MM-DD format.')
+
+
+def parse_filters(params, owner_id=None):
+    """
+    Translate list query parameters into Notice.objects() keyword filters.
+
+    Only combinations of equality filters that one of the NOTICE_FILTER_INDEXES
+    serves are accepted, so every filtered page stays an index range scan;
+    anything else raises FilterError. owner_id pins the owner (My notices).
+    """
+    filters = {}
+    for param, field in EQUALITY_PARAMS.items():
+        value = params.get(param)
+        if value:
+            filters[field] = value
+    if owner_id is not None:
+        filters['owner_id'] = owner_id
+
+    if 'type' in filters and filters['type'] not in dict(Notice.TYPE_CHOICES):
+        raise FilterError('type must be one of: lost, found.')
+    if 'status' in filters and filters['status'] not in dict(Notice.STATUS_CHOICES):
+        raise FilterError('status must be one of: active, completed.')
+
+    if frozenset(filters) not in SUPPORTED_COMBINATIONS:
+        supported = [
+            ' + '.join(param for param, field in EQUALITY_PARAMS.items() if field in fields)
+            for fields in NOTICE_FILTER_INDEXES if fields
+        ]
+        requested = ' + '.join(param for param, field in EQUALITY_PARAMS.items() if field in filters)
+        raise FilterError(
+            f'Filtering on {requested} together is not supported. '
+            f'Supported combinations: {", ".join(supported)} (each optionally with date_from/date_to).'
+        )
+
+    date_from = parse_date(params, 'date_from')
+    date_to = parse_date(params, 'date_to')
+    if date_from and date_to and date_from > date_to:
+        raise FilterError('date_from must not be after date_to.')
+    if date_from:
+        filters['date__gte'] = date_from
+    if date_to:
+        filters['date__lte'] = date_to
+    return filters
@@ -0,0 +1,251 @@
+import calendar
+import io
+import mimetypes
+import re
+
+import gridfs
+from bson import ObjectId
+from bson.errors import InvalidId
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, parse_http_date_safe
+from mongoengine.connection import get_db
+from PIL import Image, ImageOps, features
+
+from lost_found.metrics import gridfs_bytes_served
+
+# Default GridFS bucket used by mongoengine's ImageField
+IMAGE_COLLECTION = 'images'
+# Uploads waiting for an image job (notices/jobs.py); kept apart from the
+# images bucket so the orphan sweeper never sees them
+UPLOAD_COLLECTION = 'image_uploads'
+
+# GridFS files are never modified in place, so a URL that embeds the file id
+# can be cached for as long as browsers and proxies allow
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'public, no-cache'
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+# Derived sizes stored next to every uploaded notice image, as the bounding
+# box each one is shrunk to fit (aspect ratio kept, never enlarged)
+IMAGE_VARIANTS = {
+    'thumbnail': (320, 320),
+    'detail': (1024, 1024),
+}
+JPEG_QUALITY = 82
+WEBP_QUALITY = 80
+WEBP_SUFFIX = '_webp'
+
+
+def get_image_fs():
+    return gridfs.GridFS(get_db(), collection=IMAGE_COLLECTION)
+
+
+def get_upload_fs():
+    return gridfs.GridFS(get_db(), collection=UPLOAD_COLLECTION)
+
+
+def open_image(grid_id):
+    """Look up a GridFS file by id; returns a GridOut or None"""
+    try:
+        object_id = ObjectId(grid_id)
+    except (InvalidId, TypeError):
+        return None
+    try:
+        return get_image_fs().get(object_id)
+    except gridfs.NoFile:
+        return None
+
+
+def delete_images(grid_ids):
+    """Delete many GridFS files with one delete_many on files and one on chunks"""
+    grid_ids = [ObjectId(grid_id) for grid_id in grid_ids]
+    if not grid_ids:
+        return
+    db = get_db()
+    db[f'{IMAGE_COLLECTION}.files'].delete_many({'_id': {'$in': grid_ids}})
+    db[f'{IMAGE_COLLECTION}.chunks'].delete_many({'files_id': {'$in': grid_ids}})
+
+
+def render_variants(image_file):
+    """
+    Shrink an uploaded image into every size in IMAGE_VARIANTS.
+
+    Yields (name, data, content_type, width, height) for a JPEG of each size
+    plus a WebP copy named '<size>_webp' when Pillow was built with WebP.
+    """
+    image_file.seek(0)
+    with Image.open(image_file) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ('RGBA', 'LA') or 'transparency' in original.info
+        for name, size in IMAGE_VARIANTS.items():
+            variant = original.copy()
+            variant.thumbnail(size, Image.LANCZOS)
+
+            buffer = io.BytesIO()
+            variant.convert('RGB').save(buffer, 'JPEG', quality=JPEG_QUALITY, optimize=True, progressive=True)
+            yield name, buffer.getvalue(), 'image/jpeg', variant.width, variant.height
+
+            if features.check('webp'):
+                buffer = io.BytesIO()
+                variant.convert('RGBA' if has_alpha else 'RGB').save(buffer, 'WEBP', quality=WEBP_QUALITY, method=4)
+                yield name + WEBP_SUFFIX, buffer.getvalue(), 'image/webp', variant.width, variant.height
+
+
+def store_variants(image_file):
+    """Write every derived variant of an upload to GridFS; returns {name: grid_id}"""
+    fs = get_image_fs()
+    variants = {}
+    for name, data, content_type, width, height in render_variants(image_file):
+        variants[name] = fs.put(data, content_type=content_type, variant=name, width=width, height=height)
+    return variants
+
+
+def accepts_webp(request):
+    return request is not None and 'image/webp' in request.META.get('HTTP_ACCEPT', '')
+
+
+def variant_url(notice, name, request=None):
+    """
+    URL of a stored variant, preferring WebP when the client accepts it.
+
+    Falls back to the original upload for notices created before variants
+    existed, and to None when the notice has no image.
+    """
+    image_id = notice.image.grid_id if notice.image and hasattr(notice.image, 'grid_id') else None
+    return image_url(notice.image_variants, image_id, name, request)
+
+
+def image_url(variants, image_id, name, request=None):
+    """variant_url() from the raw image_variants and image values of a notice"""
+    variants = variants or {}
+    grid_id = None
+    if accepts_webp(request):
+        grid_id = variants.get(name + WEBP_SUFFIX)
+    grid_id = grid_id or variants.get(name) or image_id
+    if grid_id is None:
+        return None
+    # Return relative URL to work with proxy
+    return f'/notices/image/{grid_id}/'
+
+
+def iter_chunks(grid_out, start=0, length=None):
+    """Yield bytes [start, start + length) one GridFS chunk at a time"""
+    if start:
+        grid_out.seek(start)
+    remaining = grid_out.length - start if length is None else length
+    while remaining > 0:
+        chunk = grid_out.readchunk()
+        if not chunk:
+            break
+        if len(chunk) > remaining:
+            chunk = chunk[:remaining]
+        remaining -= len(chunk)
+        gridfs_bytes_served.inc(amount=len(chunk))
+        yield chunk
+
+
+def get_content_type(grid_out, default='image/jpeg'):
+    # Read the raw file document field; GridOut.content_type is deprecated
+    content_type = getattr(grid_out, 'contentType', None)
+    if content_type:
+        return content_type
+    # ImageField records the Pillow format even when no content type was given
+    image_format = getattr(grid_out, 'format', None)
+    if image_format:
+        return f'image/{image_format.lower()}'
+    return default
+
+
+def get_etag(grid_out):
+    # The file id never changes for a given content, so it is a valid strong ETag
+    return f'"{grid_out._id}"'
+
+
+def parse_range(header, size):
+    """
+    Parse a single "bytes=" range against a file of the given size.
+
+    Returns (start, end) inclusive, None when the header should be ignored
+    (missing, malformed or multi-range) and False when it is unsatisfiable.
+    """
+    match = RANGE_RE.match(header.strip()) if header else None
+    if not match:
+        return None
+    first, last = match.groups()
+    if not first and not last:
+        return None
+    if not first:
+        # Suffix range: the last N bytes
+        suffix = int(last)
+        if suffix == 0:
+            return False
+        return max(size - suffix, 0), size - 1
+    start = int(first)
+    end = int(last) if last else size - 1
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+
+def if_range_passes(request, etag, last_modified):
+    if_range = request.META.get('HTTP_IF_RANGE')
+    if not if_range:
+        return True
+    if if_range.startswith('"'):
+        return if_range == etag
+    return parse_http_date_safe(if_range) == last_modified
+
+
+def stream_image(request, grid_out, filename=None, cache_control=IMMUTABLE_CACHE_CONTROL,
+                 default_content_type='image/jpeg', chunks=iter_chunks):
+    """
+    Stream a GridFS file to the client without loading it into memory.
+
+    Answers conditional requests (If-None-Match / If-Modified-Since) with 304
+    and single byte-range requests with 206, reading only the chunks needed.
+    chunks(grid_out, start, length) produces the body; the async views pass
+    aio.aiter_chunks for an AsyncGridOut.
+    """
+    content_type = get_content_type(grid_out, default_content_type)
+    if filename is None:
+        extension = mimetypes.guess_extension(content_type) or '.jpg'
+        filename = f'image_{grid_out._id}{extension}'
+    etag = get_etag(grid_out)
+    last_modified = calendar.timegm(grid_out.upload_date.utctimetuple())
+
+    headers = HttpResponse()
+    headers['ETag'] = etag
+    headers['Last-Modified'] = http_date(last_modified)
+    headers['Cache-Control'] = cache_control
+    conditional = get_conditional_response(request, etag=etag, last_modified=last_modified,
+                                           response=headers)
+    if conditional is not headers:
+        return conditional
+
+    size = grid_out.length
+    byte_range = None
+    if if_range_passes(request, etag, last_modified):
+        byte_range = parse_range(request.META.get('HTTP_RANGE'), size)
+
+    if byte_range is False:
+        response = HttpResponse(status=416)
+        response['Content-Range'] = f'bytes */{size}'
+    elif byte_range:
+        start, end = byte_range
+        length = end - start + 1
+        response = StreamingHttpResponse(chunks(grid_out, start, length),
+                                         status=206, content_type=content_type)
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+        response['Content-Length'] = str(length)
+    else:
+        response = StreamingHttpResponse(chunks(grid_out, 0, None), content_type=content_type)
+        response['Content-Length'] = str(size)
+
+    for header, value in headers.items():
+        if header.lower() != 'content-type':
+            response[header] = value
+    response['Accept-Ranges'] = 'bytes'
+    response['Content-Disposition'] = f'inline; filename="{filename}"'
+    return response
@@ -0,0 +1,247 @@
+"""
+Background ingestion of uploaded notice images.
+
+POST /notices/ only spools the upload to a GridFS staging bucket and records
+an ImageJob; a small in-process thread pool then stores the original and its
+resized variants as the notice's images. Jobs and uploads both live in
+MongoDB, so work left over by a crash or restart is picked up again by the
+next worker that starts, on whichever host.
+"""
+import logging
+import os
+import queue
+import sys
+import threading
+from datetime import timedelta
+
+from bson import ObjectId
+from django.conf import settings
+from django.utils import timezone
+
+from . import events
+from .cache import bump_version
+from .images import get_upload_fs, store_variants
+from .models import ImageJob, Notice
+
+logger = logging.getLogger(__name__)
+
+
+def spool_upload(upload, content_type):
+    """Copy an uploaded file to the staging bucket and return its GridFS id"""
+    upload.seek(0)
+    return get_upload_fs().put(upload, content_type=content_type)
+
+
+def open_upload(job):
+    if job.upload_id is None:
+        return open(job.upload_path, 'rb')
+    return get_upload_fs().get(job.upload_id)
+
+
+def enqueue_image(notice, upload):
+    """
+    Hand an uploaded image over to the background workers.
+
+    The notice is expected to be saved with image_status='pending' already.
+    """
+    content_type = getattr(upload, 'content_type', None) or 'image/jpeg'
+    job = ImageJob(id=ObjectId(), notice_id=notice.id, content_type=content_type,
+                   upload_id=spool_upload(upload, content_type))
+    job.save(force_insert=True)
+
+    if settings.IMAGE_JOB_SYNC:
+        # No worker will come back for a retry, so use up the attempts here
+        while run_job(job.id):
+            pass
+        notice.reload()
+    else:
+        get_worker().submit(job.id)
+    return job
+
+
+def claim_job(job_id):
+    """Atomically move a queued job to running; None if another worker has it"""
+    return ImageJob.objects(id=job_id, status='queued').modify(
+        set__status='running', set__updated_at=timezone.now(), inc__attempts=1, new=True,
+    )
+
+
+def run_job(job_id):
+    """Process a queued job; True when it failed and was queued for a retry"""
+    job = claim_job(job_id)
+    if job is None:
+        return False
+    try:
+        process_job(job)
+    except Exception as e:
+        logger.exception('Image job %s failed (attempt %s)', job.id, job.attempts)
+        return fail_job(job, e)
+    job.update(set__status='done', set__last_error='', set__updated_at=timezone.now())
+    discard_upload(job)
+    return False
+
+
+def process_job(job):
+    notice = Notice.objects(id=job.notice_id).first()
+    if notice is None:
+        # Deleted while the upload was waiting; nothing left to attach it to
+        return
+    with open_upload(job) as upload:
+        if notice.image:
+            # Left behind by an earlier attempt that failed half way
+            notice.image.replace(upload, content_type=job.content_type)
+        else:
+            notice.image.put(upload, content_type=job.content_type)
+        notice.image_variants = store_variants(upload)
+    notice.image_status = 'ready'
+    notice.save()
+    bump_version()
+    events.notice_updated(notice)
+
+
+def fail_job(job, error):
+    now = timezone.now()
+    if job.attempts < settings.IMAGE_JOB_MAX_ATTEMPTS:
+        # Exponential backoff: 2s, 4s, 8s, ...
+        job.update(set__status='queued', set__last_error=str(error), set__updated_at=now,
+                   set__run_after=now + timedelta(seconds=2 ** job.attempts))
+        return True
+    job.update(set__status='failed', set__last_error=str(error), set__updated_at=now)
+    notice = Notice.objects(id=job.notice_id).modify(set__image_status='failed', new=True)
+    bump_version()
+    if notice is not None:
+        events.notice_updated(notice)
+    discard_upload(job)
+    return False
+
+
+def discard_upload(job):
+    if job.upload_id is not None:
+        get_upload_fs().delete(job.upload_id)
+        return
+    try:
+        os.remove(job.upload_path)
+    except FileNotFoundError:
+        pass
+
+
+class ImageJobWorker:
+    """
+    Fixed-size thread pool fed from a bounded queue.
+
+    submit() never blocks the request: when the queue is full the job simply
+    stays queued in MongoDB and the poller hands it out once a slot frees up.
+    The poller also retries failed jobs after their backoff and recovers jobs
+    that were running when a previous process died.
+    """
+
+    def __init__(self, workers, queue_size, poll_interval, stale_after):
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self.stale_after = stale_after
+        self.queue = queue.Queue(maxsize=queue_size)
+        self.queued_ids = set()
+        self.lock = threading.Lock()
+        self.stopping = threading.Event()
+        self.threads = []
+
+    def start(self):
+        if self.threads:
+            return
+        for index in range(self.workers):
+            thread = threading.Thread(target=self.work, name=f'image-job-{index}', daemon=True)
+            thread.start()
+            self.threads.append(thread)
+        poller = threading.Thread(target=self.poll, name='image-job-poller', daemon=True)
+        poller.start()
+        self.threads.append(poller)
+
+    def stop(self):
+        self.stopping.set()
+
+    def submit(self, job_id):
+        with self.lock:
+            if job_id in self.queued_ids:
+                return True
+            try:
+                self.queue.put_nowait(job_id)
+            except queue.Full:
+                return False
+            self.queued_ids.add(job_id)
+            return True
+
+    def work(self):
+        while not self.stopping.is_set():
+            try:
+                job_id = self.queue.get(timeout=1)
+            except queue.Empty:
+                continue
+            with self.lock:
+                self.queued_ids.discard(job_id)
+            try:
+                run_job(job_id)
+            except Exception:
+                logger.exception('Image job worker crashed on %s', job_id)
+            finally:
+                self.queue.task_done()
+
+    def poll(self):
+        while not self.stopping.is_set():
+            try:
+                self.recover_stale()
+                self.submit_due()
+            except Exception:
+                logger.exception('Image job poller failed')
+            self.stopping.wait(self.poll_interval)
+
+    def recover_stale(self):
+        cutoff = timezone.now() - timedelta(seconds=self.stale_after)
+        ImageJob.objects(status='running', updated_at__lt=cutoff).update(set__status='queued')
+
+    def submit_due(self):
+        free = self.queue.maxsize - self.queue.qsize()
+        if free <= 0:
+            return
+        due = ImageJob.objects(status='queued', run_after__lte=timezone.now()).only('id').limit(free)
+        for job in due:
+            if not self.submit(job.id):
+                break
+
+
+_worker = None
+_worker_lock = threading.Lock()
+
+
+def get_worker():
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = ImageJobWorker(
+                workers=settings.IMAGE_JOB_WORKERS,
+                queue_size=settings.IMAGE_JOB_QUEUE_SIZE,
+                poll_interval=settings.IMAGE_JOB_POLL_INTERVAL,
+                stale_after=settings.IMAGE_JOB_STALE_AFTER,
+            )
+            _worker.start()
+        return _worker
+
+
+def is_server_process():
+    """True for the process `manage.py runserver` serves requests from"""
+    program = os.path.basename(sys.argv[0]) if sys.argv else ''
+    if program not in ('manage.py', 'django-admin') or sys.argv[1:2] != ['runserver']:
+        return False
+    # With the autoreloader only the child process serves requests
+    return os.environ.get('RUN_MAIN') == 'true' or '--noreload' in sys.argv
+
+
+def autostart(server=False):
+    """
+    Start the pool at boot so jobs left by a previous process are resumed.
+
+    Only server processes start it: runserver is detected here, and the
+    WSGI/ASGI entry points pass server=True. Shells, tests and other
+    commands start the pool lazily, on the first queued image.
+    """
+    if settings.IMAGE_JOB_AUTOSTART and not settings.IMAGE_JOB_SYNC and (server or is_server_process()):
+        get_worker()
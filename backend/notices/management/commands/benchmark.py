@@ -0,0 +1,557 @@
+import contextvars
+import http.client
+import io
+import json
+import math
+import multiprocessing
+import platform
+import random
+import socket
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+# Share of the request mix per endpoint, roughly what the frontend issues:
+# card lists and thumbnails dominate, writes are rare
+ENDPOINT_WEIGHTS = {
+    'list': 40,
+    'detail': 20,
+    'image': 25,
+    'respond': 10,
+    'login': 5,
+}
+LIST_PATHS = [
+    '/notices/',
+    '/notices/?type=lost',
+    '/notices/?status=active',
+    '/notices/?fields=id,owner_id,owner_nickname,owner_email,title,type,date,venue,'
+    'thumbnail_url,status,responses_count',
+]
+BENCH_PASSWORD = 'benchmark-password'
+DEFAULT_MOCK_URI = 'mongodb://localhost/lost_found_bench'
+# Options read by the server process (configure_database and seed)
+SERVER_OPTIONS = ('seed', 'users', 'notices', 'responses', 'images', 'mongodb_uri', 'no_cache')
+# Driver housekeeping, not work done for a request
+IGNORED_COMMANDS = {
+    'hello', 'ismaster', 'isMaster', 'ping', 'buildInfo', 'buildinfo',
+    'endSessions', 'saslStart', 'saslContinue', 'killCursors',
+}
+# mongomock Collection methods that stand for one server command each
+MOCK_OPERATIONS = (
+    'find', 'find_one', 'insert_one', 'insert_many', 'update_one', 'update_many',
+    'replace_one', 'delete_one', 'delete_many', 'find_one_and_update',
+    'find_one_and_replace', 'find_one_and_delete', 'count_documents',
+    'estimated_document_count', 'aggregate', 'distinct', 'bulk_write',
+)
+COMPARED_METRICS = (
+    # (metric, higher is better)
+    ('p50_ms', False),
+    ('p95_ms', False),
+    ('p99_ms', False),
+    ('rps', True),
+    ('mongo_commands_per_request', False),
+)
+
+# Endpoint label of the request being served, taken from the
+# X-Benchmark-Endpoint header the load generator sends
+endpoint_var = contextvars.ContextVar('benchmark_endpoint', default=None)
+
+
+class CommandCounter:
+    """MongoDB commands issued by the server process, per endpoint label"""
+
+    def __init__(self):
+        self.counts = defaultdict(int)
+        self.lock = threading.Lock()
+        self.local = threading.local()
+
+    def record(self):
+        label = endpoint_var.get()
+        if label is None:
+            return
+        with self.lock:
+            self.counts[label] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+    def reset(self):
+        with self.lock:
+            self.counts.clear()
+
+
+def listen_to_driver(counter):
+    from pymongo import monitoring
+
+    class Listener(monitoring.CommandListener):
+        def started(self, event):
+            if event.command_name not in IGNORED_COMMANDS:
+                counter.record()
+
+        def succeeded(self, event):
+            pass
+
+        def failed(self, event):
+            pass
+
+    monitoring.register(Listener())
+
+
+def count_mock_operations(counter):
+    """mongomock emits no command events, so count its collection calls instead"""
+    from mongomock.collection import Collection
+
+    def counted(method):
+        def wrapper(self, *args, **kwargs):
+            # mongomock calls its own public methods internally (find_one ->
+            # find); only the outermost call is a command
+            depth = getattr(counter.local, 'depth', 0)
+            if not depth:
+                counter.record()
+            counter.local.depth = depth + 1
+            try:
+                return method(self, *args, **kwargs)
+            finally:
+                counter.local.depth = depth
+        return wrapper
+
+    for name in MOCK_OPERATIONS:
+        setattr(Collection, name, counted(getattr(Collection, name)))
+
+
+def configure_database(options, counter):
+    """Point this (server) process at the benchmark database"""
+    import mongoengine
+    from lost_found import mongo
+
+    mongoengine.disconnect()
+    settings.MONGODB_MOCK = not options['mongodb_uri']
+    settings.MONGODB_URI = options['mongodb_uri'] or DEFAULT_MOCK_URI
+    settings.NOTICE_CACHE_ENABLED = settings.NOTICE_CACHE_ENABLED and not options['no_cache']
+    if settings.MONGODB_MOCK:
+        import mongomock.gridfs
+        mongomock.gridfs.enable_gridfs_integration()
+        count_mock_operations(counter)
+    else:
+        listen_to_driver(counter)
+    mongo.connect()
+
+
+def sample_images(rng, count):
+    """Distinct JPEGs the size of a phone photo, generated rather than shipped"""
+    from PIL import Image, ImageDraw
+
+    for _ in range(count):
+        image = Image.new('RGB', (1600, 1200), tuple(rng.randrange(256) for _ in range(3)))
+        draw = ImageDraw.Draw(image)
+        for _ in range(40):
+            x, y = rng.randrange(1600), rng.randrange(1200)
+            draw.ellipse((x, y, x + rng.randrange(40, 400), y + rng.randrange(40, 400)),
+                         fill=tuple(rng.randrange(256) for _ in range(3)))
+        buffer = io.BytesIO()
+        image.save(buffer, format='JPEG', quality=85)
+        yield buffer.getvalue()
+
+
+def seed(options):
+    """Fill the benchmark database; returns what the request mix needs"""
+    from django.contrib.auth.hashers import make_password
+    from mongoengine.connection import get_db
+
+    from accounts.models import AuthToken, User
+    from notices.images import IMAGE_COLLECTION, UPLOAD_COLLECTION, get_image_fs, store_variants
+    from notices.models import ImageJob, Notice, Response
+
+    rng = random.Random(options['seed'])
+    db = get_db()
+    for document in (User, AuthToken, Notice, Response, ImageJob):
+        document.drop_collection()
+    for bucket in (IMAGE_COLLECTION, UPLOAD_COLLECTION):
+        db[f'{bucket}.files'].drop()
+        db[f'{bucket}.chunks'].drop()
+    if not settings.MONGODB_MOCK:
+        for document in (User, AuthToken, Notice, Response):
+            document.ensure_indexes()
+
+    # Hashed once: the same password for everyone keeps seeding fast, while
+    # each login still pays for a full hash check
+    password = make_password(BENCH_PASSWORD)
+    users = [
+        User(user_id=f'bench-{i}', username=f'bench{i}', email=f'bench{i}@example.com',
+             nickname=f'Bench user {i}', password=password)
+        for i in range(options['users'])
+    ]
+    User.objects.insert(users)
+    responders, login_users = users[:len(users) // 2], users[len(users) // 2:]
+    tokens = [AuthToken.new(user, key=f'bench-token-{i}') for i, user in enumerate(responders)]
+    if tokens:
+        AuthToken.objects.insert(tokens)
+
+    fs = get_image_fs()
+    images = []
+    for data in sample_images(rng, options['images']):
+        images.append((fs.put(data, content_type='image/jpeg'), store_variants(io.BytesIO(data))))
+
+    words = ['black', 'wallet', 'umbrella', 'blue', 'keys', 'laptop', 'charger', 'student', 'card',
+             'water', 'bottle', 'headphones', 'jacket', 'library', 'canteen', 'phone', 'glasses']
+    venues = ['Library', 'Canteen', 'Sports hall', 'Lecture theatre A', 'Car park', 'Bus stop']
+    now = datetime.now().replace(microsecond=0)
+    notices = []
+    for i in range(options['notices']):
+        created_at = now - timedelta(minutes=rng.randrange(60 * 24 * 90))
+        doc = Notice(
+            owner_id=rng.choice(users).user_id,
+            title=' '.join(rng.choices(words, k=3)).capitalize(),
+            type=rng.choice(['lost', 'found']),
+            date=created_at.date(),
+            venue=rng.choice(venues),
+            contact=f'{rng.randrange(10 ** 7, 10 ** 8)}',
+            description=' '.join(rng.choices(words, k=rng.randrange(10, 80))),
+            status='active' if rng.random() < 0.8 else 'completed',
+            created_at=created_at,
+            updated_at=created_at,
+        ).to_mongo()
+        if images and rng.random() < 0.6:
+            doc['image'], doc['image_variants'] = rng.choice(images)
+            doc['image_status'] = 'ready'
+        notices.append(doc)
+    notice_ids = Notice._get_collection().insert_many(notices).inserted_ids
+
+    # A few popular notices collect most of the responses
+    weights = [1 / (rank + 1) for rank in range(len(notice_ids))]
+    counts = defaultdict(int)
+    responses = []
+    for notice_id in rng.choices(notice_ids, weights=weights, k=options['responses']):
+        counts[notice_id] += 1
+        responses.append(Response(
+            notice=notice_id, responder_id=rng.choice(users).user_id, message='I think I saw it.',
+            created_at=now - timedelta(minutes=rng.randrange(60 * 24 * 30)),
+        ).to_mongo())
+    if responses:
+        Response._get_collection().insert_many(responses)
+    for notice_id, count in counts.items():
+        Notice._get_collection().update_one({'_id': notice_id}, {'$set': {'responses_count': count}})
+
+    active = [str(doc['_id']) for doc in notices if doc['status'] == 'active']
+    return {
+        'notice_ids': [str(pk) for pk in notice_ids],
+        'active_ids': active or [str(notice_ids[0])],
+        'image_ids': [str(variants.get('thumbnail') or grid_id) for grid_id, variants in images],
+        'tokens': [token.key for token in tokens],
+        'logins': [user.email for user in login_users],
+    }
+
+
+def tag_requests(app):
+    """ASGI wrapper that exposes the X-Benchmark-Endpoint header to the command counter"""
+    async def tagged(scope, receive, send):
+        if scope['type'] == 'http':
+            label = dict(scope['headers']).get(b'x-benchmark-endpoint')
+            endpoint_var.set(label.decode() if label else None)
+        await app(scope, receive, send)
+    return tagged
+
+
+def start_method():
+    """
+    fork where the platform has it, spawn otherwise (Windows).
+
+    A forked server inherits this process as it is, Django included. A
+    spawned one starts a fresh interpreter and sets Django up again from
+    DJANGO_SETTINGS_MODULE and the environment, so only settings that come
+    from there (or .env) reach it, and it takes a second or two longer.
+    """
+    return 'fork' if 'fork' in multiprocessing.get_all_start_methods() else 'spawn'
+
+
+def serve(port, options, conn):
+    """Server process: seed, then run the ASGI app under uvicorn until told to stop"""
+    import django
+    import uvicorn
+    from django.apps import apps
+    from django.core.asgi import get_asgi_application
+
+    if not apps.ready:
+        # Spawned rather than forked
+        django.setup(set_prefix=False)
+
+    counter = CommandCounter()
+    configure_database(options, counter)
+    conn.send(seed(options))
+
+    config = uvicorn.Config(tag_requests(get_asgi_application()), host='127.0.0.1', port=port,
+                            log_level='warning', access_log=False, lifespan='off')
+    server = uvicorn.Server(config)
+
+    def control():
+        for message in iter(conn.recv, 'stop'):
+            if message == 'stats':
+                conn.send(counter.snapshot())
+            elif message == 'reset':
+                counter.reset()
+        server.should_exit = True
+
+    threading.Thread(target=control, daemon=True).start()
+    server.run()
+
+
+def plan_requests(seed_info, count, rng):
+    """(label, method, path, body, headers) for count requests drawn from the mix"""
+    labels = rng.choices(list(ENDPOINT_WEIGHTS), weights=list(ENDPOINT_WEIGHTS.values()), k=count)
+    plan = []
+    for label in labels:
+        headers = {'X-Benchmark-Endpoint': label, 'Accept': 'application/json'}
+        body = None
+        method = 'GET'
+        if label == 'list':
+            path = rng.choice(LIST_PATHS)
+        elif label == 'detail':
+            path = f'/notices/{rng.choice(seed_info["notice_ids"])}/'
+        elif label == 'image':
+            path = f'/notices/image/{rng.choice(seed_info["image_ids"])}/'
+            headers['Accept'] = 'image/webp,image/*,*/*'
+        elif label == 'respond':
+            method = 'POST'
+            path = f'/notices/{rng.choice(seed_info["active_ids"])}/respond/'
+            body = json.dumps({'message': 'I think I saw it near the entrance.'})
+            headers['Authorization'] = f'Bearer {rng.choice(seed_info["tokens"])}'
+        else:
+            method = 'POST'
+            path = '/auth/login/'
+            body = json.dumps({'email': rng.choice(seed_info['logins']), 'password': BENCH_PASSWORD})
+        if body is not None:
+            headers['Content-Type'] = 'application/json'
+        plan.append((label, method, path, body, headers))
+    return plan
+
+
+def run_load(port, plan, concurrency):
+    """Replay plan over keep-alive connections; returns ({label: [seconds]}, {label: errors}, wall seconds)"""
+    latencies = defaultdict(list)
+    errors = defaultdict(int)
+    lock = threading.Lock()
+    pending = iter(plan)
+
+    def worker():
+        conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+        while True:
+            with lock:
+                item = next(pending, None)
+            if item is None:
+                break
+            label, method, path, body, headers = item
+            start = time.perf_counter()
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                response.read()
+                failed = response.status >= 400
+            except (OSError, http.client.HTTPException):
+                conn.close()
+                conn = http.client.HTTPConnection('127.0.0.1', port, timeout=60)
+                failed = True
+            elapsed = time.perf_counter() - start
+            with lock:
+                latencies[label].append(elapsed)
+                if failed:
+                    errors[label] += 1
+        conn.close()
+
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, pct):
+    """Nearest-rank percentile of sorted values"""
+    return values[max(0, math.ceil(pct / 100 * len(values)) - 1)]
+
+
+def summarize(samples, errors, commands, wall):
+    samples = sorted(samples)
+    if not samples:
+        return None
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'rps': round(len(samples) / wall, 1),
+        'p50_ms': round(percentile(samples, 50) * 1000, 2),
+        'p95_ms': round(percentile(samples, 95) * 1000, 2),
+        'p99_ms': round(percentile(samples, 99) * 1000, 2),
+        'mongo_commands_per_request': round(commands / len(samples), 2),
+    }
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_port(port, timeout):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=1).close()
+            return
+        except OSError:
+            time.sleep(0.1)
+    raise CommandError(f'The benchmark server did not start listening on port {port}.')
+
+
+class Command(BaseCommand):
+    help = ('Serve the app under uvicorn against a seeded benchmark database, replay a '
+            'request mix and report latency percentiles, throughput and MongoDB commands '
+            'per request for each endpoint')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=2000,
+                            help='Measured requests, drawn from the endpoint mix')
+        parser.add_argument('--warmup', type=int, default=200,
+                            help='Requests sent first and left out of the results')
+        parser.add_argument('--concurrency', type=int, default=8,
+                            help='Concurrent keep-alive connections')
+        parser.add_argument('--seed', type=int, default=42,
+                            help='Random seed for the data and the request sequence')
+        parser.add_argument('--users', type=int, default=50)
+        parser.add_argument('--notices', type=int, default=1000)
+        parser.add_argument('--responses', type=int, default=3000)
+        parser.add_argument('--images', type=int, default=20,
+                            help='Distinct images shared by the notices that have one')
+        parser.add_argument('--mongodb-uri',
+                            help='Benchmark against this MongoDB instead of the in-memory '
+                                 'stand-in; its database is dropped and must be named *bench*')
+        parser.add_argument('--no-cache', action='store_true',
+                            help='Disable the notice response cache in the server')
+        parser.add_argument('--output', help='Write the results as JSON (e.g. a new baseline)')
+        parser.add_argument('--baseline', help='Results JSON to compare against')
+        parser.add_argument('--max-regression', type=float,
+                            help='With --baseline, fail when any compared metric is this many '
+                                 'percent worse')
+
+    def handle(self, *args, **options):
+        if options['mongodb_uri']:
+            from lost_found.mongo import database_name
+            if 'bench' not in database_name(options['mongodb_uri']):
+                raise CommandError('The benchmark drops its database; name it *bench* '
+                                   '(e.g. mongodb://localhost/lost_found_bench).')
+        elif settings.ASYNC_VIEWS:
+            raise CommandError('ASYNC_VIEWS needs a real MongoDB; pass --mongodb-uri.')
+
+        port = free_port()
+        context = multiprocessing.get_context(start_method())
+        parent_conn, child_conn = context.Pipe()
+        # Only what the server uses: spawn pickles the arguments, and stdout may not pickle
+        server_options = {key: options[key] for key in SERVER_OPTIONS}
+        server = context.Process(target=serve, args=(port, server_options, child_conn), daemon=True)
+        server.start()
+        try:
+            deadline = time.monotonic() + 600
+            while not parent_conn.poll(1):
+                if not server.is_alive():
+                    raise CommandError('The benchmark server exited before it was ready.')
+                if time.monotonic() > deadline:
+                    raise CommandError('Seeding the benchmark database timed out.')
+            seed_info = parent_conn.recv()
+            wait_for_port(port, timeout=30)
+
+            rng = random.Random(options['seed'])
+            if options['warmup']:
+                run_load(port, plan_requests(seed_info, options['warmup'], rng), options['concurrency'])
+            parent_conn.send('reset')
+            latencies, errors, wall = run_load(
+                port, plan_requests(seed_info, options['requests'], rng), options['concurrency'],
+            )
+            parent_conn.send('stats')
+            commands = parent_conn.recv()
+        finally:
+            if server.is_alive():
+                parent_conn.send('stop')
+            server.join(10)
+            if server.is_alive():
+                server.terminate()
+
+        endpoints = {}
+        for label in ENDPOINT_WEIGHTS:
+            summary = summarize(latencies[label], errors[label], commands.get(label, 0), wall)
+            if summary:
+                endpoints[label] = summary
+        endpoints['total'] = summarize(
+            [value for values in latencies.values() for value in values],
+            sum(errors.values()), sum(commands.values()), wall,
+        )
+        results = {
+            'meta': {
+                'created_at': datetime.now().isoformat(timespec='seconds'),
+                'database': 'mongodb' if options['mongodb_uri'] else 'mongomock',
+                'async_views': settings.ASYNC_VIEWS,
+                'cache': settings.NOTICE_CACHE_ENABLED and not options['no_cache'],
+                'python': platform.python_version(),
+                **{key: options[key] for key in (
+                    'requests', 'warmup', 'concurrency', 'seed', 'users', 'notices', 'responses', 'images',
+                )},
+            },
+            'endpoints': endpoints,
+        }
+        self.report(endpoints)
+
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(results, f, indent=2)
+                f.write('\n')
+            self.stdout.write(f'Results written to {options["output"]}')
+        if options['baseline']:
+            self.compare(results, options['baseline'], options['max_regression'])
+
+    def report(self, endpoints):
+        self.stdout.write(f'{"endpoint":<10}{"requests":>10}{"errors":>8}{"req/s":>10}'
+                          f'{"p50 ms":>10}{"p95 ms":>10}{"p99 ms":>10}{"mongo/req":>11}')
+        for label, row in endpoints.items():
+            self.stdout.write(
+                f'{label:<10}{row["requests"]:>10}{row["errors"]:>8}{row["rps"]:>10}'
+                f'{row["p50_ms"]:>10}{row["p95_ms"]:>10}{row["p99_ms"]:>10}'
+                f'{row["mongo_commands_per_request"]:>11}'
+            )
+
+    def compare(self, results, path, max_regression):
+        with open(path) as f:
+            baseline = json.load(f)
+        for key in ('database', 'requests', 'concurrency', 'seed', 'notices'):
+            if baseline['meta'].get(key) != results['meta'][key]:
+                self.stdout.write(self.style.WARNING(
+                    f'Baseline {key} was {baseline["meta"].get(key)!r}, this run {results["meta"][key]!r}.'
+                ))
+
+        self.stdout.write(f'\nChange against {path} (negative is worse):')
+        regressions = []
+        for label, row in results['endpoints'].items():
+            before = baseline['endpoints'].get(label)
+            if not before:
+                continue
+            changes = []
+            for metric, higher_is_better in COMPARED_METRICS:
+                if not before.get(metric):
+                    continue
+                change = (row[metric] - before[metric]) / before[metric] * 100
+                if not higher_is_better:
+                    change = -change
+                changes.append(f'{metric} {change:+.1f}%')
+                if max_regression is not None and change < -max_regression:
+                    regressions.append(f'{label} {metric}: {before[metric]} -> {row[metric]}')
+            self.stdout.write(f'{label:<10}' + ', '.join(changes))
+
+        if regressions:
+            raise CommandError(
+                f'Regressed more than {max_regression}% against the baseline:\n' + '\n'.join(regressions)
+            )
+        self.stdout.write(self.style.SUCCESS('No regressions beyond the threshold.'
+                                             if max_regression is not None else 'Compared.'))
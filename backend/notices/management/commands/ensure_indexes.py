@@ -0,0 +1,154 @@
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from django.core.management.base import BaseCommand, CommandError
+from mongoengine.queryset.visitor import Q
+
+from accounts.models import AuthToken, User
+from notices.images import IMAGE_COLLECTION
+from notices.models import NOTICE_FILTER_INDEXES, ImageJob, Notice, Response
+from notices.search import search_pipeline
+
+DOCUMENTS = [User, AuthToken, Notice, Response, ImageJob]
+
+
+def hot_queries():
+    """
+    (label, explain-callable) for every query the views run per request.
+
+    Placeholder values are fine: the planner picks the same plan whether or
+    not they match anything.
+    """
+    some_id = ObjectId()
+    some_time = datetime(2000, 1, 1)
+    from mongoengine.connection import get_db
+    db = get_db()
+    image_files = db[f'{IMAGE_COLLECTION}.files']
+
+    def explain_aggregate(document, pipeline):
+        return db.command('explain', {
+            'aggregate': document._get_collection_name(), 'pipeline': pipeline, 'cursor': {},
+        })
+
+    def list_page(fields, date_range=False, after=False):
+        filters = {field: 'x' for field in fields}
+        if date_range:
+            filters.update(date__gte=some_time, date__lte=some_time)
+        queryset = Notice.objects(**filters)
+        if after:
+            queryset = queryset.filter(Q(created_at__lt=some_time) | Q(created_at=some_time, id__lt=some_id))
+        return lambda: queryset.order_by('-created_at', '-id').limit(21).explain()
+
+    queries = []
+    # Every filter combination the list and My notices accept, with and
+    # without a date range, plus a next page of the unfiltered list
+    for fields in NOTICE_FILTER_INDEXES:
+        name = ' + '.join(fields) or 'no filter'
+        queries.append((f'notices: list ({name})', list_page(fields)))
+        queries.append((f'notices: list ({name}, date range)', list_page(fields, date_range=True)))
+    queries.append(('notices: list next page', list_page((), after=True)))
+
+    return queries + [
+        ('notices: detail',
+         lambda: Notice.objects(pk=some_id).explain()),
+        ('notices: newest responses of a notice',
+         lambda: Response.objects(notice=some_id).limit(5).explain()),
+        ('notices: responses next page',
+         lambda: Response.objects(notice=some_id).filter(
+             Q(created_at__lt=some_time) | Q(created_at=some_time, id__lt=some_id)
+         ).order_by('-created_at', '-id').limit(21).explain()),
+        ('notices: owners of a page',
+         lambda: User.objects(user_id__in=['a', 'b']).only('user_id', 'nickname', 'email').explain()),
+        ('notices: search first page',
+         lambda: explain_aggregate(Notice, search_pipeline('black wallet', 20))),
+        ('notices: search next page',
+         lambda: explain_aggregate(Notice, search_pipeline('black wallet', 20, (1.0, some_id)))),
+        ('notices: image by grid id',
+         lambda: image_files.find({'_id': some_id}).explain()),
+        ('notices: due image jobs',
+         lambda: ImageJob.objects(status='queued', run_after__lte=some_time).limit(10).explain()),
+        ('accounts: session by bearer token',
+         lambda: AuthToken.objects(key='token', expires_at__gt=some_time).explain()),
+        ('accounts: user of a session',
+         lambda: User.objects(id=some_id).explain()),
+        ('accounts: user by pre-session token',
+         lambda: User.objects(auth_token='token').explain()),
+        ('accounts: login by email',
+         lambda: User.objects(email='someone@example.com').explain()),
+        ('accounts: register username check',
+         lambda: User.objects(username='someone').explain()),
+        ('accounts: profile image by user_id',
+         lambda: User.objects(user_id='user-id').explain()),
+    ]
+
+
+def winning_plans(node):
+    """Yield the winningPlan of a find explain or of each aggregation $cursor stage"""
+    if isinstance(node, dict):
+        for key, value in node.items():
+            if key == 'winningPlan':
+                yield value
+            elif key != 'rejectedPlans':
+                yield from winning_plans(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from winning_plans(value)
+
+
+def plan_stages(node):
+    """Yield every plan stage dict in an explain() tree, root first"""
+    if isinstance(node, dict):
+        if 'stage' in node:
+            yield node
+        for value in node.values():
+            yield from plan_stages(value)
+    elif isinstance(node, list):
+        for value in node:
+            yield from plan_stages(value)
+
+
+def summarize(plan):
+    if not plan:
+        return 'no plan reported'
+    parts = []
+    for stage in plan_stages(plan):
+        name = stage['stage']
+        if stage.get('indexName'):
+            name += f" {{{stage['indexName']}}}"
+        parts.append(name)
+    return ' <- '.join(parts)
+
+
+class Command(BaseCommand):
+    help = 'Create the declared MongoDB indexes and check that every hot query uses one'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--no-create', action='store_true',
+                            help='Only verify query plans, do not create indexes')
+        parser.add_argument('--verbose-plans', action='store_true',
+                            help='Print the full winning plan of each query')
+
+    def handle(self, *args, **options):
+        if not options['no_create']:
+            for document in DOCUMENTS:
+                # Idempotent: existing indexes with the same spec are left alone
+                document.ensure_indexes()
+                collection = document._get_collection()
+                names = ', '.join(sorted(collection.index_information()))
+                self.stdout.write(f'{collection.name}: {names}')
+
+        scans = []
+        for label, explain in hot_queries():
+            plan = list(winning_plans(explain()))
+            summary = summarize(plan)
+            if any(stage['stage'] == 'COLLSCAN' for stage in plan_stages(plan)):
+                scans.append(label)
+                self.stdout.write(self.style.ERROR(f'COLLSCAN  {label}: {summary}'))
+            else:
+                self.stdout.write(self.style.SUCCESS(f'ok        {label}: {summary}'))
+            if options['verbose_plans']:
+                self.stdout.write(json.dumps(plan, indent=2, default=str))
+
+        if scans:
+            raise CommandError(f'{len(scans)} hot query(s) do a collection scan: {", ".join(scans)}')
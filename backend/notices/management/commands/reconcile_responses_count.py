@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from pymongo import UpdateOne
+
+from notices.cache import bump_version
+from notices.models import Notice, Response
+
+
+class Command(BaseCommand):
+    help = 'Backfill and reconcile the denormalized Notice.responses_count field'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of notices compared and written per bulk operation')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report mismatches without writing them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        notices = Notice._get_collection()
+        responses = Response._get_collection()
+
+        # Stream actual counts grouped by notice and compare them in batches
+        # against what is stored, so only drifted notices are rewritten
+        actual = responses.aggregate(
+            [{'$group': {'_id': '$notice', 'count': {'$sum': 1}}}],
+            allowDiskUse=True,
+        )
+        seen = set()
+        checked = fixed = 0
+        batch = {}
+        for row in actual:
+            if row['_id'] is None:
+                continue
+            batch[row['_id']] = row['count']
+            if len(batch) >= batch_size:
+                checked += len(batch)
+                fixed += self.reconcile(notices, batch, dry_run)
+                seen.update(batch)
+                batch = {}
+        if batch:
+            checked += len(batch)
+            fixed += self.reconcile(notices, batch, dry_run)
+            seen.update(batch)
+
+        # Notices with no responses at all never show up in the aggregation
+        stale = notices.find(
+            {'$or': [{'responses_count': {'$ne': 0}}, {'responses_count': {'$exists': False}}]},
+            {'_id': 1},
+        ).batch_size(batch_size)
+        batch = {}
+        for doc in stale:
+            if doc['_id'] in seen:
+                continue
+            batch[doc['_id']] = 0
+            if len(batch) >= batch_size:
+                fixed += self.reconcile(notices, batch, dry_run)
+                batch = {}
+        if batch:
+            fixed += self.reconcile(notices, batch, dry_run)
+
+        if fixed and not dry_run:
+            # Only reaches running servers when the cache backend is shared
+            bump_version()
+
+        verb = 'Would fix' if dry_run else 'Fixed'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} responses_count on {fixed} notice(s) ({checked} with responses checked).'
+        ))
+
+    def reconcile(self, notices, counts, dry_run):
+        stored = notices.find({'_id': {'$in': list(counts)}}, {'responses_count': 1})
+        operations = [
+            UpdateOne({'_id': doc['_id']}, {'$set': {'responses_count': counts[doc['_id']]}})
+            for doc in stored
+            if doc.get('responses_count') != counts[doc['_id']]
+        ]
+        if operations and not dry_run:
+            notices.bulk_write(operations, ordered=False)
+        return len(operations)
@@ -0,0 +1,62 @@
+from datetime import datetime, timedelta, timezone
+
+from django.core.management.base import BaseCommand
+from mongoengine.connection import get_db
+
+from accounts.models import User
+from notices.images import IMAGE_COLLECTION, delete_images
+from notices.models import Notice, image_file_ids
+
+
+class Command(BaseCommand):
+    help = 'Delete GridFS image files no longer referenced by any notice or user'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000,
+                            help='Number of files deleted per delete_many')
+        parser.add_argument('--grace-minutes', type=int, default=60,
+                            help='Leave files younger than this alone; an image job may '
+                                 'have stored them without saving the notice yet')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report orphans without deleting them')
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        dry_run = options['dry_run']
+        cutoff = datetime.now(timezone.utc) - timedelta(minutes=options['grace_minutes'])
+
+        # Ids are small, so every referenced one fits in memory; that costs a
+        # single pass over notices and users instead of a lookup per file
+        referenced = set()
+        for doc in Notice._get_collection().find({}, {'image': 1, 'image_variants': 1}).batch_size(batch_size):
+            referenced.update(image_file_ids(doc))
+        users = User._get_collection().find({'profile_image': {'$ne': None}}, {'profile_image': 1})
+        referenced.update(doc['profile_image'] for doc in users.batch_size(batch_size))
+
+        files = get_db()[f'{IMAGE_COLLECTION}.files'].find(
+            {'uploadDate': {'$lt': cutoff}}, {'length': 1},
+        ).batch_size(batch_size)
+        scanned = removed = reclaimed = 0
+        batch = []
+        for doc in files:
+            scanned += 1
+            if doc['_id'] in referenced:
+                continue
+            batch.append(doc['_id'])
+            removed += 1
+            reclaimed += doc.get('length', 0)
+            if len(batch) >= batch_size:
+                self.sweep(batch, dry_run)
+                batch = []
+        if batch:
+            self.sweep(batch, dry_run)
+
+        verb = 'Would delete' if dry_run else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} orphaned file(s) of {scanned} scanned, '
+            f'reclaiming {reclaimed} bytes ({reclaimed / 1024 / 1024:.1f} MiB).'
+        ))
+
+    def sweep(self, grid_ids, dry_run):
+        if not dry_run:
+            delete_images(grid_ids)
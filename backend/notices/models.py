@@ -1,6 +1,47 @@
 from django.conf import settings
 from django.db import models
-from mongoengine import Document, StringField, DateTimeField, DateField, ReferenceField, CASCADE, IntField, ImageField
+from mongoengine import Document, QuerySet, StringField, DateTimeField, DateField, ReferenceField, IntField, ImageField, DictField, ObjectIdField
+from django.utils import timezone
+
+# Equality filters the notice list accepts together (see notices/filters.py).
+# Each combination gets one index that continues with the newest-first sort
+# key and then date, so a date range is also answered from the index.
+NOTICE_FILTER_INDEXES = [
+    (),
+    ('owner_id',),
+    ('owner_id', 'status'),
+    ('type',),
+    ('status',),
+    ('type', 'status'),
+    ('venue',),
+]
+
+
+def image_file_ids(doc):
+    """GridFS ids of a raw notice document's image and all of its variants"""
+    file_ids = list((doc.get('image_variants') or {}).values())
+    if doc.get('image'):
+        file_ids.append(doc['image'])
+    return file_ids
+
+
+class NoticeQuerySet(QuerySet):
+    def delete(self, *args, **kwargs):
+        """
+        Delete the notices together with their responses and image files.
+
+        Notice.delete() ends up here too, so single and bulk deletes both
+        cost one delete_many per collection instead of a query per file.
+        """
+        from .images import delete_images
+
+        rows = list(self.clone().only('id', 'image', 'image_variants').as_pymongo())
+        deleted = super().delete(*args, **kwargs)
+        if rows:
+            notice_ids = [row['_id'] for row in rows]
+            Response.objects(notice__in=notice_ids).delete()
+            delete_images(file_id for row in rows for file_id in image_file_ids(row))
+        return deleted
 
 
 class Notice(Document):
@@ -12,6 +53,11 @@ class Notice(Document):
         ('active', 'Active'),
         ('completed', 'Completed'),
     ]
+    IMAGE_STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('ready', 'Ready'),
+        ('failed', 'Failed'),
+    ]
 
     owner_id = StringField(required=True)  # Reference to MongoDB User user_id
     title = StringField(required=True, max_length=255)
@@ -21,13 +67,41 @@ class Notice(Document):
     contact = StringField(required=True, max_length=255)
     description = StringField(required=True)
     image = ImageField()
+    # GridFS ids of the resized copies of image, keyed by variant name
+    # (see notices.images.IMAGE_VARIANTS)
+    image_variants = DictField(field=ObjectIdField())
+    # Set while an ImageJob is still storing the upload; unset on notices
+    # created without an image or before background ingestion existed
+    image_status = StringField(choices=IMAGE_STATUS_CHOICES, max_length=20)
     status = StringField(choices=STATUS_CHOICES, default='active', max_length=20)
+    # Denormalized count of Response documents, maintained with atomic $inc
+    # (see reconcile_responses_count to rebuild it)
+    responses_count = IntField(default=0)
+    # Set by the bulk complete action that closed the notice, so it can
+    # tell its own updates from a concurrent one's (notices/bulk.py)
+    completed_by = ObjectIdField()
     created_at = DateTimeField(required=True)
     updated_at = DateTimeField(required=True)
 
     meta = {
-        'ordering': ['-created_at'],
-        'collection': 'notices'
+        # id breaks ties between notices created in the same millisecond,
+        # which keeps cursor pagination stable
+        'ordering': ['-created_at', '-id'],
+        'collection': 'notices',
+        # Cascades deletes to responses and GridFS files
+        'queryset_class': NoticeQuerySet,
+        'indexes': [
+            # Newest-first listing and its keyset cursor, plain and filtered;
+            # My notices uses the owner_id ones
+            *[fields + ('-created_at', '-id', 'date') for fields in NOTICE_FILTER_INDEXES],
+            # Full-text search, ranked with title matches counting most
+            {
+                'fields': ['$title', '$venue', '$description'],
+                'default_language': 'english',
+                'weights': {'title': 10, 'venue': 5, 'description': 2},
+                'name': 'notice_text',
+            },
+        ],
     }
 
     def __str__(self):
@@ -44,19 +118,38 @@ class Notice(Document):
 
 
 class Response(Document):
-    notice = ReferenceField(Notice, reverse_delete_schema=CASCADE)
+    # Deleted along with their notice by NoticeQuerySet.delete()
+    notice = ReferenceField(Notice)
     responder_id = StringField(required=True)  # Reference to MongoDB User user_id
     message = StringField(required=True)
     created_at = DateTimeField(required=True)
 
     meta = {
-        'ordering': ['-created_at'],
-        'collection': 'responses'
+        # id breaks ties the same way as for notices (cursor pagination)
+        'ordering': ['-created_at', '-id'],
+        'collection': 'responses',
+        'indexes': [
+            # Responses of one notice, newest first, and their keyset cursor
+            ('notice', '-created_at', '-id'),
+        ],
     }
 
     def __str__(self):
         return f'Response by user {self.responder_id} on {self.notice}'
 
+    def save(self, *args, **kwargs):
+        created = self.pk is None
+        result = super().save(*args, **kwargs)
+        if created:
+            Notice.objects(id=self.to_mongo()['notice']).update_one(inc__responses_count=1)
+        return result
+
+    def delete(self, *args, **kwargs):
+        notice_id = self.to_mongo().get('notice')
+        super().delete(*args, **kwargs)
+        if notice_id:
+            Notice.objects(id=notice_id, responses_count__gt=0).update_one(dec__responses_count=1)
+
     @property
     def responder(self):
         """Get MongoDB User object from responder_id"""
@@ -65,3 +158,35 @@ class Response(Document):
             return User.objects.get(user_id=self.responder_id)
         except:
             return None
+
+
+class ImageJob(Document):
+    """Durable record of an uploaded notice image waiting to be stored in GridFS"""
+    STATUS_CHOICES = [
+        ('queued', 'Queued'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('failed', 'Failed'),
+    ]
+
+    notice_id = ObjectIdField(required=True)
+    # The upload, in the images.UPLOAD_COLLECTION GridFS bucket so a worker
+    # on any host can process it
+    upload_id = ObjectIdField()
+    # Local spool file of jobs queued before uploads moved to GridFS
+    upload_path = StringField()
+    content_type = StringField(default='image/jpeg')
+    status = StringField(choices=STATUS_CHOICES, default='queued', max_length=20)
+    attempts = IntField(default=0)
+    last_error = StringField(default='')
+    run_after = DateTimeField(default=timezone.now)
+    created_at = DateTimeField(default=timezone.now)
+    updated_at = DateTimeField(default=timezone.now)
+
+    meta = {
+        'collection': 'image_jobs',
+        'indexes': [('status', 'run_after')],
+    }
+
+    def __str__(self):
+        return f'Image job for notice {self.notice_id} ({self.status})'
@@ -0,0 +1,173 @@
+import base64
+import json
+from datetime import datetime
+
+from bson import ObjectId
+from bson.errors import InvalidId
+from mongoengine.queryset.visitor import Q
+from rest_framework.utils.urls import replace_query_param
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+# pymongo sort matching the '-created_at', '-id' meta ordering of Notice and Response
+NEWEST_FIRST = [('created_at', -1), ('_id', -1)]
+OLDEST_FIRST = [('created_at', 1), ('_id', 1)]
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(payload):
+    """Encode a cursor payload dict into an opaque URL-safe string"""
+    raw = json.dumps(payload, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(value):
+    """Decode an opaque cursor string back into its payload dict"""
+    try:
+        padded = value + '=' * (-len(value) % 4)
+        payload = json.loads(base64.urlsafe_b64decode(padded.encode()))
+    except (ValueError, TypeError):
+        raise InvalidCursor('Invalid cursor.')
+    if not isinstance(payload, dict):
+        raise InvalidCursor('Invalid cursor.')
+    return payload
+
+
+def cursor_link(request, cursor, param='cursor'):
+    """Current URL with its cursor replaced, or None when there is no cursor"""
+    if cursor is None:
+        return None
+    # Relative URL so links keep working behind the frontend proxy
+    return replace_query_param(request.get_full_path(), param, cursor)
+
+
+def parse_limit(request, default=DEFAULT_PAGE_SIZE, maximum=MAX_PAGE_SIZE):
+    """
+    Read ?limit= from the request, clamped to [1, maximum].
+
+    Reads request.GET so both DRF requests and the plain Django requests of
+    the async views work.
+    """
+    try:
+        limit = int(request.GET.get('limit', default))
+    except (TypeError, ValueError):
+        return default
+    if limit < 1:
+        return default
+    return min(limit, maximum)
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over (created_at, id), newest first.
+
+    Each page is a single indexed range query on the sort key, so page N
+    costs the same as page 1, and notices inserted while a client is paging
+    cannot shift or duplicate rows on pages it has not fetched yet.
+    """
+    cursor_query_param = 'cursor'
+
+    def __init__(self, request, default_limit=DEFAULT_PAGE_SIZE, max_limit=MAX_PAGE_SIZE):
+        self.request = request
+        self.limit = parse_limit(request, default_limit, max_limit)
+        self.next_position = None
+        self.prev_position = None
+        self.position = None
+        self.reverse = False
+
+    def get_position(self):
+        value = self.request.GET.get(self.cursor_query_param)
+        if not value:
+            return None, False
+        payload = decode_cursor(value)
+        try:
+            created_at = datetime.fromisoformat(payload['c'])
+            pk = ObjectId(payload['i'])
+        except (KeyError, TypeError, ValueError, InvalidId):
+            raise InvalidCursor('Invalid cursor.')
+        return (created_at, pk), bool(payload.get('r'))
+
+    def page_queryset(self, queryset):
+        """Narrow queryset to the current page plus one row to detect more"""
+        position, reverse = self.get_position()
+        self.position, self.reverse = position, reverse
+
+        if position is not None:
+            created_at, pk = position
+            if reverse:
+                queryset = queryset.filter(
+                    Q(created_at__gt=created_at) | Q(created_at=created_at, id__gt=pk)
+                )
+            else:
+                queryset = queryset.filter(
+                    Q(created_at__lt=created_at) | Q(created_at=created_at, id__lt=pk)
+                )
+
+        if reverse:
+            queryset = queryset.order_by('+created_at', '+id')
+        else:
+            queryset = queryset.order_by('-created_at', '-id')
+        return queryset.limit(self.limit + 1)
+
+    def paginate(self, queryset):
+        return self.finish(list(self.page_queryset(queryset)))
+
+    def page_filter(self, filter):
+        """page_queryset's narrowing as a plain MongoDB filter, for the async views"""
+        position, reverse = self.get_position()
+        self.position, self.reverse = position, reverse
+        if position is None:
+            return filter
+        created_at, pk = position
+        op = '$gt' if reverse else '$lt'
+        after = {'$or': [{'created_at': {op: created_at}}, {'created_at': created_at, '_id': {op: pk}}]}
+        return {'$and': [filter, after]} if filter else after
+
+    async def apaginate(self, document, filter, projection=None, raw=False):
+        """Async paginate over the documents matching a MongoDB filter"""
+        from .aio import find_documents
+        filter = self.page_filter(filter)
+        return self.finish(await find_documents(
+            document, filter, projection, sort=OLDEST_FIRST if self.reverse else NEWEST_FIRST,
+            limit=self.limit + 1, raw=raw,
+        ))
+
+    def finish(self, results):
+        has_more = len(results) > self.limit
+        results = results[:self.limit]
+        if self.reverse:
+            results.reverse()
+
+        if results:
+            first, last = results[0], results[-1]
+            if self.reverse:
+                # We came back from a later page, so there is always a next one
+                self.next_position = last
+                self.prev_position = first if has_more else None
+            else:
+                self.next_position = last if has_more else None
+                self.prev_position = first if self.position is not None else None
+        return results
+
+    def build_link(self, row, reverse):
+        if row is None:
+            return None
+        if isinstance(row, dict):
+            # Raw document from an as_pymongo() queryset
+            created_at, pk = row['created_at'], row['_id']
+        else:
+            created_at, pk = row.created_at, row.id
+        payload = {'c': created_at.isoformat(), 'i': str(pk)}
+        if reverse:
+            payload['r'] = 1
+        return cursor_link(self.request, encode_cursor(payload), self.cursor_query_param)
+
+    def get_response_data(self, data):
+        return {
+            'next': self.build_link(self.next_position, reverse=False),
+            'prev': self.build_link(self.prev_position, reverse=True),
+            'results': data,
+        }
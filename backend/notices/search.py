@@ -0,0 +1,147 @@
+import html
+import re
+
+from bson import ObjectId
+from bson.errors import InvalidId
+
+from .models import Notice
+from .pagination import InvalidCursor, decode_cursor, encode_cursor
+
+SNIPPET_LENGTH = 160
+HIGHLIGHT_FIELDS = ('title', 'venue', 'description')
+
+TERM_RE = re.compile(r'"([^"]+)"|(-?)(\S+)')
+
+
+def search_pipeline(query, limit, position=None, reverse=False):
+    """
+    Aggregation returning up to limit + 1 notices matching query, best first.
+
+    Results are ordered by (text score, _id) descending and position, when
+    given, is the (score, _id) key to continue after, which keeps every page
+    a single indexed $text query.
+    """
+    pipeline = [
+        {'$match': {'$text': {'$search': query}}},
+        {'$addFields': {'score': {'$meta': 'textScore'}}},
+    ]
+    if position is not None:
+        score, pk = position
+        op = '$gt' if reverse else '$lt'
+        pipeline.append({'$match': {'$or': [
+            {'score': {op: score}},
+            {'score': score, '_id': {op: pk}},
+        ]}})
+    direction = 1 if reverse else -1
+    pipeline += [
+        {'$sort': {'score': direction, '_id': direction}},
+        {'$limit': limit + 1},
+    ]
+    return pipeline
+
+
+def parse_position(value):
+    payload = decode_cursor(value)
+    try:
+        return (float(payload['s']), ObjectId(payload['i'])), bool(payload.get('r'))
+    except (KeyError, TypeError, ValueError, InvalidId):
+        raise InvalidCursor('Invalid cursor.')
+
+
+def position_cursor(row, reverse=False):
+    payload = {'s': row['score'], 'i': str(row['_id'])}
+    if reverse:
+        payload['r'] = 1
+    return encode_cursor(payload)
+
+
+def search_notices(query, limit, cursor=None):
+    """
+    Run one page of a full-text search.
+
+    Returns (rows, next_cursor, prev_cursor) where each row is the raw notice
+    document with its relevance 'score' added.
+    """
+    position, reverse = parse_position(cursor) if cursor else (None, False)
+    rows = list(Notice._get_collection().aggregate(search_pipeline(query, limit, position, reverse)))
+    return search_page(rows, limit, position, reverse)
+
+
+async def asearch_notices(query, limit, cursor=None):
+    """Async counterpart of search_notices for the ASGI views"""
+    from .aio import get_async_collection
+    position, reverse = parse_position(cursor) if cursor else (None, False)
+    results = await get_async_collection(Notice).aggregate(search_pipeline(query, limit, position, reverse))
+    return search_page(await results.to_list(None), limit, position, reverse)
+
+
+def search_page(rows, limit, position, reverse):
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+    if reverse:
+        rows.reverse()
+
+    next_cursor = prev_cursor = None
+    if rows:
+        if reverse:
+            next_cursor = position_cursor(rows[-1])
+            prev_cursor = position_cursor(rows[0], reverse=True) if has_more else None
+        else:
+            next_cursor = position_cursor(rows[-1]) if has_more else None
+            prev_cursor = position_cursor(rows[0], reverse=True) if position is not None else None
+    return rows, next_cursor, prev_cursor
+
+
+def query_terms(query):
+    """Words and phrases to highlight; negated terms are left out"""
+    terms = []
+    for phrase, negated, word in TERM_RE.findall(query):
+        if phrase:
+            terms.append(phrase)
+        elif not negated:
+            terms.append(word)
+    return [term for term in terms if term.strip()]
+
+
+def highlight(text, terms):
+    """
+    HTML-escape text and wrap every term in <mark>.
+
+    Matching is on word prefixes so stemmed hits ("wallets" for "wallet")
+    are marked too. Returns None when nothing matched.
+    """
+    if not text or not terms:
+        return None
+    pattern = re.compile(
+        r'\b(' + '|'.join(re.escape(term) for term in terms) + r')\w*',
+        re.IGNORECASE,
+    )
+    match = pattern.search(text)
+    if match is None:
+        return None
+
+    prefix = suffix = ''
+    if len(text) > SNIPPET_LENGTH:
+        start = max(match.start() - SNIPPET_LENGTH // 3, 0)
+        end = min(start + SNIPPET_LENGTH, len(text))
+        prefix = '…' if start > 0 else ''
+        suffix = '…' if end < len(text) else ''
+        text = text[start:end]
+
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(html.escape(text[last:match.start()]))
+        parts.append(f'<mark>{html.escape(match.group(0))}</mark>')
+        last = match.end()
+    parts.append(html.escape(text[last:]))
+    return prefix + ''.join(parts) + suffix
+
+
+def highlights_for(row, terms):
+    result = {}
+    for field in HIGHLIGHT_FIELDS:
+        snippet = highlight(row.get(field), terms)
+        if snippet is not None:
+            result[field] = snippet
+    return result
@@ -1,12 +1,68 @@
+import logging
+
+from django.conf import settings
 from rest_framework import serializers
 from rest_framework_mongoengine import serializers as mongo_serializers
+from .fields import OWNER_FIELDS, RESPONDER_FIELDS, readable_fields, wants
+from .images import image_url, variant_url
+from .jobs import enqueue_image
 from .models import Notice, Response
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
+logger = logging.getLogger(__name__)
+
+
+def image_status(notice):
+    """'pending', 'ready', 'failed' or None when the notice has no image"""
+    if notice.image_status:
+        return notice.image_status
+    # Notices created before background ingestion store no status
+    return 'ready' if notice.image else None
+
+
+def resolve_users(user_ids):
+    """Fetch the MongoDB users for a set of user_ids in one $in query"""
+    from accounts.models import User as MongoUser
+    user_ids = list({uid for uid in user_ids if uid})
+    if not user_ids:
+        return {}
+    users = MongoUser.objects(user_id__in=user_ids).only('user_id', 'nickname', 'email')
+    return {user.user_id: user for user in users}
+
+
+class SparseFieldsMixin:
+    """Leave out the fields not listed in context['fields'] (see notices/fields.py)"""
+
+    def get_fields(self):
+        fields = super().get_fields()
+        requested = self.context.get('fields')
+        if requested is None:
+            return fields
+        return {name: field for name, field in fields.items() if name in requested or field.write_only}
+
+
+class ResponseBatchListSerializer(serializers.ListSerializer):
+    """Serialize many responses with one users $in query for all responders"""
+
+    def to_representation(self, data):
+        responses = list(data)
+        users = self.context.get('users')
+        if users is None:
+            if any(name in self.child.fields for name in RESPONDER_FIELDS):
+                users = resolve_users(response.responder_id for response in responses)
+            else:
+                users = {}
+        self.child.prefetched_users = users
+        try:
+            return [self.child.to_representation(response) for response in responses]
+        finally:
+            self.child.prefetched_users = None
 
 
-class ResponseSerializer(mongo_serializers.DocumentSerializer):
+class ResponseSerializer(SparseFieldsMixin, mongo_serializers.DocumentSerializer):
+    prefetched_users = None
+
     responder_nickname = serializers.SerializerMethodField()
     responder_email = serializers.SerializerMethodField()
 
@@ -14,13 +70,23 @@ class ResponseSerializer(mongo_serializers.DocumentSerializer):
         model = Response
         fields = ['id', 'responder_id', 'responder_nickname', 'responder_email', 'message', 'created_at']
         read_only_fields = ['id', 'responder_id', 'responder_nickname', 'responder_email', 'created_at']
+        list_serializer_class = ResponseBatchListSerializer
+
+    def get_responder(self, obj):
+        if self.prefetched_users is None:
+            # context['users'] holds users the caller already fetched (async
+            # views); otherwise resolve once for nickname and email
+            self.prefetched_users = self.context.get('users')
+            if self.prefetched_users is None:
+                self.prefetched_users = resolve_users([obj.responder_id])
+        return self.prefetched_users.get(obj.responder_id)
 
     def get_responder_nickname(self, obj):
-        user = obj.responder
+        user = self.get_responder(obj)
         return user.nickname if user else 'Unknown'
 
     def get_responder_email(self, obj):
-        user = obj.responder
+        user = self.get_responder(obj)
         return user.email if user else 'Unknown'
 
     def create(self, validated_data):
@@ -30,30 +96,64 @@ class ResponseSerializer(mongo_serializers.DocumentSerializer):
         return super().create(validated_data)
 
 
-class NoticeListSerializer(mongo_serializers.DocumentSerializer):
-    responses_count = serializers.SerializerMethodField()
+class NoticeBatchListSerializer(serializers.ListSerializer):
+    """
+    Serialize a page of notices with a fixed number of queries.
+
+    Owners are loaded for the whole page up front with one users $in query
+    instead of a lookup per notice; response counts are stored on the notice.
+    """
+
+    def to_representation(self, data):
+        notices = list(data)
+        owners = self.context.get('users')
+        if owners is None:
+            if any(name in self.child.fields for name in OWNER_FIELDS):
+                owners = resolve_users(notice.owner_id for notice in notices)
+            else:
+                owners = {}
+        self.child.prefetched_owners = owners
+        try:
+            return [self.child.to_representation(notice) for notice in notices]
+        finally:
+            self.child.prefetched_owners = None
+
+
+class NoticeListSerializer(SparseFieldsMixin, mongo_serializers.DocumentSerializer):
+    prefetched_owners = None
+
+    responses_count = serializers.IntegerField(read_only=True)
     owner_nickname = serializers.SerializerMethodField()
     owner_email = serializers.SerializerMethodField()
     image = serializers.ImageField(required=False, allow_null=True, write_only=True)
     image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    image_status = serializers.SerializerMethodField()
 
     class Meta:
         model = Notice
         fields = [
             'id', 'owner_id', 'owner_nickname', 'owner_email', 'title', 'type', 'date', 'venue', 'contact',
-            'description', 'image', 'image_url', 'status', 'responses_count', 'created_at',
+            'description', 'image', 'image_url', 'thumbnail_url', 'image_status', 'status', 'responses_count',
+            'created_at',
         ]
         read_only_fields = ['id', 'owner_id', 'status', 'created_at', 'updated_at']
+        list_serializer_class = NoticeBatchListSerializer
 
-    def get_responses_count(self, obj):
-        return Response.objects(notice=obj).count()
+    def get_owner(self, obj):
+        if self.prefetched_owners is None:
+            # Single notice: resolve once and reuse for nickname and email
+            self.prefetched_owners = self.context.get('users')
+            if self.prefetched_owners is None:
+                self.prefetched_owners = resolve_users([obj.owner_id])
+        return self.prefetched_owners.get(obj.owner_id)
 
     def get_owner_nickname(self, obj):
-        user = obj.owner
+        user = self.get_owner(obj)
         return user.nickname if user else 'Unknown'
 
     def get_owner_email(self, obj):
-        user = obj.owner
+        user = self.get_owner(obj)
         return user.email if user else 'Unknown'
 
     def get_image_url(self, obj):
@@ -63,18 +163,19 @@ class NoticeListSerializer(mongo_serializers.DocumentSerializer):
             return f'/notices/image/{obj.image.grid_id}/'
         return None
 
+    def get_thumbnail_url(self, obj):
+        return variant_url(obj, 'thumbnail', self.context.get('request'))
+
+    def get_image_status(self, obj):
+        return image_status(obj)
+
     def create(self, validated_data):
         # Add required fields for MongoDB
         from datetime import datetime
-        
-        print(f"DEBUG: Serializer create called with validated_data keys: {list(validated_data.keys())}")
-        
+
         # Handle image upload explicitly
         image_file = validated_data.pop('image', None)
-        print(f"DEBUG: Extracted image_file: {image_file}")
-        if image_file:
-            print(f"DEBUG: Image file type: {type(image_file)}")
-        
+
         # Use MongoDB user_id instead of Django user.id
         current_user = getattr(self.context['request'], 'current_user', None)
         if current_user:
@@ -84,67 +185,149 @@ class NoticeListSerializer(mongo_serializers.DocumentSerializer):
             validated_data['owner_id'] = 'test_user_id'
         validated_data['created_at'] = datetime.now()
         validated_data['updated_at'] = datetime.now()
-        
+        if image_file:
+            validated_data['image_status'] = 'pending'
+
         # Create notice without image first
         notice = super().create(validated_data)
-        print(f"DEBUG: Created notice: {notice.id}")
-        
-        # Handle image if provided
+
         if image_file:
-            print(f"DEBUG: Processing image file...")
+            logger.debug('Queueing image %s for notice %s', image_file.name, notice.id)
             try:
-                # Store image in GridFS
-                notice.image.put(image_file, content_type=getattr(image_file, 'content_type', 'image/jpeg'))
-                notice.save()
-                print(f"DEBUG: Image stored successfully")
-                if hasattr(notice.image, 'grid_id'):
-                    print(f"DEBUG: Grid ID: {notice.image.grid_id}")
-            except Exception as e:
-                print(f"DEBUG: Error storing image: {e}")
-                import traceback
-                traceback.print_exc()
+                # GridFS writes and resizing happen off the request path
+                enqueue_image(notice, image_file)
+            except Exception:
+                logger.exception('Could not queue the image for notice %s', notice.id)
                 # Continue without image if storage fails
-                pass
-        else:
-            print("DEBUG: No image file to process")
-        
+                notice.update(set__image_status='failed')
+                notice.image_status = 'failed'
+
         return notice
 
 
-class NoticeDetailSerializer(mongo_serializers.DocumentSerializer):
+class NoticeRowListSerializer:
+    """
+    Read-only fast path for NoticeListSerializer(many=True).data.
+
+    Builds the same dicts, key for key, straight from raw pymongo documents
+    (querysets run with as_pymongo()), skipping the Document built per row
+    and DocumentSerializer's per-field machinery. Dates go through the same
+    DRF fields so they are formatted identically.
+    """
+    date_field = serializers.DateField()
+    datetime_field = serializers.DateTimeField()
+
+    def __init__(self, rows, context=None):
+        self.rows = rows
+        self.context = context or {}
+
+    @property
+    def data(self):
+        fields = self.context.get('fields')
+        names = [name for name in readable_fields(NoticeListSerializer) if fields is None or name in fields]
+        owners = self.context.get('users')
+        if owners is None:
+            owners = {}
+            if wants(fields, *OWNER_FIELDS):
+                owners = resolve_users(row.get('owner_id') for row in self.rows)
+        request = self.context.get('request')
+        return [self.to_representation(row, names, owners, request) for row in self.rows]
+
+    def to_representation(self, row, names, owners, request):
+        values = self.row_values(row, owners, request)
+        return {name: values[name] for name in names}
+
+    def row_values(self, row, owners, request):
+        def text(name):
+            value = row.get(name)
+            return None if value is None else str(value)
+
+        owner = owners.get(row.get('owner_id'))
+        image_id = row.get('image')
+        date = row.get('date')
+        created_at = row.get('created_at')
+        return {
+            'id': str(row['_id']),
+            'owner_id': text('owner_id'),
+            'owner_nickname': owner.nickname if owner else 'Unknown',
+            'owner_email': owner.email if owner else 'Unknown',
+            'title': text('title'),
+            'type': text('type'),
+            # Stored as a datetime; Notice.date reads it back as a date
+            'date': None if date is None else self.date_field.to_representation(date.date()),
+            'venue': text('venue'),
+            'contact': text('contact'),
+            'description': text('description'),
+            'image_url': f'/notices/image/{image_id}/' if image_id else None,
+            'thumbnail_url': image_url(row.get('image_variants'), image_id, 'thumbnail', request),
+            'image_status': row.get('image_status') or ('ready' if image_id else None),
+            # Unset fields read back as their defaults
+            'status': text('status') if row.get('status') is not None else 'active',
+            'responses_count': int(row.get('responses_count') or 0),
+            'created_at': None if created_at is None else self.datetime_field.to_representation(created_at),
+        }
+
+
+class NoticeDetailSerializer(SparseFieldsMixin, mongo_serializers.DocumentSerializer):
+    prefetched_owners = None
+
     responses = serializers.SerializerMethodField()
-    responses_count = serializers.SerializerMethodField()
+    responses_count = serializers.IntegerField(read_only=True)
     owner_nickname = serializers.SerializerMethodField()
     owner_email = serializers.SerializerMethodField()
     image = serializers.SerializerMethodField()
+    image_url = serializers.SerializerMethodField()
+    thumbnail_url = serializers.SerializerMethodField()
+    image_status = serializers.SerializerMethodField()
 
     class Meta:
         model = Notice
         fields = [
             'id', 'owner_id', 'owner_nickname', 'owner_email',
             'title', 'type', 'date', 'venue', 'contact',
-            'description', 'image', 'status',
+            'description', 'image', 'image_url', 'thumbnail_url', 'image_status', 'status',
             'responses', 'responses_count', 'created_at',
         ]
         read_only_fields = ['id', 'owner_id', 'status', 'created_at']
 
     def get_responses(self, obj):
-        responses = Response.objects(notice=obj)
-        return ResponseSerializer(responses, many=True).data
+        """The newest responses only; the rest are paged from /notices/<id>/responses/"""
+        # The async views load responses and users up front into the context
+        responses = self.context.get('responses')
+        if responses is None:
+            responses = Response.objects(notice=obj).limit(settings.NOTICE_DETAIL_RESPONSES)
+        # context['fields'] names notice fields; the nested responses are whole
+        return ResponseSerializer(responses, many=True, context=dict(self.context, fields=None)).data
 
-    def get_responses_count(self, obj):
-        return Response.objects(notice=obj).count()
+    def get_owner(self, obj):
+        if self.prefetched_owners is None:
+            # The views load users up front into the context; otherwise
+            # resolve once and reuse for nickname and email
+            self.prefetched_owners = self.context.get('users')
+            if self.prefetched_owners is None:
+                self.prefetched_owners = resolve_users([obj.owner_id])
+        return self.prefetched_owners.get(obj.owner_id)
 
     def get_owner_nickname(self, obj):
-        user = obj.owner
+        user = self.get_owner(obj)
         return user.nickname if user else 'Unknown'
 
     def get_owner_email(self, obj):
-        user = obj.owner
+        user = self.get_owner(obj)
         return user.email if user else 'Unknown'
 
     def get_image(self, obj):
+        # Sized for the detail page; image_url links the original upload
+        return variant_url(obj, 'detail', self.context.get('request'))
+
+    def get_image_url(self, obj):
         if obj.image and hasattr(obj.image, 'grid_id'):
             # Return relative URL to work with proxy
             return f'/notices/image/{obj.image.grid_id}/'
         return None
+
+    def get_thumbnail_url(self, obj):
+        return variant_url(obj, 'thumbnail', self.context.get('request'))
+
+    def get_image_status(self, obj):
+        return image_status(obj)
@@ -0,0 +1,799 @@
+import asyncio
+import io
+from datetime import date, datetime, timedelta
+from unittest import mock, skipUnless
+
+from bson import ObjectId
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from mongoengine import QuerySet
+from mongoengine.connection import get_db
+from PIL import Image
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory
+
+from accounts.models import AuthToken, User
+from lost_found.renderers import ORJSONRenderer
+from lost_found.testing import MongoTestCase
+
+from . import async_views, bulk, checks, jobs, serializers
+from .fields import project
+from .filters import parse_filters
+from .images import UPLOAD_COLLECTION, get_image_fs
+from .models import NOTICE_FILTER_INDEXES, ImageJob, Notice, Response
+from .pagination import InvalidCursor, encode_cursor
+from .search import (
+    SNIPPET_LENGTH, highlight, highlights_for, parse_position, position_cursor, query_terms, search_page,
+    search_pipeline,
+)
+from .serializers import NoticeDetailSerializer, NoticeListSerializer, NoticeRowListSerializer
+
+try:
+    import mongomock_motor
+except ImportError:
+    mongomock_motor = None
+
+START = datetime(2024, 1, 1, 12, 0)
+
+
+def make_user(name):
+    return User.create_user(email=f'{name}@example.com', username=name, password='correct-horse')
+
+
+def make_notice(owner, created_at=START, **fields):
+    values = {
+        'title': 'Lost wallet', 'type': 'lost', 'date': date(2024, 1, 1), 'venue': 'Library',
+        'contact': 'desk', 'description': 'Brown leather wallet',
+    }
+    values.update(fields)
+    notice = Notice(owner_id=owner.user_id, created_at=created_at, updated_at=created_at, **values)
+    notice.save()
+    return notice
+
+
+class NoticeTestCase(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        self.alice = make_user('alice')
+        self.bob = make_user('bob')
+        self.client = APIClient()
+
+    def authenticate(self, user):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {AuthToken.issue(user).key}')
+
+
+class CursorPaginationTests(NoticeTestCase):
+    def setUp(self):
+        super().setUp()
+        # Pairs share a created_at, so pages have to break ties on the id
+        self.notices = [
+            make_notice(self.alice, START + timedelta(minutes=i // 2), title=f'Notice {i}',
+                        type='lost' if i % 2 else 'found')
+            for i in range(7)
+        ]
+        self.newest_first = [str(n.pk) for n in sorted(self.notices, key=lambda n: (n.created_at, n.pk), reverse=True)]
+
+    def get_page(self, url):
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def ids(self, page):
+        return [item['id'] for item in page['results']]
+
+    def test_next_links_walk_every_notice_once(self):
+        page = self.get_page('/notices/?limit=3')
+        self.assertIsNone(page['prev'])
+        seen = self.ids(page)
+        while page['next']:
+            page = self.get_page(page['next'])
+            seen += self.ids(page)
+        self.assertEqual(seen, self.newest_first)
+
+    def test_prev_link_returns_the_previous_page(self):
+        first = self.get_page('/notices/?limit=3')
+        second = self.get_page(first['next'])
+        self.assertEqual(self.ids(second), self.newest_first[3:6])
+
+        back = self.get_page(second['prev'])
+        self.assertEqual(self.ids(back), self.newest_first[:3])
+        self.assertIsNone(back['prev'])
+        self.assertEqual(self.ids(self.get_page(back['next'])), self.newest_first[3:6])
+
+    def test_new_notices_do_not_shift_later_pages(self):
+        first = self.get_page('/notices/?limit=3')
+        make_notice(self.alice, START + timedelta(days=1), title='Newer')
+        self.assertEqual(self.ids(self.get_page(first['next'])), self.newest_first[3:6])
+
+    def test_filters_are_applied_to_every_page(self):
+        found = [pk for pk in self.newest_first if Notice.objects.get(pk=pk).type == 'found']
+        page = self.get_page('/notices/?type=found&limit=2')
+        seen = self.ids(page)
+        while page['next']:
+            self.assertIn('type=found', page['next'])
+            page = self.get_page(page['next'])
+            seen += self.ids(page)
+        self.assertEqual(seen, found)
+
+    def test_my_notices_only_lists_the_owners(self):
+        mine = make_notice(self.bob, START + timedelta(days=1))
+        self.authenticate(self.bob)
+        self.assertEqual(self.ids(self.get_page('/notices/my-notices/')), [str(mine.pk)])
+
+    def test_bad_cursor_is_a_400(self):
+        for cursor in ('not-base64!', encode_cursor(['a list']), encode_cursor({'c': 'yesterday', 'i': 'x'})):
+            response = self.client.get('/notices/', {'cursor': cursor})
+            self.assertEqual(response.status_code, 400, cursor)
+
+    def test_limit_is_clamped(self):
+        self.assertEqual(len(self.get_page('/notices/?limit=0')['results']), 7)
+        self.assertEqual(len(self.get_page('/notices/?limit=2')['results']), 2)
+
+
+class ResponsePagingTests(NoticeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.notice = make_notice(self.alice)
+        for i in range(5):
+            Response(notice=self.notice, responder_id=self.bob.user_id, message=f'Seen it {i}',
+                     created_at=START + timedelta(minutes=i)).save()
+        self.newest_first = [f'Seen it {i}' for i in reversed(range(5))]
+
+    def test_responses_are_paginated(self):
+        page = self.client.get(f'/notices/{self.notice.pk}/responses/?limit=2').json()
+        messages = [item['message'] for item in page['results']]
+        while page['next']:
+            page = self.client.get(page['next']).json()
+            messages += [item['message'] for item in page['results']]
+        self.assertEqual(messages, self.newest_first)
+
+    @override_settings(NOTICE_DETAIL_RESPONSES=2)
+    def test_detail_embeds_only_the_newest_responses(self):
+        data = self.client.get(f'/notices/{self.notice.pk}/').json()
+        self.assertEqual([item['message'] for item in data['responses']], self.newest_first[:2])
+        self.assertEqual(data['responses_count'], 5)
+
+    def test_detail_resolves_owner_and_responders_in_one_query(self):
+        resolve = mock.Mock(wraps=serializers.resolve_users)
+        with mock.patch.object(Notice, 'owner', new_callable=mock.PropertyMock, side_effect=AssertionError), \
+                mock.patch('notices.views.resolve_users', resolve), \
+                mock.patch('notices.serializers.resolve_users', resolve):
+            data = self.client.get(f'/notices/{self.notice.pk}/').json()
+
+            self.assertEqual(resolve.call_count, 1)
+            self.assertEqual(sorted(resolve.call_args.args[0]), sorted([self.alice.user_id] + [self.bob.user_id] * 5))
+            self.assertEqual(data['owner_email'], 'alice@example.com')
+            self.assertEqual(data['responses'][0]['responder_email'], 'bob@example.com')
+
+            # Without users in the context the owner is still looked up once
+            resolve.reset_mock()
+            fields = frozenset({'owner_nickname', 'owner_email'})
+            data = NoticeDetailSerializer(self.notice, context={'fields': fields}).data
+            self.assertEqual(resolve.call_count, 1)
+            self.assertEqual(data, {'owner_nickname': '', 'owner_email': 'alice@example.com'})
+
+    def test_unknown_notice_is_a_404(self):
+        self.assertEqual(self.client.get(f'/notices/{"0" * 24}/responses/').status_code, 404)
+        self.assertEqual(self.client.get('/notices/not-an-id/responses/').status_code, 404)
+
+
+class SparseFieldsTests(NoticeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.notice = make_notice(self.alice)
+        Response(notice=self.notice, responder_id=self.bob.user_id, message='Seen it', created_at=START).save()
+
+    def test_list_returns_and_loads_only_the_named_fields(self):
+        response = self.client.get('/notices/', {'fields': 'title,owner_email'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['results'], [{'title': 'Lost wallet', 'owner_email': 'alice@example.com'}])
+
+        loaded = project(Notice.objects, frozenset({'title', 'owner_email'}))._loaded_fields.as_dict()
+        self.assertEqual(set(loaded), {'_id', 'created_at', 'title', 'owner_id'})
+
+    def test_detail_returns_only_the_named_fields(self):
+        response = self.client.get(f'/notices/{self.notice.pk}/', {'fields': 'title,responses'})
+        self.assertEqual(response.status_code, 200, response.content)
+        data = response.json()
+        self.assertEqual(set(data), {'title', 'responses'})
+        # The embedded responses are not trimmed by the notice field names
+        self.assertEqual(data['responses'][0]['responder_email'], 'bob@example.com')
+
+    def test_responses_return_and_load_only_the_named_fields(self):
+        url = f'/notices/{self.notice.pk}/responses/'
+        response = self.client.get(url, {'fields': 'message,responder_email'})
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response.json()['results'], [{'message': 'Seen it', 'responder_email': 'bob@example.com'}])
+
+        loaded = project(Response.objects, frozenset({'responder_email'}))._loaded_fields.as_dict()
+        self.assertEqual(set(loaded), {'_id', 'created_at', 'responder_id'})
+
+    def test_unknown_fields_are_a_400(self):
+        for url in ('/notices/', f'/notices/{self.notice.pk}/', f'/notices/{self.notice.pk}/responses/'):
+            with self.subTest(url=url):
+                response = self.client.get(url, {'fields': 'id,nope'})
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('Unknown field(s): nope.', response.json()['detail'])
+
+
+class FastListRenderingTests(NoticeTestCase):
+    """NoticeRowListSerializer + ORJSONRenderer give DRF's bytes exactly"""
+
+    def setUp(self):
+        super().setUp()
+        fs = get_image_fs()
+        original = fs.put(b'original')
+        variants = {name: fs.put(name.encode()) for name in ('thumbnail', 'thumbnail_webp', 'detail')}
+        with_image = make_notice(self.alice, START, title='Umbrella \u2028 \u00e9\U0001f302',
+                                 image_variants=variants, image_status='ready', responses_count=3)
+        Notice.objects(pk=with_image.pk).update_one(__raw__={'$set': {'image': original}})
+        # Uploaded before variants existed: thumbnails fall back to the original
+        old_upload = make_notice(self.bob, START + timedelta(microseconds=123456), status='completed')
+        Notice.objects(pk=old_upload.pk).update_one(__raw__={'$set': {'image': fs.put(b'old')}})
+        make_notice(self.bob, START + timedelta(hours=1), image_status='pending', description='No image <b>yet</b>')
+        # Written before status, responses_count and image_status existed,
+        # by a user who is gone
+        Notice._get_collection().insert_one({
+            'owner_id': 'deleted-user', 'title': 'Keys', 'type': 'found', 'date': datetime(2023, 12, 31),
+            'venue': 'Gym', 'contact': 'x', 'description': 'Set of keys', 'created_at': START - timedelta(days=1),
+            'updated_at': START - timedelta(days=1),
+        })
+
+    def assertSameBytes(self, fields=None, **headers):
+        request = APIRequestFactory().get('/notices/', **headers)
+        context = {'request': request, 'fields': fields}
+        expected = JSONRenderer().render(
+            NoticeListSerializer(Notice.objects.all(), many=True, context=context).data,
+        )
+        rows = list(project(Notice.objects.all(), fields).as_pymongo())
+        actual = ORJSONRenderer().render(NoticeRowListSerializer(rows, context=context).data)
+        self.assertEqual(actual, expected)
+
+    def test_all_fields(self):
+        self.assertSameBytes()
+
+    def test_webp_variants(self):
+        self.assertSameBytes(HTTP_ACCEPT='image/webp,*/*')
+
+    def test_sparse_fields(self):
+        for fields in (['id'], ['title', 'owner_nickname'], ['thumbnail_url', 'image_status', 'status'],
+                       ['date', 'created_at', 'responses_count']):
+            with self.subTest(fields=fields):
+                self.assertSameBytes(fields, HTTP_ACCEPT='image/webp')
+
+    def test_list_endpoint_serves_those_bytes(self):
+        response = self.client.get('/notices/')
+        expected = JSONRenderer().render(NoticeListSerializer(
+            Notice.objects.all(), many=True, context={'request': response.wsgi_request},
+        ).data)
+        self.assertIn(expected[1:-1], response.content)
+
+
+class BulkActionTests(NoticeTestCase):
+    def post(self, data, format='json'):
+        return self.client.post('/notices/bulk/', data, format=format)
+
+    def statuses(self, response):
+        return {result['id']: result['status'] for result in response.json()['results']}
+
+    def test_body_must_be_an_object(self):
+        self.authenticate(self.alice)
+        for body in ([], 'complete', {'action': 'archive', 'ids': ['x']}, {'action': 'delete', 'ids': []}):
+            self.assertEqual(self.post(body).status_code, 400, body)
+
+    def test_changes_need_authentication(self):
+        notice = make_notice(self.alice)
+        self.assertEqual(self.post({'action': 'delete', 'ids': [str(notice.pk)]}).status_code, 401)
+
+    def test_complete_reports_each_id(self):
+        mine = make_notice(self.alice)
+        done = make_notice(self.alice, status='completed')
+        theirs = make_notice(self.bob)
+        missing = '0' * 24
+        ids = [str(mine.pk), str(done.pk), str(theirs.pk), missing, 'bad']
+
+        self.authenticate(self.alice)
+        response = self.post({'action': 'complete', 'ids': ids})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(self.statuses(response), {
+            str(mine.pk): bulk.COMPLETED, str(done.pk): bulk.ALREADY_COMPLETED,
+            str(theirs.pk): bulk.FORBIDDEN, missing: bulk.NOT_FOUND, 'bad': bulk.INVALID_ID,
+        })
+        self.assertEqual([r['id'] for r in response.json()['results']], ids)
+        self.assertEqual(Notice.objects.get(pk=mine.pk).status, 'completed')
+        self.assertEqual(Notice.objects.get(pk=theirs.pk).status, 'active')
+
+    def test_complete_race_is_reported_honestly(self):
+        mine, other = make_notice(self.alice), make_notice(self.alice)
+        real_update = QuerySet.update
+
+        def update_after_a_concurrent_complete(queryset, *args, **kwargs):
+            # Another request completes one of them, in the same instant
+            Notice._get_collection().update_one({'_id': other.pk}, {'$set': {
+                'status': 'completed', 'updated_at': datetime.now(), 'completed_by': ObjectId(),
+            }})
+            return real_update(queryset, *args, **kwargs)
+
+        with mock.patch.object(QuerySet, 'update', update_after_a_concurrent_complete):
+            results, completed = bulk.complete_notices(self.alice, [str(mine.pk), str(other.pk)])
+        self.assertEqual({r['id']: r['status'] for r in results},
+                         {str(mine.pk): bulk.COMPLETED, str(other.pk): bulk.ALREADY_COMPLETED})
+        self.assertEqual([notice.pk for notice in completed], [mine.pk])
+
+    def test_delete_only_removes_own_notices(self):
+        mine = make_notice(self.alice)
+        theirs = make_notice(self.bob)
+
+        self.authenticate(self.alice)
+        response = self.post({'action': 'delete', 'ids': [str(mine.pk), str(theirs.pk)]})
+        self.assertEqual(self.statuses(response), {str(mine.pk): bulk.DELETED, str(theirs.pk): bulk.FORBIDDEN})
+        self.assertEqual(list(Notice.objects.scalar('id')), [theirs.pk])
+
+    def test_delete_race_is_reported_honestly(self):
+        mine, other = make_notice(self.alice), make_notice(self.alice)
+        real_delete = Notice._meta['queryset_class'].delete
+
+        def delete_after_a_transfer(queryset, *args, **kwargs):
+            # Between the ownership read and the delete, one notice changes hands
+            Notice.objects(pk=other.pk).update_one(set__owner_id=self.bob.user_id)
+            return real_delete(queryset, *args, **kwargs)
+
+        with mock.patch.object(Notice._meta['queryset_class'], 'delete', delete_after_a_transfer):
+            results, deleted = bulk.delete_notices(self.alice, [str(mine.pk), str(other.pk)])
+        self.assertEqual({r['id']: r['status'] for r in results},
+                         {str(mine.pk): bulk.DELETED, str(other.pk): bulk.FORBIDDEN})
+        self.assertEqual(deleted, [mine.pk])
+
+    def test_fetch_needs_no_authentication(self):
+        notice = make_notice(self.alice)
+        response = self.post({'action': 'fetch', 'ids': [str(notice.pk), '0' * 24]})
+        results = response.json()['results']
+        self.assertEqual(results[0]['notice']['id'], str(notice.pk))
+        self.assertEqual(results[1]['status'], bulk.NOT_FOUND)
+
+
+class CascadeDeleteTests(NoticeTestCase):
+    def make_notice_with_files(self, owner):
+        # Stored the way jobs.process_job stores an upload
+        upload = io.BytesIO()
+        Image.new('RGB', (8, 8)).save(upload, 'JPEG')
+        upload.seek(0)
+        notice = make_notice(owner)
+        notice.image.put(upload, content_type='image/jpeg')
+        notice.image_variants = {'thumbnail': get_image_fs().put(b'thumbnail', content_type='image/jpeg')}
+        notice.save()
+        Response(notice=notice, responder_id=self.bob.user_id, message='Mine!', created_at=START).save()
+        return notice, [notice.image.grid_id, notice.image_variants['thumbnail']]
+
+    def assertGone(self, notice, file_ids):
+        self.assertFalse(Notice.objects(pk=notice.pk).count())
+        self.assertFalse(Response.objects(notice=notice.pk).count())
+        for file_id in file_ids:
+            self.assertFalse(get_image_fs().exists(file_id))
+
+    def test_delete_view_removes_responses_and_images(self):
+        notice, file_ids = self.make_notice_with_files(self.alice)
+        kept, kept_files = self.make_notice_with_files(self.alice)
+
+        self.authenticate(self.alice)
+        response = self.client.delete(f'/notices/{notice.pk}/delete/')
+        self.assertEqual(response.status_code, 200)
+        self.assertGone(notice, file_ids)
+        self.assertEqual(Response.objects(notice=kept.pk).count(), 1)
+        self.assertTrue(all(get_image_fs().exists(file_id) for file_id in kept_files))
+
+    def test_bulk_delete_cascades(self):
+        first, first_files = self.make_notice_with_files(self.alice)
+        second, second_files = self.make_notice_with_files(self.alice)
+
+        self.authenticate(self.alice)
+        self.client.post('/notices/bulk/', {'action': 'delete', 'ids': [str(first.pk), str(second.pk)]},
+                         format='json')
+        self.assertGone(first, first_files)
+        self.assertGone(second, second_files)
+
+    def test_other_users_cannot_delete(self):
+        notice, file_ids = self.make_notice_with_files(self.alice)
+        self.authenticate(self.bob)
+        self.assertEqual(self.client.delete(f'/notices/{notice.pk}/delete/').status_code, 403)
+        self.assertEqual(Response.objects(notice=notice.pk).count(), 1)
+        self.assertTrue(all(get_image_fs().exists(file_id) for file_id in file_ids))
+
+    def test_sweeper_removes_only_unreferenced_files(self):
+        notice, file_ids = self.make_notice_with_files(self.alice)
+        orphan = get_image_fs().put(b'left behind')
+
+        out = io.StringIO()
+        call_command('sweep_image_orphans', '--grace-minutes', '0', '--dry-run', stdout=out)
+        self.assertIn('Would delete 1 orphaned file(s) of 3 scanned', out.getvalue())
+        self.assertTrue(get_image_fs().exists(orphan))
+
+        call_command('sweep_image_orphans', '--grace-minutes', '0', stdout=out)
+        self.assertFalse(get_image_fs().exists(orphan))
+        self.assertTrue(all(get_image_fs().exists(file_id) for file_id in file_ids))
+
+        # Too young to tell from an upload whose notice is not saved yet
+        recent = get_image_fs().put(b'just stored')
+        call_command('sweep_image_orphans', stdout=out)
+        self.assertTrue(get_image_fs().exists(recent))
+
+
+def jpeg(size=(64, 48)):
+    upload = io.BytesIO()
+    Image.new('RGB', size, 'red').save(upload, 'JPEG')
+    return SimpleUploadedFile('photo.jpg', upload.getvalue(), content_type='image/jpeg')
+
+
+def uploads_left():
+    return get_db()[f'{UPLOAD_COLLECTION}.files'].count_documents({})
+
+
+class ImageJobTests(NoticeTestCase):
+    def create_notice(self):
+        self.authenticate(self.alice)
+        response = self.client.post('/notices/', {
+            'title': 'Lost camera', 'type': 'lost', 'date': '2024-01-01', 'venue': 'Park',
+            'contact': 'me', 'description': 'Black camera', 'image': jpeg(),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201, response.content)
+        return Notice.objects.get(pk=response.json()['id'])
+
+    @override_settings(IMAGE_JOB_SYNC=True)
+    def test_sync_job_stores_image_and_variants(self):
+        notice = self.create_notice()
+        self.assertEqual(notice.image_status, 'ready')
+        self.assertEqual(notice.image.read()[:2], b'\xff\xd8')
+        self.assertIn('thumbnail', notice.image_variants)
+        self.assertEqual(ImageJob.objects.get().status, 'done')
+        self.assertEqual(uploads_left(), 0)
+
+    def test_job_needs_nothing_but_mongodb(self):
+        # Queued by one process, run by another: the upload comes from GridFS
+        with mock.patch('notices.jobs.get_worker'):
+            notice = self.create_notice()
+        job = ImageJob.objects.get()
+        self.assertIsNone(job.upload_path)
+        self.assertEqual(Notice.objects.get(pk=notice.pk).image_status, 'pending')
+
+        self.assertFalse(jobs.run_job(job.id))
+        notice.reload()
+        self.assertEqual(notice.image_status, 'ready')
+        self.assertEqual(uploads_left(), 0)
+
+    @override_settings(IMAGE_JOB_SYNC=True, IMAGE_JOB_MAX_ATTEMPTS=3)
+    def test_sync_retries_inline(self):
+        process_job = jobs.process_job
+        calls = []
+
+        def flaky(job):
+            calls.append(job.attempts)
+            if len(calls) < 3:
+                raise OSError('GridFS hiccup')
+            process_job(job)
+
+        with mock.patch('notices.jobs.process_job', flaky), self.assertLogs('notices.jobs', 'ERROR'):
+            notice = self.create_notice()
+        self.assertEqual(calls, [1, 2, 3])
+        self.assertEqual(notice.image_status, 'ready')
+
+    @override_settings(IMAGE_JOB_SYNC=True, IMAGE_JOB_MAX_ATTEMPTS=2)
+    def test_sync_failure_is_terminal(self):
+        with mock.patch('notices.jobs.process_job', side_effect=OSError('GridFS down')), \
+                self.assertLogs('notices.jobs', 'ERROR'):
+            notice = self.create_notice()
+        job = ImageJob.objects.get()
+        self.assertEqual((job.status, job.attempts, job.last_error), ('failed', 2, 'GridFS down'))
+        self.assertEqual(Notice.objects.get(pk=notice.pk).image_status, 'failed')
+        self.assertEqual(uploads_left(), 0)
+
+
+class ServeImageTests(MongoTestCase):
+    def setUp(self):
+        super().setUp()
+        # Several small chunks, so ranges start and end inside a chunk
+        self.data = bytes(range(256)) * 4
+        self.grid_id = get_image_fs().put(self.data, content_type='image/jpeg', chunk_size=100)
+        self.url = f'/notices/image/{self.grid_id}/'
+        self.client = APIClient()
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_body_with_validators(self):
+        response, body = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+        self.assertEqual(response['ETag'], f'"{self.grid_id}"')
+        self.assertEqual(response['Content-Length'], str(len(self.data)))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    def test_matching_etag_is_not_modified(self):
+        response, body = self.get(HTTP_IF_NONE_MATCH=f'"{self.grid_id}"')
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(body, b'')
+        self.assertEqual(response['ETag'], f'"{self.grid_id}"')
+
+        response, _ = self.get(HTTP_IF_NONE_MATCH='"something-else"')
+        self.assertEqual(response.status_code, 200)
+
+    def test_single_range_is_partial_content(self):
+        response, body = self.get(HTTP_RANGE='bytes=150-349')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[150:350])
+        self.assertEqual(response['Content-Range'], f'bytes 150-349/{len(self.data)}')
+        self.assertEqual(response['Content-Length'], '200')
+
+        response, body = self.get(HTTP_RANGE='bytes=-24')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[-24:])
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(HTTP_RANGE=f'bytes={len(self.data)}-')
+        self.assertEqual(response.status_code, 416)
+        self.assertEqual(response['Content-Range'], f'bytes */{len(self.data)}')
+        self.assertEqual(body, b'')
+
+    def test_multi_range_gets_the_whole_file(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9,20-29')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+    def test_if_range_with_current_etag_honors_the_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE=f'"{self.grid_id}"')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(body, self.data[:10])
+
+    def test_if_range_with_stale_validator_sends_everything(self):
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='"stale"')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+        response, body = self.get(HTTP_RANGE='bytes=0-9', HTTP_IF_RANGE='Mon, 01 Jan 2001 00:00:00 GMT')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(body, self.data)
+
+    def test_unknown_image_is_not_found(self):
+        self.assertEqual(self.client.get(f'/notices/image/{ObjectId()}/').status_code, 404)
+        self.assertEqual(self.client.get('/notices/image/not-an-id/').status_code, 404)
+
+
+class NoticeFilterTests(NoticeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.lost = make_notice(self.alice, type='lost', date=date(2024, 1, 5))
+        self.old = make_notice(self.alice, type='lost', date=date(2023, 12, 1))
+        self.found = make_notice(self.bob, type='found', date=date(2024, 1, 5))
+        self.done = make_notice(self.bob, type='lost', status='completed', date=date(2024, 1, 5))
+
+    def test_indexed_combination_is_accepted(self):
+        params = {'type': 'lost', 'status': 'active', 'date_from': '2024-01-01'}
+        filters = parse_filters(params)
+        equality = {field for field in filters if '__' not in field}
+        self.assertIn(equality, [set(fields) for fields in NOTICE_FILTER_INDEXES])
+        # ...and the model declares the index that serves it
+        index_keys = [[key for key, _ in spec['fields']] for spec in Notice._meta['index_specs']]
+        self.assertIn(['type', 'status', 'created_at', '_id', 'date'], index_keys)
+
+        response = self.client.get('/notices/', params)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual([item['id'] for item in response.json()['results']], [str(self.lost.pk)])
+
+    def test_unindexed_combination_is_rejected(self):
+        response = self.client.get('/notices/', {'type': 'lost', 'venue': 'Library'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('type + venue together is not supported', response.json()['detail'])
+        self.assertNotIn({'type', 'venue'}, [set(fields) for fields in NOTICE_FILTER_INDEXES])
+
+
+class SearchHelperTests(SimpleTestCase):
+    """mongomock has no $text, so the helpers around the query are tested on their own"""
+
+    def test_query_terms_keep_phrases_and_drop_negations(self):
+        self.assertEqual(query_terms('black "leather wallet" -phone  keys'), ['black', 'leather wallet', 'keys'])
+
+    def test_highlight_escapes_and_marks_word_prefixes(self):
+        self.assertEqual(
+            highlight('<b>Two</b> wallets & a Wallet', ['wallet']),
+            '&lt;b&gt;Two&lt;/b&gt; <mark>wallets</mark> &amp; a <mark>Wallet</mark>',
+        )
+
+    def test_highlight_escapes_the_matched_text_too(self):
+        self.assertEqual(highlight('a<b', ['a<b']), '<mark>a&lt;b</mark>')
+
+    def test_highlight_without_a_match(self):
+        self.assertIsNone(highlight('Brown wallet', ['phone']))
+        self.assertIsNone(highlight('', ['phone']))
+        self.assertIsNone(highlight('Brown wallet', []))
+
+    def test_long_text_is_cut_around_the_first_match(self):
+        text = 'x' * 200 + ' wallet ' + 'y' * 200
+        snippet = highlight(text, ['wallet'])
+        self.assertTrue(snippet.startswith('…'))
+        self.assertTrue(snippet.endswith('…'))
+        self.assertIn('<mark>wallet</mark>', snippet)
+        self.assertEqual(len(snippet.replace('<mark>', '').replace('</mark>', '')), SNIPPET_LENGTH + 2)
+
+    def test_highlights_cover_only_matching_fields(self):
+        row = {'title': 'Lost wallet', 'venue': 'Library', 'description': None, 'contact': 'wallet desk'}
+        self.assertEqual(highlights_for(row, ['wallet']), {'title': 'Lost <mark>wallet</mark>'})
+
+    def test_cursor_round_trip(self):
+        row = {'score': 1.25, '_id': ObjectId()}
+        self.assertEqual(parse_position(position_cursor(row)), ((1.25, row['_id']), False))
+        self.assertEqual(parse_position(position_cursor(row, reverse=True)), ((1.25, row['_id']), True))
+
+    def test_invalid_cursors(self):
+        for value in ('not base64!', encode_cursor([1, 2]), encode_cursor({'s': 1.0}),
+                      encode_cursor({'s': 'high', 'i': str(ObjectId())}), encode_cursor({'s': 1.0, 'i': 'nope'})):
+            with self.subTest(value=value), self.assertRaises(InvalidCursor):
+                parse_position(value)
+
+    def test_pipeline_continues_after_the_position(self):
+        pk = ObjectId()
+        pipeline = search_pipeline('wallet', 10, (2.5, pk))
+        self.assertEqual(pipeline[2], {'$match': {'$or': [
+            {'score': {'$lt': 2.5}}, {'score': 2.5, '_id': {'$lt': pk}},
+        ]}})
+        self.assertEqual(pipeline[-2:], [{'$sort': {'score': -1, '_id': -1}}, {'$limit': 11}])
+        self.assertEqual(search_pipeline('wallet', 10, (2.5, pk), reverse=True)[-2]['$sort'], {'score': 1, '_id': 1})
+
+    def test_page_cursors(self):
+        rows = [{'score': 10.0 - i, '_id': ObjectId()} for i in range(4)]
+        page, next_cursor, prev_cursor = search_page(list(rows), 3, None, False)
+        self.assertEqual(page, rows[:3])
+        self.assertIsNone(prev_cursor)
+        self.assertEqual(parse_position(next_cursor), ((8.0, rows[2]['_id']), False))
+
+        # Walking back: rows come in ascending order and are flipped
+        page, next_cursor, prev_cursor = search_page(list(reversed(rows)), 3, (6.0, ObjectId()), True)
+        self.assertEqual(page, rows[1:])
+        self.assertEqual(parse_position(next_cursor), ((7.0, rows[3]['_id']), False))
+        self.assertEqual(parse_position(prev_cursor), ((9.0, rows[1]['_id']), True))
+
+    def test_endpoint_rejects_a_missing_query_or_bad_cursor(self):
+        client = APIClient()
+        self.assertEqual(client.get('/notices/search/').status_code, 400)
+        response = client.get('/notices/search/', {'q': 'wallet', 'cursor': 'garbage'})
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'detail': 'Invalid cursor.'})
+
+
+class NoticeCacheTests(NoticeTestCase):
+    def setUp(self):
+        super().setUp()
+        self.notice = make_notice(self.alice)
+        self.list_url = '/notices/'
+        self.detail_url = f'/notices/{self.notice.pk}/'
+
+    def assertCache(self, url, expected):
+        response = APIClient().get(url)
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(response['X-Cache'], expected)
+        return response
+
+    def warm(self):
+        for url in (self.list_url, self.detail_url):
+            self.assertCache(url, 'MISS')
+            self.assertCache(url, 'HIT')
+
+    def test_second_read_is_a_hit_with_the_same_body(self):
+        first = self.assertCache(self.list_url, 'MISS')
+        second = self.assertCache(self.list_url, 'HIT')
+        self.assertEqual(first.json(), second.json())
+
+    def test_create_invalidates(self):
+        self.warm()
+        self.authenticate(self.bob)
+        response = self.client.post('/notices/', {
+            'title': 'Found keys', 'type': 'found', 'date': '2024-01-02', 'venue': 'Gym',
+            'contact': 'desk', 'description': 'Three keys on a ring',
+        }, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        listed = self.assertCache(self.list_url, 'MISS')
+        self.assertEqual(len(listed.json()['results']), 2)
+
+    def test_complete_invalidates(self):
+        self.warm()
+        self.authenticate(self.alice)
+        self.assertEqual(self.client.post(f'/notices/{self.notice.pk}/complete/').status_code, 200)
+        self.assertEqual(self.assertCache(self.detail_url, 'MISS').json()['status'], 'completed')
+
+    def test_profile_update_invalidates(self):
+        self.warm()
+        self.authenticate(self.alice)
+        response = self.client.patch('/auth/profile/', {'nickname': 'Alice'}, format='json')
+        self.assertEqual(response.status_code, 200, response.content)
+        self.assertEqual(self.assertCache(self.detail_url, 'MISS').json()['owner_nickname'], 'Alice')
+
+    def test_respond_invalidates(self):
+        self.warm()
+        self.authenticate(self.bob)
+        response = self.client.post(f'/notices/{self.notice.pk}/respond/', {'message': 'I saw it'}, format='json')
+        self.assertEqual(response.status_code, 201, response.content)
+        detail = self.assertCache(self.detail_url, 'MISS').json()
+        self.assertEqual(detail['responses_count'], 1)
+
+    def test_delete_invalidates(self):
+        self.warm()
+        self.authenticate(self.alice)
+        self.assertEqual(self.client.delete(f'/notices/{self.notice.pk}/delete/').status_code, 200)
+        self.assertEqual(self.assertCache(self.list_url, 'MISS').json()['results'], [])
+        self.assertEqual(APIClient().get(self.detail_url).status_code, 404)
+
+    @override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_locmem_cache_is_refused_with_several_workers(self):
+        with override_settings(WEB_CONCURRENCY=4):
+            with self.assertRaises(ImproperlyConfigured):
+                checks.check_shared_cache()
+            self.assertEqual(checks.check_notice_cache_deploy(None), [])
+        with override_settings(WEB_CONCURRENCY=4, NOTICE_CACHE_ENABLED=False):
+            checks.check_shared_cache()
+        with override_settings(WEB_CONCURRENCY=1):
+            checks.check_shared_cache()
+            self.assertEqual([w.id for w in checks.check_notice_cache_deploy(None)], ['notices.W001'])
+
+    @override_settings(WEB_CONCURRENCY=4, CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}})
+    def test_shared_cache_passes(self):
+        checks.check_shared_cache()
+        self.assertEqual(checks.check_notice_cache_deploy(None), [])
+
+@skipUnless(mongomock_motor, 'needs mongomock-motor')
+class AsyncViewTests(NoticeTestCase):
+    """The async views on the mongomock-motor client match the sync ones"""
+
+    def setUp(self):
+        super().setUp()
+        self.factory = RequestFactory()
+        for i in range(5):
+            make_notice(self.alice if i % 2 else self.bob, START + timedelta(minutes=i // 2), title=f'Notice {i}')
+
+    def run_view(self, view, url, *args, **headers):
+        """Response of an async view and its body, read on the same loop"""
+        async def call():
+            response = await view(self.factory.get(url, **headers), *args)
+            if response.streaming:
+                return response, b''.join([chunk async for chunk in response.streaming_content])
+            return response, response.content
+        return asyncio.run(call())
+
+    def test_list_pages_match(self):
+        url = '/notices/?limit=2'
+        while url:
+            expected = self.client.get(url)
+            response, content = self.run_view(async_views.notice_list_create, url)
+            self.assertEqual(response.status_code, 200, content)
+            self.assertJSONEqual(content, expected.json())
+            url = expected.json()['next']
+
+    def test_detail_matches(self):
+        notice = Notice.objects.first()
+        url = f'/notices/{notice.pk}/'
+        _, content = self.run_view(async_views.notice_detail, url, str(notice.pk))
+        self.assertJSONEqual(content, self.client.get(url).json())
+        missing, _ = self.run_view(async_views.notice_detail, '/notices/x/', '0' * 24)
+        self.assertEqual(missing.status_code, 404)
+
+    def test_image_is_served_from_mock_gridfs(self):
+        file_id = get_image_fs().put(b'0123456789', content_type='image/jpeg')
+        url = f'/notices/image/{file_id}/'
+        response, content = self.run_view(async_views.serve_image, url, str(file_id))
+        self.assertEqual((response.status_code, content), (200, b'0123456789'))
+
+        response, content = self.run_view(async_views.serve_image, url, str(file_id), HTTP_RANGE='bytes=2-4')
+        self.assertEqual((response.status_code, content), (206, b'234'))
+
+    def test_sparse_responses_match(self):
+        notice = Notice.objects.first()
+        Response(notice=notice, responder_id=self.bob.user_id, message='Seen it', created_at=START).save()
+        for query in ('?fields=message,responder_email', '?fields=id', '?fields=nope'):
+            url = f'/notices/{notice.pk}/responses/{query}'
+            expected = self.client.get(url)
+            response, content = self.run_view(async_views.notice_responses, url, str(notice.pk))
+            self.assertEqual(response.status_code, expected.status_code, content)
+            self.assertJSONEqual(content, expected.json())
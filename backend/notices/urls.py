@@ -1,12 +1,24 @@
+from django.conf import settings
 from django.urls import path
 from . import views
 
+# Under ASGI the read/write endpoints can run on the asyncio driver instead
+if settings.ASYNC_VIEWS:
+    from . import async_views as endpoints
+else:
+    endpoints = views
+
 urlpatterns = [
-    path('', views.notice_list_create, name='notice-list-create'),
-    path('my-notices/', views.my_notices, name='my-notices'),
-    path('<str:pk>/', views.notice_detail, name='notice-detail'),
-    path('<str:pk>/respond/', views.respond_to_notice, name='respond-to-notice'),
-    path('<str:pk>/complete/', views.complete_notice, name='complete-notice'),
-    path('<str:pk>/delete/', views.delete_notice, name='delete-notice'),
-    path('image/<str:grid_id>/', views.serve_image, name='serve-image'),
+    path('', endpoints.notice_list_create, name='notice-list-create'),
+    path('my-notices/', endpoints.my_notices, name='my-notices'),
+    path('events/', views.notice_events, name='notice-events'),
+    # Bulk actions stay synchronous: a fixed handful of queries per request
+    path('bulk/', views.bulk_notices, name='notice-bulk'),
+    path('search/', endpoints.notice_search, name='notice-search'),
+    path('<str:pk>/', endpoints.notice_detail, name='notice-detail'),
+    path('<str:pk>/responses/', endpoints.notice_responses, name='notice-responses'),
+    path('<str:pk>/respond/', endpoints.respond_to_notice, name='respond-to-notice'),
+    path('<str:pk>/complete/', endpoints.complete_notice, name='complete-notice'),
+    path('<str:pk>/delete/', endpoints.delete_notice, name='delete-notice'),
+    path('image/<str:grid_id>/', endpoints.serve_image, name='serve-image'),
 ]
@@ -4,55 +4,80 @@ from rest_framework.parsers import MultiPartParser, FormParser, JSONParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
 from rest_framework.response import Response as DRFResponse
 from datetime import datetime, date
-from django.http import HttpResponse, Http404
+import asyncio
+import json
+import logging
+from django.core.handlers.asgi import ASGIRequest
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponse, Http404, StreamingHttpResponse
+from django.conf import settings
 
+from bson import ObjectId
+
+from accounts.authentication import get_request_user
+
+from . import bulk, events
+from .cache import bump_version, cached_response
+from .fields import OWNER_FIELDS, FieldsError, parse_fields, project, wants
+from .filters import FilterError, parse_filters
+from .images import open_image, stream_image
 from .models import Notice, Response
-from .serializers import NoticeListSerializer, NoticeDetailSerializer, ResponseSerializer
+from .pagination import CursorPaginator, InvalidCursor, cursor_link, parse_limit
+from .search import highlights_for, query_terms, search_notices
+from .serializers import (
+    NoticeDetailSerializer, NoticeListSerializer, NoticeRowListSerializer, ResponseSerializer, resolve_users,
+)
+
+logger = logging.getLogger(__name__)
+
+
+def paginated_notice_list(request, queryset, fields=None):
+    """Serialize one cursor page of notices as {'next', 'prev', 'results'}"""
+    paginator = CursorPaginator(request)
+    try:
+        rows = paginator.paginate(project(queryset, fields).as_pymongo())
+    except InvalidCursor as e:
+        return DRFResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    serializer = NoticeRowListSerializer(rows, context={'request': request, 'fields': fields})
+    return DRFResponse(paginator.get_response_data(serializer.data))
+
+
+def filtered_notice_list(request, owner_id=None):
+    try:
+        filters = parse_filters(request.query_params, owner_id=owner_id)
+        fields = parse_fields(request.query_params, NoticeListSerializer)
+    except (FilterError, FieldsError) as e:
+        return DRFResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return paginated_notice_list(request, Notice.objects(**filters), fields)
 
 
 @api_view(['GET', 'POST'])
 @parser_classes([MultiPartParser, FormParser, JSONParser])
 def notice_list_create(request):
     if request.method == 'GET':
-        notices = Notice.objects.all()
-        serializer = NoticeListSerializer(notices, many=True, context={'request': request})
-        return DRFResponse(serializer.data)
+        return cached_response(request, lambda: filtered_notice_list(request))
 
     # POST – must be authenticated
-    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-    if not auth_header.startswith('Bearer '):
-        return DRFResponse({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    
-    token = auth_header[7:]
-    try:
-        from accounts.models import User
-        user = User.objects(auth_token=token).first()
-        if not user:
-            return DRFResponse({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    except Exception:
+    user = get_request_user(request)
+    if user is None:
         return DRFResponse({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
 
     # Handle file upload - check both request.data and request.FILES
-    print(f"DEBUG: request.FILES keys: {list(request.FILES.keys())}")
-    print(f"DEBUG: request.data keys: {list(request.data.keys())}")
     if 'image' in request.FILES:
-        print("DEBUG: Image found in request.FILES")
         # Make a copy of request.data and add the file
         data = request.data.copy()
         data['image'] = request.FILES['image']
-        print(f"DEBUG: Added image to data, image type: {type(data['image'])}")
-    elif 'image' in request.data:
-        print("DEBUG: Image found in request.data")
-        data = request.data
     else:
-        print("DEBUG: No image found")
         data = request.data
-    
+    logger.debug('Creating a notice from fields %s', sorted(data.keys()))
+
     # Add user context to serializer
     request.current_user = user
     serializer = NoticeListSerializer(data=data, context={'request': request})
     if serializer.is_valid():
         notice = serializer.save()
+        bump_version()
+        events.notice_created(notice)
         # Re-serialize to get the correct image URL
         response_serializer = NoticeListSerializer(notice, context={'request': request})
         return DRFResponse(response_serializer.data, status=status.HTTP_201_CREATED)
@@ -61,50 +86,91 @@ def notice_list_create(request):
 
 
 @api_view(['GET'])
-def notice_detail(request, pk):
+def notice_search(request):
+    """Full-text search over title, venue and description, best match first"""
+    query = request.query_params.get('q', '').strip()
+    if not query:
+        return DRFResponse({'detail': 'Query parameter "q" is required.'}, status=status.HTTP_400_BAD_REQUEST)
+
     try:
-        notice = Notice.objects.get(pk=pk)
-    except Notice.DoesNotExist:
-        return DRFResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+        rows, next_cursor, prev_cursor = search_notices(
+            query, parse_limit(request), request.query_params.get('cursor'),
+        )
+    except InvalidCursor as e:
+        return DRFResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    scores = [row.pop('score') for row in rows]
+    results = NoticeRowListSerializer(rows, context={'request': request}).data
+    terms = query_terms(query)
+    for item, row, score in zip(results, rows, scores):
+        item['score'] = score
+        item['highlights'] = highlights_for(row, terms)
+
+    return DRFResponse({
+        'next': cursor_link(request, next_cursor),
+        'prev': cursor_link(request, prev_cursor),
+        'results': results,
+    })
+
+
+@api_view(['GET'])
+def notice_detail(request, pk):
+    def build():
+        try:
+            fields = parse_fields(request.query_params, NoticeDetailSerializer)
+        except FieldsError as e:
+            return DRFResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            notice = project(Notice.objects, fields).get(pk=pk)
+        except Notice.DoesNotExist:
+            return DRFResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
 
-    serializer = NoticeDetailSerializer(notice, context={'request': request})
-    return DRFResponse(serializer.data)
+        # Owner and responders in one users query, as the async view does
+        responses = []
+        if wants(fields, 'responses'):
+            responses = list(Response.objects(notice=notice).limit(settings.NOTICE_DETAIL_RESPONSES))
+        user_ids = [response.responder_id for response in responses]
+        if wants(fields, *OWNER_FIELDS):
+            user_ids.append(notice.owner_id)
+        context = {'request': request, 'fields': fields, 'responses': responses, 'users': resolve_users(user_ids)}
+        return DRFResponse(NoticeDetailSerializer(notice, context=context).data)
+
+    return cached_response(request, build)
+
+
+@api_view(['GET'])
+def notice_responses(request, pk):
+    """Responses to a notice, newest first, one cursor page at a time"""
+    def build():
+        if not ObjectId.is_valid(pk) or not Notice.objects(pk=pk).only('id').first():
+            return DRFResponse({'detail': 'Not found.'}, status=status.HTTP_404_NOT_FOUND)
+
+        paginator = CursorPaginator(request)
+        try:
+            fields = parse_fields(request.query_params, ResponseSerializer)
+            responses = paginator.paginate(project(Response.objects(notice=pk), fields))
+        except (InvalidCursor, FieldsError) as e:
+            return DRFResponse({'detail': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        serializer = ResponseSerializer(responses, many=True, context={'request': request, 'fields': fields})
+        return DRFResponse(paginator.get_response_data(serializer.data))
+
+    return cached_response(request, build)
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])  # Temporarily allow any for testing
 def my_notices(request):
-    # Get user from token (similar to profile view)
-    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-    if auth_header.startswith('Bearer '):
-        token = auth_header[7:]
-        try:
-            from accounts.models import User
-            user = User.objects(auth_token=token).first()
-            if user:
-                notices = Notice.objects.filter(owner_id=user.user_id)
-                serializer = NoticeListSerializer(notices, many=True, context={'request': request})
-                return DRFResponse(serializer.data)
-        except Exception:
-            pass
+    user = get_request_user(request)
+    if user is not None:
+        return filtered_notice_list(request, owner_id=user.user_id)
     
     return DRFResponse({'detail': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
 
 
 @api_view(['POST'])
 def respond_to_notice(request, pk):
-    # Get user from token (similar to other views)
-    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-    if not auth_header.startswith('Bearer '):
-        return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    
-    token = auth_header[7:]
-    try:
-        from accounts.models import User
-        user = User.objects(auth_token=token).first()
-        if not user:
-            return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    except Exception:
+    user = get_request_user(request)
+    if user is None:
         return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
 
     try:
@@ -121,25 +187,18 @@ def respond_to_notice(request, pk):
 
     serializer = ResponseSerializer(data=data)
     if serializer.is_valid():
-        serializer.save(notice=notice, responder_id=user.user_id)
+        response = serializer.save(notice=notice, responder_id=user.user_id)
+        bump_version()
+        responses_count = Notice.objects(pk=notice.pk).scalar('responses_count').first()
+        events.response_created(response, responses_count, serializer.data)
         return DRFResponse(serializer.data, status=status.HTTP_201_CREATED)
     return DRFResponse(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 @api_view(['POST'])
 def complete_notice(request, pk):
-    # Get user from token (similar to other views)
-    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-    if not auth_header.startswith('Bearer '):
-        return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    
-    token = auth_header[7:]
-    try:
-        from accounts.models import User
-        user = User.objects(auth_token=token).first()
-        if not user:
-            return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    except Exception:
+    user = get_request_user(request)
+    if user is None:
         return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
 
     try:
@@ -156,23 +215,15 @@ def complete_notice(request, pk):
     notice.status = 'completed'
     notice.updated_at = datetime.now()
     notice.save()
+    bump_version()
+    events.notice_completed(notice)
     return DRFResponse(NoticeDetailSerializer(notice, context={'request': request}).data)
 
 
 @api_view(['DELETE'])
 def delete_notice(request, pk):
-    # Get user from token (similar to other views)
-    auth_header = request.META.get('HTTP_AUTHORIZATION', '')
-    if not auth_header.startswith('Bearer '):
-        return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    
-    token = auth_header[7:]
-    try:
-        from accounts.models import User
-        user = User.objects(auth_token=token).first()
-        if not user:
-            return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
-    except Exception:
+    user = get_request_user(request)
+    if user is None:
         return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
 
     try:
@@ -183,39 +234,119 @@ def delete_notice(request, pk):
     if notice.owner_id != user.user_id:
         return DRFResponse({'error': 'Only the owner can delete this notice.'}, status=status.HTTP_403_FORBIDDEN)
 
+    notice_id = notice.pk
     notice.delete()
+    bump_version()
+    events.notice_deleted(notice_id)
     return DRFResponse({'message': 'Notice deleted successfully.'}, status=status.HTTP_200_OK)
 
 
+@api_view(['POST'])
+def bulk_notices(request):
+    """
+    Complete, delete or fetch up to bulk.MAX_BULK_IDS notices in one request.
+
+    Body: {"action": "complete" | "delete" | "fetch", "ids": [...]}. Every id
+    gets its own result; fetch needs no authentication.
+    """
+    try:
+        action, ids = bulk.parse_bulk_request(request.data)
+    except bulk.BulkError as e:
+        return DRFResponse({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+    if action == 'fetch':
+        results, notices = bulk.fetch_notices(ids)
+        data = iter(NoticeRowListSerializer(notices, context={'request': request}).data)
+        for result in results:
+            if result['status'] == bulk.OK:
+                result['notice'] = next(data)
+        return DRFResponse({'action': action, 'results': results})
+
+    user = get_request_user(request)
+    if user is None:
+        return DRFResponse({'error': 'Authentication required.'}, status=status.HTTP_401_UNAUTHORIZED)
+
+    if action == 'complete':
+        results, completed = bulk.complete_notices(user, ids)
+        changed = bool(completed)
+        for notice in completed:
+            events.notice_completed(notice)
+    else:
+        results, deleted = bulk.delete_notices(user, ids)
+        changed = bool(deleted)
+        for notice_id in deleted:
+            events.notice_deleted(notice_id)
+    if changed:
+        bump_version()
+    return DRFResponse({'action': action, 'results': results})
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def serve_image(request, grid_id):
     """Serve images stored in GridFS"""
     try:
-        from mongoengine import DoesNotExist
-        from .models import Notice
-        from bson import ObjectId
-        
-        # Convert grid_id to ObjectId
-        try:
-            grid_obj_id = ObjectId(grid_id)
-        except:
-            return HttpResponse('Invalid image ID', status=404)
-        
-        # Find all notices and check their images manually
-        notices = Notice.objects.all()
-        
-        for notice in notices:
-            if notice.image and hasattr(notice.image, 'grid_id'):
-                if str(notice.image.grid_id) == grid_id:
-                    # Get the image data from GridFS
-                    image_data = notice.image.read()
-                    content_type = getattr(notice.image, 'content_type', 'image/jpeg')
-                    
-                    response = HttpResponse(image_data, content_type=content_type)
-                    response['Content-Disposition'] = f'inline; filename="notice_{notice.id}_image.jpg"'
-                    return response
-        
-        return HttpResponse('Image not found', status=404)
+        grid_out = open_image(grid_id)
+        if grid_out is None:
+            return HttpResponse('Image not found', status=404)
+        return stream_image(request, grid_out)
     except Exception as e:
         return HttpResponse(f'Error serving image: {str(e)}', status=500)
+
+
+def format_event(event):
+    data = json.dumps(event.data, cls=DjangoJSONEncoder)
+    return f'id: {event.id}\nevent: {event.type}\ndata: {data}\n\n'
+
+
+async def notice_events(request):
+    """
+    Server-Sent Events stream of notice and response changes.
+
+    Pass ?notice=<id> to receive only one notice's events. Needs the ASGI
+    entry point (lost_found.asgi); under WSGI each stream would hold a
+    worker thread for as long as the browser stays connected.
+    """
+    if request.method != 'GET':
+        return HttpResponse(status=405, headers={'Allow': 'GET'})
+    if not isinstance(request, ASGIRequest):
+        # A WSGI server would buffer the endless stream instead of sending it.
+        # EventSource gives up on a non-200 rather than reconnecting in a loop
+        return HttpResponse('Live updates need the ASGI server (lost_found.asgi).', status=503)
+
+    notice_id = request.GET.get('notice')
+    last_event_id = request.headers.get('Last-Event-ID') or request.GET.get('last_event_id')
+    events.ensure_relay()
+    broker = events.get_broker()
+    subscription, backlog = broker.subscribe(last_event_id)
+
+    async def stream():
+        try:
+            yield f'retry: {settings.NOTICE_EVENTS_RETRY_MS}\n\n'
+            if backlog is None:
+                # Resuming is impossible; the client has to refetch its view
+                yield 'event: reset\ndata: {}\n\n'
+            else:
+                for event in backlog:
+                    if notice_id is None or event.notice_id == notice_id:
+                        yield format_event(event)
+
+            while not subscription.overflowed:
+                try:
+                    event = await asyncio.wait_for(
+                        subscription.queue.get(), timeout=settings.NOTICE_EVENTS_HEARTBEAT,
+                    )
+                except asyncio.TimeoutError:
+                    # Comment line keeps proxies from closing an idle stream
+                    yield ': keep-alive\n\n'
+                    continue
+                if notice_id is None or event.notice_id == notice_id:
+                    yield format_event(event)
+        finally:
+            broker.unsubscribe(subscription)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
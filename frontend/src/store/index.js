@@ -83,7 +83,11 @@ const store = createStore({
       commit('setCurrentUser', user)
       return res.data
     },
-    logout({ commit }) {
+    async logout({ commit }) {
+      try {
+        // Revoke the token server-side; clear local state even if this fails
+        await axios.post('/auth/logout/')
+      } catch (e) {}
       commit('clearAuth')
     }
   }